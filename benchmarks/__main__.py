@@ -0,0 +1,119 @@
+import argparse
+import json
+import platform
+import re
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import pydantic
+
+from benchmarks.runner import Result, run, to_dict
+from benchmarks.suite import benchmarks
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Micro-benchmarks do caminho parse/convert/serialize "
+        "dos eventos do mesos",
+    )
+    parser.add_argument(
+        "--filter",
+        default=None,
+        help="Roda apenas os benchmarks cujo nome casa com essa regex",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="Duração mínima (em segundos) de cada lote medido",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Quantidade de lotes medidos"
+    )
+    parser.add_argument(
+        "--json", default=None, help="Grava os resultados nesse arquivo"
+    )
+    parser.add_argument(
+        "--compare",
+        default=None,
+        help="Arquivo gravado com --json por uma execução anterior; mostra "
+        "a variação de ops/sec em relação a ele",
+    )
+    return parser.parse_args(argv)
+
+
+def metadata() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "pydantic": str(pydantic.VERSION),
+        "machine": platform.machine(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def format_table(
+    results: List[Result], baseline: Optional[Dict[str, float]] = None
+) -> str:
+    header = (
+        f"{'benchmark':<42} {'ops/sec':>12} {'mean (us)':>12} "
+        f"{'blocks/op':>10} {'bytes/op':>12} {'peak (B)':>12}"
+    )
+    if baseline is not None:
+        header += f" {'vs base':>8}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        line = (
+            f"{result.name:<42} {result.ops_per_sec:>12.1f} "
+            f"{result.mean_us:>12.2f} {result.allocated_blocks:>10.1f} "
+            f"{result.allocated_bytes:>12.1f} {result.peak_bytes:>12}"
+        )
+        if baseline is not None:
+            base = baseline.get(result.name)
+            change = (
+                f"{(result.ops_per_sec / base - 1) * 100:+.1f}%"
+                if base
+                else "-"
+            )
+            line += f" {change:>8}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    with open(path) as f:
+        data = json.load(f)
+    return {item["name"]: item["ops_per_sec"] for item in data["results"]}
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    suite = benchmarks()
+    if args.filter:
+        pattern = re.compile(args.filter)
+        suite = [b for b in suite if pattern.search(b.name)]
+
+    results = [
+        run(benchmark, min_time=args.min_time, repeat=args.repeat)
+        for benchmark in suite
+    ]
+    baseline = load_baseline(args.compare) if args.compare else None
+    print(format_table(results, baseline))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "metadata": metadata(),
+                    "results": [to_dict(result) for result in results],
+                },
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,92 @@
+import json
+import os
+from base64 import b64decode, b64encode
+from copy import deepcopy
+from typing import Any, Dict
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "tests",
+    "fixtures",
+)
+
+TASK_ADDED = {
+    "type": "TASK_ADDED",
+    "task_added": {
+        "task": {
+            "agent_id": {
+                "value": "79ad3a13-b567-4273-ac8c-30378d35a439-S14522"
+            },
+            "container": {"type": "DOCKER"},
+            "name": "sleep.sieve",
+            "state": "TASK_STAGING",
+            "task_id": {
+                "value": "sieve_sleep.c73b9af1-1abb-11ea-a2e5-02429217540f"
+            },
+        }
+    },
+}
+
+
+def task_added() -> Dict[str, Any]:
+    return deepcopy(TASK_ADDED)
+
+
+def task_updated() -> Dict[str, Any]:
+    """
+    TASK_UPDATED sem o `data` (docker inspect), como os enviados pelo master.
+    """
+    data = task_updated_with_inspect()
+    del data["task_updated"]["status"]["data"]
+    return data
+
+
+def task_updated_with_inspect() -> Dict[str, Any]:
+    """
+    TASK_UPDATED gravado de um cluster real, com o docker inspect do
+    container em base64 no `data` (~12KB).
+    """
+    with open(
+        os.path.join(FIXTURE_DIR, "mesos_state_running_event_data.json")
+    ) as f:
+        return json.load(f)
+
+
+def task_updated_with_large_inspect(
+    env_vars: int = 500, labels: int = 200, mounts: int = 50
+) -> Dict[str, Any]:
+    """
+    O mesmo TASK_UPDATED, mas com um docker inspect do tamanho dos que vemos
+    em apps com muitas variáveis de ambiente, labels e volumes (por padrão
+    ~200KB de base64).
+    """
+    data = task_updated_with_inspect()
+    status = data["task_updated"]["status"]
+    inspect = json.loads(b64decode(status["data"]))
+    container = inspect[0]
+    config = container["Config"]
+    config["Env"] += [
+        f"APP_SETTING_{i}={'x' * 64}-{i}" for i in range(env_vars)
+    ]
+    config["Labels"].update(
+        {
+            f"com.example.label.{i}": f"value-{'y' * 32}-{i}"
+            for i in range(labels)
+        }
+    )
+    mount = container["Mounts"][1]
+    container["Mounts"] += [
+        {
+            **mount,
+            "Source": f"{mount['Source']}/volume-{i}",
+            "Destination": f"/mnt/volume-{i}",
+        }
+        for i in range(mounts)
+    ]
+    status["data"] = b64encode(json.dumps(inspect).encode()).decode()
+    return data
+
+
+def recordio(event_data: Dict[str, Any]) -> bytes:
+    record = json.dumps(event_data).encode()
+    return str(len(record)).encode() + b"\n" + record
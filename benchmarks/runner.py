@@ -0,0 +1,105 @@
+import gc
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+
+class Benchmark(NamedTuple):
+    """
+    `setup` é chamado uma vez e devolve o argumento passado para cada
+    execução de `func`, então o custo de preparar o payload não entra na
+    medição.
+    """
+
+    name: str
+    setup: Callable[[], Any]
+    func: Callable[[Any], Any]
+
+
+class Result(NamedTuple):
+    name: str
+    ops_per_sec: float
+    mean_us: float
+    allocated_blocks: float
+    allocated_bytes: float
+    peak_bytes: int
+
+
+def run(benchmark: Benchmark, min_time: float = 0.2, repeat: int = 5) -> Result:
+    """
+    Roda `benchmark.func` em lotes de tamanho crescente até um lote levar
+    `min_time` segundos e então mede `repeat` lotes desse tamanho, ficando
+    com o mais rápido (o menos afetado por ruído da máquina).
+
+    A memória é medida separadamente, com o tracemalloc ligado:
+     - allocated_blocks/allocated_bytes: blocos (e bytes) alocados por uma
+       execução que continuam vivos no final dela, ou seja, o custo em
+       memória do resultado;
+     - peak_bytes: pico de memória durante uma execução, contando também os
+       objetos temporários.
+    """
+    arg = benchmark.setup()
+    func = benchmark.func
+
+    number = 1
+    while True:
+        elapsed = _time_batch(func, arg, number)
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = min(
+        [elapsed] + [_time_batch(func, arg, number) for _ in range(repeat - 1)]
+    )
+
+    blocks, size, peak = _measure_memory(func, arg)
+    return Result(
+        name=benchmark.name,
+        ops_per_sec=number / best,
+        mean_us=best / number * 1_000_000,
+        allocated_blocks=blocks,
+        allocated_bytes=size,
+        peak_bytes=peak,
+    )
+
+
+def _time_batch(func: Callable[[Any], Any], arg: Any, number: int) -> float:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started_at = time.perf_counter()
+        for _ in range(number):
+            func(arg)
+        return time.perf_counter() - started_at
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _measure_memory(
+    func: Callable[[Any], Any], arg: Any, number: int = 20
+) -> Tuple[float, float, int]:
+    func(arg)
+    gc.collect()
+    ignore_tracemalloc = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    try:
+        results: List[Any] = [None] * number
+        before = tracemalloc.take_snapshot().filter_traces(ignore_tracemalloc)
+        for i in range(number):
+            results[i] = func(arg)
+        after = tracemalloc.take_snapshot().filter_traces(ignore_tracemalloc)
+        diff = after.compare_to(before, "filename")
+        blocks = sum(stat.count_diff for stat in diff) / number
+        size = sum(stat.size_diff for stat in diff) / number
+        del results
+
+        tracemalloc.clear_traces()
+        func(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return blocks, size, peak
+
+
+def to_dict(result: Result) -> Dict[str, Any]:
+    return dict(result._asdict())
@@ -0,0 +1,123 @@
+import json
+from typing import Any, Dict, List
+
+from benchmarks import payloads
+from benchmarks.runner import Benchmark
+from indexer.mesos.events.recordio import RecordIOFramer
+from indexer.mesos.models.converters.taskadded import (
+    MesosTaskAddedEventConverter,
+)
+from indexer.mesos.models.converters.taskupdated import (
+    MesosTaskUpdatedEventConverter,
+)
+from indexer.mesos.models.event import MesosEvent
+from indexer.mesos.models.taskupdated import MesosTaskUpdatedEvent
+from indexer.models.event import Event
+
+PAYLOADS = {
+    "task_added": payloads.task_added,
+    "task_updated": payloads.task_updated,
+    "task_updated_inspect": payloads.task_updated_with_inspect,
+    "task_updated_large_inspect": payloads.task_updated_with_large_inspect,
+}
+
+
+def _raw(name: str) -> Any:
+    return lambda: json.dumps(PAYLOADS[name]()).encode()
+
+
+def _mesos_event(name: str) -> Any:
+    return lambda: MesosEvent(**PAYLOADS[name]())
+
+
+def _event(name: str) -> Any:
+    return lambda: _convert(MesosEvent(**PAYLOADS[name]()))
+
+
+def _chunk() -> bytes:
+    """
+    Um chunk do stream com 100 records de tamanhos variados.
+    """
+    records = [
+        payloads.recordio(PAYLOADS[name]())
+        for name in ("task_added", "task_updated", "task_updated_inspect")
+    ]
+    return b"".join(records[i % len(records)] for i in range(100))
+
+
+def _frame(chunk: bytes) -> List[bytes]:
+    return RecordIOFramer().feed(chunk)
+
+
+def _convert(mesos_event: MesosEvent) -> Event:
+    if mesos_event.task_added:
+        return MesosTaskAddedEventConverter.to_asgard_model(
+            mesos_event.task_added
+        )
+    return MesosTaskUpdatedEventConverter.to_asgard_model(
+        _fresh_status(mesos_event.task_updated)
+    )
+
+
+def _fresh_status(task_updated: MesosTaskUpdatedEvent) -> MesosTaskUpdatedEvent:
+    """
+    O docker inspect fica memoizado no status depois da primeira
+    decodificação (ver TaskStatusSpec.task_data()). Como o mesmo evento é
+    usado em todas as execuções, cada execução recebe uma cópia do status
+    para medir a decodificação de verdade.
+    """
+    return task_updated.copy(update={"status": task_updated.status.copy()})
+
+
+def _serialize(event: Event) -> str:
+    return json.dumps(event.dict())
+
+
+def _validate(data: Dict[str, Any]) -> Event:
+    return Event(**data)
+
+
+def benchmarks() -> List[Benchmark]:
+    """
+    Um benchmark por estágio do caminho de um evento, para cada payload em
+    que o estágio faz sentido:
+     - frame: separar os records de um chunk do stream (100 records);
+     - parse: json.loads de um record;
+     - validate: MesosEvent(**data);
+     - task_details: decodificar o docker inspect (base64 + json + pydantic);
+     - convert: MesosEvent -> Event;
+     - serialize: Event.dict() + json.dumps (o que vai para o output);
+     - revalidate: Event(**data) (o que é feito ao ler do spool em disco).
+    """
+    suite = [Benchmark("frame[100 records]", _chunk, _frame)]
+    for name in PAYLOADS:
+        suite += [
+            Benchmark(f"parse[{name}]", _raw(name), json.loads),
+            Benchmark(
+                f"validate[{name}]",
+                lambda name=name: PAYLOADS[name](),
+                lambda data: MesosEvent(**data),
+            ),
+        ]
+        if "inspect" in name:
+            suite.append(
+                Benchmark(
+                    f"task_details[{name}]",
+                    lambda name=name: MesosEvent(
+                        **PAYLOADS[name]()
+                    ).task_updated,
+                    lambda task_updated: _fresh_status(
+                        task_updated
+                    ).status.task_details(),
+                )
+            )
+        suite += [
+            Benchmark(f"convert[{name}]", _mesos_event(name), _convert),
+            Benchmark(f"serialize[{name}]", _event(name), _serialize),
+            Benchmark(
+                f"revalidate[{name}]",
+                lambda name=name: _event(name)().dict(),
+                _validate,
+            ),
+        ]
+    return suite
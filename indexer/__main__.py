@@ -2,4 +2,5 @@ import asyncio
 
 from indexer.app import main
 
-asyncio.get_event_loop().run_until_complete(main())
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
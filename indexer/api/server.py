@@ -0,0 +1,105 @@
+from typing import Optional
+
+from aiohttp import web
+
+from indexer.conf import settings
+from indexer.consumer import Consumer
+from indexer.metrics import CONTENT_TYPE, REGISTRY
+from indexer.profiling import Profiler, ProfilerAlreadyRunning
+
+CONSUMER_KEY = "consumer"
+PROFILER_KEY = "profiler"
+
+
+async def metrics(request: web.Request) -> web.Response:
+    consumer: Consumer = request.app[CONSUMER_KEY]
+    body = REGISTRY.render(consumer.metrics())
+    return web.Response(
+        body=body.encode(), headers={"Content-Type": CONTENT_TYPE}
+    )
+
+
+async def live(request: web.Request) -> web.Response:
+    """
+    Se o event loop consegue responder esse request o processo está vivo.
+    """
+    return web.json_response({"alive": True})
+
+
+async def ready(request: web.Request) -> web.Response:
+    """
+    200 se todas as verificações do consumer passaram, 503 se alguma falhou.
+    Em ambos os casos o corpo traz o resultado de cada verificação e o atraso
+    (em segundos) de cada output.
+    """
+    consumer: Consumer = request.app[CONSUMER_KEY]
+    checks = consumer.readiness()
+    is_ready = all(checks.values())
+    return web.json_response(
+        {
+            "ready": is_ready,
+            "checks": checks,
+            "lag-seconds": consumer.output_lag(),
+        },
+        status=200 if is_ready else 503,
+    )
+
+
+async def profile(request: web.Request) -> web.Response:
+    """
+    Começa um profile do event loop (ver indexer.profiling.Profiler) de
+    `?duration=` segundos, no máximo settings.PROFILE_MAX_DURATION.
+    Responde com o arquivo que será gravado.
+    """
+    profiler: Profiler = request.app[PROFILER_KEY]
+    try:
+        duration = float(
+            request.query.get("duration", settings.PROFILE_DURATION)
+        )
+    except ValueError:
+        return web.json_response({"error": "invalid duration"}, status=400)
+    if not 0 < duration <= settings.PROFILE_MAX_DURATION:
+        return web.json_response(
+            {
+                "error": "invalid duration",
+                "max-duration": settings.PROFILE_MAX_DURATION,
+            },
+            status=400,
+        )
+    try:
+        path = profiler.start(duration)
+    except ProfilerAlreadyRunning as e:
+        return web.json_response(
+            {"error": "profile already running", "file": str(e)}, status=409
+        )
+    return web.json_response({"file": path, "duration": duration}, status=202)
+
+
+def create_app(
+    consumer: Consumer, profiler: Optional[Profiler] = None
+) -> web.Application:
+    app = web.Application()
+    app[CONSUMER_KEY] = consumer
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/health/live", live)
+    app.router.add_get("/health/ready", ready)
+    if profiler:
+        app[PROFILER_KEY] = profiler
+        app.router.add_post("/debug/profile", profile)
+    return app
+
+
+async def start_api(
+    consumer: Consumer,
+    host: str,
+    port: int,
+    profiler: Optional[Profiler] = None,
+) -> web.AppRunner:
+    """
+    Sobe o servidor HTTP da API no mesmo event loop do consumer.
+    Quem chamou é responsável por chamar o `cleanup()` do runner devolvido.
+    """
+    runner = web.AppRunner(create_app(consumer, profiler))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -1,10 +1,45 @@
+import asyncio
+import signal
+
+from indexer.api.server import start_api
 from indexer.conf import settings
 from indexer.connection import HTTPConnection
 from indexer.mesos.events.consumer import MesosEventConsumer
+from indexer.mesos.events.replay import ReplayConsumer
+from indexer.profiling import Profiler
 
 
 async def main():
-    consumer = MesosEventConsumer(
-        HTTPConnection(urls=settings.MESOS_MASTER_URLS)
+    if settings.MESOS_REPLAY_FILES:
+        consumer: MesosEventConsumer = ReplayConsumer(
+            settings.MESOS_REPLAY_FILES, speed=settings.MESOS_REPLAY_SPEED
+        )
+    else:
+        consumer = MesosEventConsumer(
+            HTTPConnection(urls=settings.MESOS_MASTER_URLS)
+        )
+    profiler = Profiler(
+        directory=settings.PROFILE_DIR,
+        interval=settings.PROFILE_INTERVAL,
+        lag_interval=settings.PROFILE_LOOP_LAG_INTERVAL,
+        lag_threshold=settings.PROFILE_LOOP_LAG_THRESHOLD,
+    )
+    loop = asyncio.get_event_loop()
+    loop.add_signal_handler(
+        signal.SIGUSR1, profiler.toggle, settings.PROFILE_DURATION
     )
-    await consumer.start()
+    runner = None
+    if settings.API_ENABLED:
+        runner = await start_api(
+            consumer,
+            settings.API_HOST,
+            settings.API_PORT,
+            profiler if settings.PROFILE_API_ENABLED else None,
+        )
+    try:
+        await consumer.start()
+    finally:
+        loop.remove_signal_handler(signal.SIGUSR1)
+        profiler.stop()
+        if runner:
+            await runner.cleanup()
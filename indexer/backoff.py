@@ -0,0 +1,24 @@
+import random
+
+
+class ExponentialBackoff:
+    """
+    Backoff exponencial com "full jitter": o tempo de espera da N-ésima
+    tentativa é um valor aleatório entre 0 e min(cap, base * 2^N).
+    O jitter evita que várias instâncias reconectem todas ao mesmo tempo.
+    """
+
+    MAX_EXPONENT = 32
+
+    def __init__(self, base: float, cap: float) -> None:
+        self.base = base
+        self.cap = cap
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        exponent = min(self.attempts, self.MAX_EXPONENT)
+        self.attempts += 1
+        return random.uniform(0, min(self.cap, self.base * 2 ** exponent))
+
+    def reset(self) -> None:
+        self.attempts = 0
@@ -0,0 +1,379 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from indexer.backoff import ExponentialBackoff
+from indexer.conf import OverflowPolicy, logger, settings
+from indexer.metrics import EVENT_LAG, OUTPUT_WRITE_DURATION
+from indexer.models.event import Event
+from indexer.spool import SegmentSpool, fsync_and_close
+from indexer.writter import OutputWriteError, OutputWritter
+
+
+class OutputChannel:
+    """
+    Entrega eventos para um único OutputWritter através de uma fila própria
+    e limitada, consumida por `concurrency` workers. Assim um output lento
+    não segura os outros.
+
+    O que fazer quando a fila está cheia depende da `overflow`:
+     - block: quem está escrevendo espera ter espaço na fila;
+     - drop_oldest: o lote mais antigo da fila é descartado;
+     - spill: o lote é gravado em disco e volta para o writer assim que a
+       fila esvaziar, junto com os outros lotes gravados (até
+       settings.OUTPUT_SPOOL_READ_BATCH). Os records só saem do disco depois
+       que o writer escreveu e fez flush desses eventos. A ordem não é
+       mantida: lotes gravados em disco são entregues depois dos lotes que
+       chegaram depois deles mas couberam na fila. Quem precisa da ordem
+       deve usar `write_ahead`.
+
+    Com `write_ahead` a fila em memória não é usada: todo lote é gravado
+    primeiro no spool em disco e um único worker lê do spool, na ordem, e só
+    confirma (ack) depois que o writer escreveu e fez flush. Se o writer
+    falhar, os mesmos eventos são reenviados (com backoff) até o output
+    voltar, inclusive depois de um restart do indexer.
+
+    Os contadores (written, failed, dropped, spilled) são acumulados desde a
+    criação do channel e contam eventos, não lotes. Um evento só conta como
+    escrito quando o writer confirma a escrita (ack), o que para writers que
+    acumulam eventos acontece só no flush. Um evento só conta como falha
+    quando é descartado de vez: se o writer lança OutputWriteError, só os
+    `dropped` eventos contam, porque os outros continuam com o writer. Falhas
+    de flushes feitos em background pelo writer também contam.
+
+    `lag` é o atraso (em segundos) entre o `date` do último evento
+    confirmado pelo writer e o momento da confirmação.
+
+    `ack_listener`, se definido, recebe o nome do channel e os eventos
+    confirmados pelo writer a cada confirmação.
+    """
+
+    ack_listener: Optional[Callable[[str, List[Event]], None]] = None
+
+    def __init__(
+        self,
+        name: str,
+        writter: OutputWritter,
+        queue_size: int,
+        concurrency: int,
+        overflow: OverflowPolicy,
+        write_ahead: bool = False,
+    ) -> None:
+        self.name = name
+        self.writter = writter
+        self.concurrency = 1 if write_ahead else concurrency
+        self.overflow = overflow
+        self.write_ahead = write_ahead
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.consecutive_failures = 0
+        self.lag: Optional[float] = None
+        self._write_duration = OUTPUT_WRITE_DURATION.labels(name)
+        self._lag = EVENT_LAG.labels(name)
+        self._progress_at = time.monotonic()
+        writter.ack_callback = self._acked
+        writter.error_callback = self._failed
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._spool: Optional[SegmentSpool] = None
+        if write_ahead or overflow == OverflowPolicy.SPILL:
+            self._spool = SegmentSpool(
+                os.path.join(settings.OUTPUT_SPOOL_DIR, name),
+                segment_size=settings.OUTPUT_SPOOL_SEGMENT_SIZE,
+                max_bytes=settings.OUTPUT_SPOOL_MAX_BYTES,
+                fsync_interval=settings.OUTPUT_SPOOL_FSYNC_INTERVAL,
+                fsync_bytes=settings.OUTPUT_SPOOL_FSYNC_BYTES,
+            )
+        self._workers: List[asyncio.Future] = []
+        self._unspilling = False
+        self._syncing = False
+        self._unfinished = 0
+        self._spooled = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._update_idle()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def spool_size(self) -> int:
+        return len(self._spool) if self._spool else 0
+
+    def healthy(self) -> bool:
+        """
+        O output não está saudável se as últimas escritas falharam ou se há
+        eventos pendentes (no channel ou ainda não confirmados pelo writer)
+        mas nenhum foi confirmado nos últimos settings.OUTPUT_STALL_TIMEOUT
+        segundos.
+        """
+        if (
+            self.consecutive_failures
+            >= settings.OUTPUT_MAX_CONSECUTIVE_FAILURES
+        ):
+            return False
+        if self._idle.is_set() and not self.writter.pending():
+            return True
+        stalled_for = time.monotonic() - self._progress_at
+        return stalled_for < settings.OUTPUT_STALL_TIMEOUT
+
+    async def put(self, events: List[Event]) -> None:
+        self._start()
+        if self.write_ahead:
+            await self._append_to_spool(events)
+            return
+
+        if not self._queue.full() or self.overflow == OverflowPolicy.BLOCK:
+            self._unfinished += 1
+            self._update_idle()
+            try:
+                await self._queue.put(events)
+            except asyncio.CancelledError:
+                self._task_done()
+                raise
+        elif self.overflow == OverflowPolicy.DROP_OLDEST:
+            oldest = self._queue.get_nowait()
+            self.dropped += len(oldest)
+            self._queue.put_nowait(events)
+        else:
+            await self._append_to_spool(events)
+            self.spilled += len(events)
+
+    async def drain(self) -> None:
+        """
+        Espera todos os eventos recebidos até agora (inclusive os gravados
+        em disco) serem entregues ao writer.
+        """
+        if self.spool_size():
+            self._start()
+        await self._idle.wait()
+        await self.writter.flush()
+
+    async def close(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            await logger.error(
+                {
+                    "event": "output-drain-timeout",
+                    "output": self.name,
+                    "queue-size": self.qsize(),
+                    "spool-size": self.spool_size(),
+                }
+            )
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._spool:
+            self._spool.close()
+
+    def _start(self) -> None:
+        if self._workers:
+            return
+        worker = self._write_ahead_worker if self.write_ahead else self._worker
+        self._workers = [
+            asyncio.ensure_future(worker()) for _ in range(self.concurrency)
+        ]
+
+    async def _append_to_spool(self, events: List[Event]) -> None:
+        spool: SegmentSpool = self._spool  # type: ignore
+        dropped_segments = spool.dropped_segments
+        spool.append(
+            json.dumps([event.dict() for event in events]).encode(), sync=False
+        )
+        self._spooled.set()
+        self._update_idle()
+        if spool.sync_due() and not self._syncing:
+            # O fsync pode demorar, então não é feito na thread do loop.
+            self._syncing = True
+            try:
+                await asyncio.get_event_loop().run_in_executor(
+                    None, fsync_and_close, spool.detach_sync()
+                )
+            finally:
+                self._syncing = False
+        if spool.dropped_segments > dropped_segments:
+            await logger.error(
+                {
+                    "event": "output-spool-full",
+                    "output": self.name,
+                    "dropped-segments": spool.dropped_segments,
+                }
+            )
+
+    def _unspill(self) -> Optional[List[Event]]:
+        """
+        Lê (sem remover) o próximo lote gravado em disco, mas só quando a
+        fila em memória está vazia. O spool tem uma única posição de leitura,
+        então só um lote lido dele fica em trânsito por vez.
+        """
+        if not self._spool or self._unspilling or not self._queue.empty():
+            return None
+        records = self._spool.read(settings.OUTPUT_SPOOL_READ_BATCH)
+        if not records:
+            return None
+        self._unspilling = True
+        self._unfinished += 1
+        return [event for record in records for event in self._decode(record)]
+
+    def _decode(self, record: bytes) -> List[Event]:
+        return [Event(**data) for data in json.loads(record)]
+
+    async def _worker(self) -> None:
+        while True:
+            spilled = self._unspill()
+            if spilled is not None:
+                await self._write_spilled(spilled)
+                continue
+
+            events: List[Event] = await self._queue.get()
+            try:
+                with self._write_duration.time():
+                    await self.writter.write(events)
+            except asyncio.CancelledError:
+                raise
+            except OutputWriteError as e:
+                self._failed(e.dropped)
+                await self._log_write_error(e)
+            except Exception as e:
+                self._failed(len(events))
+                await self._log_write_error(e)
+            finally:
+                self._task_done()
+
+    async def _write_spilled(self, events: List[Event]) -> None:
+        """
+        Escreve (e faz flush de) um lote lido do spool e só então remove os
+        records do disco. Se o writer falhar, tentamos de novo com backoff;
+        os eventos não contam como falha porque não foram descartados.
+        """
+        spool: SegmentSpool = self._spool  # type: ignore
+        backoff = ExponentialBackoff(
+            base=settings.RECONNECT_BACKOFF_BASE,
+            cap=settings.RECONNECT_BACKOFF_MAX,
+        )
+        written = False
+        try:
+            while True:
+                try:
+                    with self._write_duration.time():
+                        if not written:
+                            written = True
+                            await self.writter.write(events)
+                        await self.writter.flush()
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except OutputWriteError as e:
+                    # O writer ficou com os eventos que não descartou.
+                    self._failed(e.dropped)
+                    await self._log_write_error(e)
+                except Exception as e:
+                    written = False
+                    self._failed(0)
+                    await self._log_write_error(e)
+                await asyncio.sleep(backoff.next_delay())
+            spool.ack()
+        except asyncio.CancelledError:
+            spool.rewind()
+            raise
+        finally:
+            self._unspilling = False
+            self._task_done()
+
+    async def _write_ahead_worker(self) -> None:
+        spool: SegmentSpool = self._spool  # type: ignore
+        backoff = ExponentialBackoff(
+            base=settings.RECONNECT_BACKOFF_BASE,
+            cap=settings.RECONNECT_BACKOFF_MAX,
+        )
+        events: List[Event] = []
+        written = False
+        while True:
+            if not events:
+                records = spool.read(settings.OUTPUT_SPOOL_READ_BATCH)
+                if not records:
+                    self._spooled.clear()
+                    await self._spooled.wait()
+                    continue
+                events = [
+                    event
+                    for record in records
+                    for event in self._decode(record)
+                ]
+                written = False
+
+            try:
+                with self._write_duration.time():
+                    if not written:
+                        written = True
+                        await self.writter.write(events)
+                    await self.writter.flush()
+            except asyncio.CancelledError:
+                spool.rewind()
+                raise
+            except OutputWriteError as e:
+                # O writer ficou com os eventos que não descartou: basta
+                # tentar o flush de novo, sem ler o lote do spool outra vez.
+                self._failed(e.dropped)
+                await self._log_write_error(e)
+                await asyncio.sleep(backoff.next_delay())
+                continue
+            except Exception as e:
+                # Os eventos vão ser lidos do spool e enviados de novo, então
+                # não contam como falha.
+                spool.rewind()
+                self.writter.discard()
+                self._failed(0)
+                events = []
+                await self._log_write_error(e)
+                await asyncio.sleep(backoff.next_delay())
+                continue
+
+            spool.ack()
+            backoff.reset()
+            events = []
+            self._update_idle()
+
+    def _failed(self, count: int) -> None:
+        self.failed += count
+        self.consecutive_failures += 1
+
+    def _acked(self, events: List[Event]) -> None:
+        self.written += len(events)
+        self.consecutive_failures = 0
+        self._progress_at = time.monotonic()
+        now = time.time()
+        for event in events:
+            try:
+                lag = now - datetime.fromisoformat(event.date).timestamp()
+            except (TypeError, ValueError):
+                continue
+            self._lag.observe(lag)
+            self.lag = lag
+        if self.ack_listener:
+            self.ack_listener(self.name, events)
+
+    async def _log_write_error(self, e: Exception) -> None:
+        await logger.exception(
+            {
+                "event": "output-writter-error",
+                "output": self.name,
+                "exc": str(e),
+            }
+        )
+
+    def _task_done(self) -> None:
+        self._unfinished -= 1
+        self._update_idle()
+
+    def _update_idle(self) -> None:
+        if self._unfinished or self.spool_size():
+            if self._idle.is_set():
+                self._progress_at = time.monotonic()
+            self._idle.clear()
+        else:
+            self._idle.set()
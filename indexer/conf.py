@@ -1,18 +1,110 @@
 import logging
 import os
-from typing import List
+from enum import Enum
+from typing import List, Optional
 
 from aiologger.loggers.json import JsonLogger
 from pydantic import BaseSettings
 
 
+class OverflowPolicy(str, Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    SPILL = "spill"
+
+
+class TaskDetailsExecutor(str, Enum):
+    INLINE = "inline"
+    THREAD = "thread"
+    PROCESS = "process"
+
+
 class Settings(BaseSettings):
 
     MESOS_MASTER_URLS: List[str]
     ES_OUTPUT_URLS: List[str]
     OUTPUT_TO_STDOUT: bool = False
+    STDOUT_OUTPUT_QUEUE_SIZE: int = 1024
+    STDOUT_OUTPUT_CONCURRENCY: int = 1
+    STDOUT_OUTPUT_OVERFLOW: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+    STDOUT_OUTPUT_WRITE_AHEAD: bool = False
+    ES_OUTPUT_QUEUE_SIZE: int = 1024
+    ES_OUTPUT_CONCURRENCY: int = 1
+    ES_OUTPUT_OVERFLOW: OverflowPolicy = OverflowPolicy.BLOCK
+    ES_OUTPUT_WRITE_AHEAD: bool = False
+    OUTPUT_SPOOL_DIR: str = "/tmp/asgard-events-indexer"
+    OUTPUT_SPOOL_SEGMENT_SIZE: int = 64 * 1024 * 1024
+    OUTPUT_SPOOL_MAX_BYTES: int = 1024 * 1024 * 1024
+    OUTPUT_SPOOL_FSYNC_INTERVAL: float = 1.0
+    OUTPUT_SPOOL_FSYNC_BYTES: int = 1024 * 1024
+    OUTPUT_SPOOL_READ_BATCH: int = 500
+    OUTPUT_DRAIN_TIMEOUT: float = 10.0
+    OUTPUT_MAX_CONSECUTIVE_FAILURES: int = 3
+    OUTPUT_STALL_TIMEOUT: float = 60.0
     TASK_FILE_CONTENT_LENGTH: int = 4096
 
+    PIPELINE_WORKERS: int = 8
+    PIPELINE_QUEUE_SIZE: int = 256
+    PIPELINE_ENRICH_DELAY: float = 1.0
+    PIPELINE_DRAIN_TIMEOUT: float = 10.0
+    INGEST_TIMING_ENABLED: bool = False
+    TASK_DETAILS_EXECUTOR: TaskDetailsExecutor = TaskDetailsExecutor.INLINE
+    TASK_DETAILS_WORKERS: int = 2
+
+    RECONNECT_BACKOFF_BASE: float = 0.5
+    RECONNECT_BACKOFF_MAX: float = 30.0
+    RECONNECT_BACKOFF_RESET_AFTER: float = 60.0
+
+    MESOS_HEARTBEAT_INTERVAL: float = 15.0
+    MESOS_MAX_MISSED_HEARTBEATS: int = 2
+
+    MESOS_CAPTURE_DIR: Optional[str] = None
+    MESOS_CAPTURE_MAX_FILE_SIZE: int = 128 * 1024 * 1024
+    MESOS_CAPTURE_MAX_FILES: int = 20
+    MESOS_CAPTURE_COMPRESS: bool = False
+    MESOS_REPLAY_FILES: List[str] = []
+    MESOS_REPLAY_SPEED: float = 0.0
+
+    RECONCILE_CONCURRENCY: int = 4
+    RECONCILE_MAX_TASKS: int = 100_000
+
+    DEDUP_WINDOW: float = 600.0
+    DEDUP_MAX_KEYS: int = 100_000
+
+    ES_BULK_SIZE: int = 500
+    ES_BULK_MAX_BYTES: int = 5 * 1024 * 1024
+    ES_BULK_LINGER: float = 1.0
+    ES_BULK_MAX_RETRIES: int = 5
+    ES_BULK_RETRY_BACKOFF_BASE: float = 0.1
+    ES_BULK_RETRY_BACKOFF_MAX: float = 5.0
+
+    ES_ROLLOVER_ALIAS: Optional[str] = None
+    ES_ROLLOVER_MAX_DOCS: int = 50_000_000
+    ES_ROLLOVER_MAX_SIZE: Optional[str] = "30gb"
+    ES_ROLLOVER_CHECK_INTERVAL: float = 60.0
+
+    ES_TEMPLATE_NAME: str = "asgard-events"
+    ES_INDEX_REFRESH_INTERVAL: str = "30s"
+    ES_INDEX_NUMBER_OF_REPLICAS: int = 1
+
+    AGENT_ADDRESS_CACHE_SIZE: int = 4096
+    AGENT_ADDRESS_CACHE_TTL: float = 300.0
+    AGENT_NOT_FOUND_CACHE_TTL: float = 10.0
+    AGENT_STATE_CACHE_SIZE: int = 512
+    AGENT_STATE_CACHE_TTL: float = 2.0
+
+    API_ENABLED: bool = True
+    API_HOST: str = "0.0.0.0"
+    API_PORT: int = 8080
+
+    PROFILE_DIR: str = "/tmp/asgard-events-indexer/profiles"
+    PROFILE_DURATION: float = 30.0
+    PROFILE_MAX_DURATION: float = 300.0
+    PROFILE_API_ENABLED: bool = False
+    PROFILE_INTERVAL: float = 0.005
+    PROFILE_LOOP_LAG_INTERVAL: float = 0.05
+    PROFILE_LOOP_LAG_THRESHOLD: float = 0.1
+
     class Config:
         env_prefix = os.getenv("ENV", "INDEXER").upper() + "_"
 
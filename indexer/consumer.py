@@ -1,29 +1,92 @@
 import asyncio
 from abc import abstractmethod, ABC
-from typing import List
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
 
 from aiohttp import ClientError
 
-from indexer.conf import settings, logger
+from indexer.backoff import ExponentialBackoff
+from indexer.cache import LRUCache
+from indexer.channel import OutputChannel
+from indexer.conf import OverflowPolicy, settings, logger
 from indexer.connection import HTTPConnection
+from indexer.metrics import (
+    ENRICH_DURATION,
+    ENRICH_ERRORS,
+    WRITE_DURATION,
+    MetricFamily,
+)
 from indexer.models.event import Event
 from indexer.writter import OutputWritter, ElasticSearchOutputWritter
 
 
+class PipelineItem:
+    """
+    Um evento em trânsito pelo pipeline de consumo.
+    O `done` é resolvido pelo worker de enriquecimento e aguardado
+    pelo writer, que assim consegue manter a ordem original do stream.
+    """
+
+    def __init__(self, event: Event, received_at: float) -> None:
+        self.event = event
+        self.received_at = received_at
+        self.done: asyncio.Future = asyncio.get_event_loop().create_future()
+
+
 class Consumer(ABC):
+
+    _work_queue: asyncio.Queue
+    _write_queue: asyncio.Queue
+
     def __init__(self, conn: HTTPConnection) -> None:
         self.conn = conn
         self._run = True
+        self._reconnect_backoff = ExponentialBackoff(
+            base=settings.RECONNECT_BACKOFF_BASE,
+            cap=settings.RECONNECT_BACKOFF_MAX,
+        )
+        self._established_at: Optional[float] = None
         self.output: List[OutputWritter] = []
+        self.channels: List[OutputChannel] = []
+        self._acked_by = LRUCache(maxsize=settings.DEDUP_MAX_KEYS)
+        self._background_tasks: List[asyncio.Future] = []
         if settings.OUTPUT_TO_STDOUT:
-            self.output.append(OutputWritter())
+            self.add_output(
+                "stdout",
+                OutputWritter(),
+                queue_size=settings.STDOUT_OUTPUT_QUEUE_SIZE,
+                concurrency=settings.STDOUT_OUTPUT_CONCURRENCY,
+                overflow=settings.STDOUT_OUTPUT_OVERFLOW,
+                write_ahead=settings.STDOUT_OUTPUT_WRITE_AHEAD,
+            )
         if settings.ES_OUTPUT_URLS:
-            self.output.append(
+            self.add_output(
+                "elasticsearch",
                 ElasticSearchOutputWritter(
                     HTTPConnection(urls=settings.ES_OUTPUT_URLS)
-                )
+                ),
+                queue_size=settings.ES_OUTPUT_QUEUE_SIZE,
+                concurrency=settings.ES_OUTPUT_CONCURRENCY,
+                overflow=settings.ES_OUTPUT_OVERFLOW,
+                write_ahead=settings.ES_OUTPUT_WRITE_AHEAD,
             )
 
+    def add_output(
+        self,
+        name: str,
+        writter: OutputWritter,
+        queue_size: int,
+        concurrency: int,
+        overflow: OverflowPolicy,
+        write_ahead: bool = False,
+    ) -> None:
+        self.output.append(writter)
+        channel = OutputChannel(
+            name, writter, queue_size, concurrency, overflow, write_ahead
+        )
+        channel.ack_listener = self._output_acked
+        self.channels.append(channel)
+
     @abstractmethod
     async def connect(self) -> None:
         """
@@ -41,9 +104,111 @@ class Consumer(ABC):
         """
         raise NotImplementedError
 
+    async def close(self) -> None:
+        """
+        Libera os recursos usados para consumir o stream de eventos.
+        Chamado quando o self.start() termina.
+        """
+        pass
+
     async def write_output(self, events: List[Event]) -> None:
-        for out in self.output:
-            await out.write(events)
+        """
+        Entrega os eventos para a fila de cada output. Cada output consome
+        sua própria fila, então um output lento não atrasa os outros.
+        """
+        for channel in self.channels:
+            await channel.put(events)
+
+    async def drain_output(self) -> None:
+        """
+        Espera todos os outputs escreverem os eventos já recebidos.
+        """
+        for channel in self.channels:
+            await channel.drain()
+
+    def readiness(self) -> Dict[str, bool]:
+        """
+        Verificações que precisam passar para considerarmos que o consumer
+        está de fato indexando eventos. Por padrão apenas a saúde de cada
+        output.
+        """
+        return {
+            f"output-{channel.name}": channel.healthy()
+            for channel in self.channels
+        }
+
+    def output_lag(self) -> Dict[str, Optional[float]]:
+        """
+        Atraso (em segundos) entre o status da task e a confirmação da
+        escrita do último evento em cada output.
+        """
+        return {channel.name: channel.lag for channel in self.channels}
+
+    def metrics(self) -> List[MetricFamily]:
+        """
+        Métricas calculadas a partir do estado atual do consumer (filas,
+        contadores dos outputs). Chamado a cada coleta do /metrics.
+        """
+        pipeline_queues = [
+            ({"queue": name}, float(queue.qsize()))
+            for name, queue in (
+                ("work", getattr(self, "_work_queue", None)),
+                ("write", getattr(self, "_write_queue", None)),
+            )
+            if queue is not None
+        ]
+        return [
+            MetricFamily(
+                "indexer_pipeline_queue_size",
+                "gauge",
+                "Eventos esperando em cada fila do pipeline",
+                pipeline_queues,
+            ),
+            MetricFamily(
+                "indexer_output_queue_size",
+                "gauge",
+                "Lotes de eventos esperando na fila em memória de cada output",
+                [
+                    ({"output": channel.name}, float(channel.qsize()))
+                    for channel in self.channels
+                ],
+            ),
+            MetricFamily(
+                "indexer_output_spool_size",
+                "gauge",
+                "Lotes de eventos esperando no spool em disco de cada output",
+                [
+                    ({"output": channel.name}, float(channel.spool_size()))
+                    for channel in self.channels
+                ],
+            ),
+            MetricFamily(
+                "indexer_output_lag_seconds",
+                "gauge",
+                "Atraso entre o status da task e a escrita do último evento "
+                "confirmado por cada output",
+                [
+                    ({"output": name}, lag)
+                    for name, lag in self.output_lag().items()
+                    if lag is not None
+                ],
+            ),
+            MetricFamily(
+                "indexer_output_events_total",
+                "counter",
+                "Eventos entregues para cada output, por resultado",
+                [
+                    ({"output": channel.name, "result": result}, float(value))
+                    for channel in self.channels
+                    for result, value in (
+                        ("written", channel.written),
+                        ("failed", channel.failed),
+                        ("dropped", channel.dropped),
+                        ("spilled", channel.spilled),
+                    )
+                ],
+            ),
+        ]
 
     def should_run(self) -> bool:
         """
@@ -56,16 +221,233 @@ class Consumer(ABC):
     async def pre_process_event(self, events: List[Event]) -> None:
         pass
 
+    async def post_process_event(self, events: List[Event]) -> None:
+        """
+        Chamado depois que os eventos foram entregues para o output, o que
+        não quer dizer que eles já foram escritos (ver self.events_written()).
+        """
+        pass
+
+    def events_written(self, events: List[Event]) -> None:
+        """
+        Chamado quando todos os outputs confirmaram a escrita dos eventos.
+        Eventos que algum output descartou nunca passam por aqui.
+        """
+        pass
+
+    def _output_acked(self, name: str, events: List[Event]) -> None:
+        if len(self.channels) == 1:
+            self.events_written(events)
+            return
+        written = []
+        for event in events:
+            acked_by = self._acked_by.get(event.id, frozenset()) | {name}
+            self._acked_by.set(event.id, acked_by)
+            if len(acked_by) == len(self.channels):
+                written.append(event)
+        if written:
+            self.events_written(written)
+
+    def enrich_delay(self, event: Event) -> float:
+        """
+        Política de atraso do enriquecimento: quantos segundos, contados
+        a partir da chegada do evento, devemos esperar antes de chamar
+        o self.pre_process_event() para esse evento.
+        """
+        return settings.PIPELINE_ENRICH_DELAY
+
     async def start(self):
-        while self.should_run():
+        """
+        Consome o stream, reconectando sempre que ele termina, com ou sem
+        erro. Toda reconexão espera o backoff (ver self.stream_established()).
+        """
+        try:
+            reconnecting = False
+            while self.should_run():
+                if reconnecting:
+                    self._connection_lost()
+                    await asyncio.sleep(self._reconnect_backoff.next_delay())
+                reconnecting = True
+                try:
+                    await logger.debug({"event": "Connect"})
+                    await self.connect()
+                    await self._run_pipeline()
+                except (ClientError, asyncio.TimeoutError) as e:
+                    await logger.exception(
+                        {"event": "exception-consuming-events", "exc": str(e)}
+                    )
+        finally:
+            await self.close()
+            for channel in self.channels:
+                await channel.close(timeout=settings.OUTPUT_DRAIN_TIMEOUT)
+
+    async def _run_pipeline(self) -> None:
+        """
+        Consome o stream atual em estágios:
+         - reader: lê do self.events() e coloca cada evento nas filas;
+         - N workers (settings.PIPELINE_WORKERS): enriquecem os eventos
+           de forma concorrente;
+         - writer: escreve os eventos no output na mesma ordem em que
+           foram lidos do stream.
+
+        As filas são limitadas (settings.PIPELINE_QUEUE_SIZE). O writer
+        entrega os eventos para a fila de cada output (ver OutputChannel),
+        então um output lento só segura a leitura do stream se a política
+        de overflow dele for `block`.
+        Um erro no enriquecimento de um evento é logado e o evento é escrito
+        sem enriquecimento. Qualquer outra exception encerra o pipeline. Se
+        quem falhou foi a leitura do stream, os eventos que já foram lidos
+        ainda são enriquecidos e escritos (ver self._drain_pipeline()) antes
+        do pipeline ser encerrado.
+        """
+        self._work_queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+        self._write_queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+        workers = [
+            asyncio.ensure_future(self._enrich_worker())
+            for _ in range(settings.PIPELINE_WORKERS)
+        ]
+        reader = asyncio.ensure_future(self._read_stage())
+        writer = asyncio.ensure_future(self._write_stage())
+        stages = [reader, writer]
+        try:
+            await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+            if not writer.done():
+                # Só a leitura pode ter falhado: o writer termina apenas
+                # depois do reader.
+                await self._drain_pipeline(writer)
+                reader.result()
+            await asyncio.gather(*stages)
+        finally:
+            tasks = workers + stages + self._background_tasks
+            self._background_tasks = []
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _drain_pipeline(self, writer: asyncio.Future) -> None:
+        """
+        A leitura do stream falhou: esperamos, por no máximo
+        settings.PIPELINE_DRAIN_TIMEOUT segundos, o writer escrever os
+        eventos que já estavam no pipeline. O que não for escrito nesse
+        tempo é descartado junto com o pipeline.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + settings.PIPELINE_DRAIN_TIMEOUT
+        queued_end = 0
+        try:
+            await asyncio.wait_for(
+                self._write_queue.put(None), settings.PIPELINE_DRAIN_TIMEOUT
+            )
+            queued_end = 1
+        except asyncio.TimeoutError:
+            pass
+        else:
+            await asyncio.wait(
+                [writer], timeout=max(0.0, deadline - loop.time())
+            )
+        if not writer.done():
+            await logger.error(
+                {
+                    "event": "pipeline-drain-timeout",
+                    "pending-events": self._write_queue.qsize() - queued_end,
+                }
+            )
+
+    def spawn(self, coro) -> asyncio.Future:
+        """
+        Roda uma coroutine em background enquanto o pipeline atual estiver
+        rodando. Ela é cancelada quando o pipeline termina.
+        """
+        task = asyncio.ensure_future(coro)
+        self._background_tasks.append(task)
+        task.add_done_callback(self._background_task_done)
+        return task
+
+    def _background_task_done(self, task: asyncio.Future) -> None:
+        if task in self._background_tasks:
+            self._background_tasks.remove(task)
+
+    async def submit(self, event: Event) -> PipelineItem:
+        """
+        Coloca um evento no pipeline. Bloqueia enquanto as filas
+        estiverem cheias.
+        """
+        loop = asyncio.get_event_loop()
+        item = PipelineItem(event, received_at=loop.time())
+        await self._write_queue.put(item)
+        await self._work_queue.put(item)
+        return item
+
+    def stream_established(self) -> None:
+        """
+        Chamado quando o stream atual entregou algo de fato. Por padrão é
+        chamado no primeiro evento de cada conexão.
+
+        O backoff de reconexão só volta para o início se o stream ficar de
+        pé por settings.RECONNECT_BACKOFF_RESET_AFTER segundos a partir daqui:
+        um master que aceita a conexão e a encerra logo em seguida continua
+        vendo o intervalo entre as tentativas aumentar.
+        """
+        if self._established_at is None:
+            self._established_at = asyncio.get_event_loop().time()
+
+    def _connection_lost(self) -> None:
+        established_at, self._established_at = self._established_at, None
+        if established_at is None:
+            return
+        uptime = asyncio.get_event_loop().time() - established_at
+        if uptime >= settings.RECONNECT_BACKOFF_RESET_AFTER:
+            self._reconnect_backoff.reset()
+
+    async def _read_stage(self) -> None:
+        established = False
+        async for event in self.events():
+            if not established:
+                self.stream_established()
+                established = True
+            await self.submit(event)
+        await self._write_queue.put(None)
+
+    async def _enrich_worker(self) -> None:
+        while True:
+            item = await self._work_queue.get()
             try:
-                await logger.debug({"event": "Connect"})
-                await self.connect()
-                async for event in self.events():
-                    await asyncio.sleep(1)
-                    await self.pre_process_event([event])
-                    await self.write_output([event])
-            except (ClientError, asyncio.TimeoutError) as e:
+                await self._wait_enrich_delay(item)
+                with ENRICH_DURATION.time():
+                    await self.pre_process_event([item.event])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Um evento sem enriquecimento ainda é melhor do que derrubar
+                # o stream inteiro por causa de um agent com problema.
+                ENRICH_ERRORS.inc()
                 await logger.exception(
-                    {"event": "exception-consuming-events", "exc": str(e)}
+                    {
+                        "event": "enrich-error",
+                        "event-id": getattr(item.event, "id", None),
+                        "exc": str(e),
+                    }
                 )
+            else:
+                ingest = getattr(item.event, "ingest", None)
+                if ingest:
+                    ingest.enriched_at = datetime.now(timezone.utc).isoformat()
+            item.done.set_result(item.event)
+
+    async def _wait_enrich_delay(self, item: PipelineItem) -> None:
+        loop = asyncio.get_event_loop()
+        wait_time = (
+            item.received_at + self.enrich_delay(item.event) - loop.time()
+        )
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+    async def _write_stage(self) -> None:
+        while True:
+            item = await self._write_queue.get()
+            if item is None:
+                return
+            event = await item.done
+            with WRITE_DURATION.time():
+                await self.write_output([event])
+            await self.post_process_event([event])
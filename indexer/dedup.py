@@ -0,0 +1,74 @@
+import time
+from typing import Callable, Dict, Hashable, Optional, Set
+
+from indexer.cache import LRUCache
+from indexer.models.event import Event
+
+
+class EventDeduplicator:
+    """
+    Lembra dos eventos vistos nos últimos `window` segundos para descartar
+    repetições da mesma transição de estado de uma task. Isso acontece depois
+    de uma reconexão e quando o master e o agent reportam o mesmo status.
+
+    Uma chave só passa a ser lembrada depois que o evento foi indexado (ver
+    self.indexed()). Enquanto o evento está no pipeline a chave fica pendente:
+    cópias que chegam nesse meio tempo já são descartadas, mas se o pipeline
+    for desmontado antes da escrita (self.forget_pending()) o mesmo evento
+    volta a ser aceito, por exemplo quando a reconciliação o reconstrói.
+
+    A memória é limitada por `maxsize`: quando cheio, as chaves mais antigas
+    são esquecidas primeiro.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        maxsize: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._seen = LRUCache(maxsize=maxsize, ttl=window, clock=clock)
+        self._pending: Dict[str, Hashable] = {}
+        self._pending_keys: Set[Hashable] = set()
+        self.duplicates = 0
+
+    def is_duplicate(
+        self, event: Event, key: Optional[Hashable] = None
+    ) -> bool:
+        """
+        `key` substitui a chave padrão (self.key()) para eventos cujo `date`
+        não é o timestamp do status, como os de TASK_ADDED.
+        """
+        if key is None:
+            key = self.key(event)
+        if key in self._pending_keys or self._seen.get(key) is not None:
+            self.duplicates += 1
+            return True
+        self._pending[event.id] = key
+        self._pending_keys.add(key)
+        return False
+
+    def indexed(self, event: Event) -> None:
+        if event.id not in self._pending:
+            return
+        key = self._pending.pop(event.id)
+        self._pending_keys.discard(key)
+        self._seen.set(key, True)
+
+    def forget_pending(self) -> None:
+        """
+        Esquece os eventos aceitos que não chegaram a ser indexados.
+        """
+        self._pending.clear()
+        self._pending_keys.clear()
+
+    @staticmethod
+    def key(event: Event) -> Hashable:
+        """
+        O `date` do evento é o timestamp do status da task, que é o mesmo
+        independente de quem (master, agent ou executor) reportou o status.
+        """
+        return (event.namespace, event.task.id, event.status, event.date)
+
+    def __len__(self) -> int:
+        return len(self._seen)
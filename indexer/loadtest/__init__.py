@@ -0,0 +1,8 @@
+import os
+
+# MESOS_MASTER_URLS e ES_OUTPUT_URLS são obrigatórias no Settings, mas no
+# teste de carga são substituídas pelas URLs dos servidores falsos depois que
+# eles sobem. Os defaults precisam existir antes do indexer.conf ser importado.
+_ENV_PREFIX = os.getenv("ENV", "INDEXER").upper() + "_"
+for _name in ("MESOS_MASTER_URLS", "ES_OUTPUT_URLS"):
+    os.environ.setdefault(_ENV_PREFIX + _name, '["http://127.0.0.1"]')
@@ -0,0 +1,109 @@
+"""
+Teste de carga do indexer contra um mesos e um ElasticSearch falsos
+(ver indexer.loadtest.cluster). As configurações do próprio indexer
+(PIPELINE_WORKERS, ES_BULK_SIZE etc.) vêm das variáveis de ambiente, como
+em produção; apenas as URLs do mesos e do ElasticSearch são substituídas.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import List, Union
+
+from indexer.loadtest.cluster import FakeCluster, FakeClusterConfig
+from indexer.loadtest.harness import (
+    FakeClusterProcess,
+    format_report,
+    run_load_test,
+)
+
+DEFAULTS = FakeClusterConfig()
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m indexer.loadtest",
+        description="Roda o indexer contra um mesos e um ElasticSearch falsos "
+        "e mede eventos/s, latência de ponta a ponta e memória",
+    )
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=5.0,
+        help="Segundos iniciais que não entram nas taxas e percentis",
+    )
+    parser.add_argument("--event-rate", type=float, default=DEFAULTS.event_rate)
+    parser.add_argument("--agents", type=int, default=DEFAULTS.agents)
+    parser.add_argument(
+        "--agent-latency", type=float, default=DEFAULTS.agent_latency
+    )
+    parser.add_argument("--slow-agents", type=int, default=DEFAULTS.slow_agents)
+    parser.add_argument(
+        "--slow-agent-latency", type=float, default=DEFAULTS.slow_agent_latency
+    )
+    parser.add_argument(
+        "--sandbox-size", type=int, default=DEFAULTS.sandbox_size
+    )
+    parser.add_argument(
+        "--inspect-env-vars", type=int, default=DEFAULTS.inspect_env_vars
+    )
+    parser.add_argument(
+        "--agent-error-rate", type=float, default=DEFAULTS.agent_error_rate
+    )
+    parser.add_argument("--es-latency", type=float, default=DEFAULTS.es_latency)
+    parser.add_argument(
+        "--es-error-rate", type=float, default=DEFAULTS.es_error_rate
+    )
+    parser.add_argument(
+        "--drop-stream-interval",
+        type=float,
+        default=DEFAULTS.drop_stream_interval,
+    )
+    parser.add_argument(
+        "--heartbeat-interval", type=float, default=DEFAULTS.heartbeat_interval
+    )
+    parser.add_argument(
+        "--no-agents-in-snapshot",
+        dest="agents_in_snapshot",
+        action="store_false",
+        help="Não envia os agents no SUBSCRIBED, forçando o uso do /slaves",
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Roda os servidores falsos no mesmo processo do indexer",
+    )
+    parser.add_argument("--json", default=None, help="Grava o resultado")
+    return parser.parse_args(argv)
+
+
+async def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    config = FakeClusterConfig(
+        **{field: getattr(args, field) for field in FakeClusterConfig._fields}
+    )
+    cluster: Union[FakeCluster, FakeClusterProcess]
+    if args.in_process:
+        cluster = FakeCluster(config)
+    else:
+        cluster = FakeClusterProcess(config)
+    await cluster.start()
+    try:
+        report = await run_load_test(cluster, args.duration, args.warmup)
+    finally:
+        await cluster.close()
+
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"config": config._asdict(), "report": report._asdict()},
+                f,
+                indent=2,
+            )
+    return 1 if report.error else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.get_event_loop().run_until_complete(main(sys.argv[1:])))
@@ -0,0 +1,438 @@
+import asyncio
+import json
+import random
+import time
+from array import array
+from base64 import b64encode
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from aiohttp import web
+
+NAMESPACE = "loadtest"
+FRAMEWORK_ID = "loadtest-framework-0000"
+COMPLETED_EXECUTORS_PER_AGENT = 500
+
+EventKey = Tuple[str, str, str]
+
+
+class FakeClusterConfig(NamedTuple):
+    """
+    Comportamento do cluster falso:
+     - event_rate: eventos de task por segundo enviados no stream do master;
+     - agents: quantidade de agents, cada um em uma porta;
+     - agent_latency: atraso (em segundos) de cada resposta dos agents;
+     - slow_agents/slow_agent_latency: os primeiros `slow_agents` agents
+       respondem com `slow_agent_latency` segundos de atraso;
+     - sandbox_size: tamanho (em bytes) do stdout/stderr de cada task;
+     - inspect_env_vars: variáveis de ambiente no docker inspect enviado em
+       cada TASK_UPDATED (controla o tamanho do base64);
+     - agent_error_rate/es_error_rate: fração dos requests para os agents e
+       dos `_bulk` que respondem 503;
+     - es_latency: atraso (em segundos) de cada `_bulk`;
+     - drop_stream_interval: o master derruba a conexão do stream depois
+       desse tempo (em segundos), forçando uma reconexão;
+     - agents_in_snapshot: se os agents vêm no SUBSCRIBED. Se não vierem o
+       indexer precisa descobrir o endereço de cada um pelo /slaves.
+    """
+
+    event_rate: float = 100.0
+    agents: int = 10
+    agent_latency: float = 0.0
+    slow_agents: int = 0
+    slow_agent_latency: float = 1.0
+    sandbox_size: int = 64 * 1024
+    inspect_env_vars: int = 50
+    agent_error_rate: float = 0.0
+    es_latency: float = 0.0
+    es_error_rate: float = 0.0
+    drop_stream_interval: Optional[float] = None
+    heartbeat_interval: float = 15.0
+    agents_in_snapshot: bool = True
+
+
+def docker_inspect(env_vars: int) -> str:
+    """
+    Docker inspect (em base64, como vem no `data` do TASK_UPDATED) com os
+    campos usados pelo indexer e `env_vars` variáveis de ambiente.
+    """
+    inspect = [
+        {
+            "Id": "0" * 64,
+            "Name": f"/mesos-{NAMESPACE}",
+            "Config": {
+                "Hostname": NAMESPACE,
+                "Image": f"{NAMESPACE}/app:latest",
+                "Env": [f"SETTING_{i}={'x' * 64}" for i in range(env_vars)],
+                "Labels": {
+                    "hollowman.appname": f"/{NAMESPACE}/app",
+                    "MESOS_TASK_ID": f"{NAMESPACE}_app",
+                },
+            },
+            "State": {"Running": True, "Pid": 4242, "ExitCode": 0, "Error": ""},
+            "HostConfig": {
+                "CpuShares": 512,
+                "CpuQuota": 50000,
+                "MemorySwap": 268_435_456,
+                "MemorySwappiness": None,
+            },
+            "Mounts": [
+                {
+                    "Type": "bind",
+                    "Source": "/tmp/mesos/slaves/sandbox",
+                    "Destination": "/mnt/mesos/sandbox",
+                    "Mode": "",
+                    "RW": True,
+                }
+            ],
+        }
+    ]
+    return b64encode(json.dumps(inspect).encode()).decode()
+
+
+def recordio(data: Dict[str, Any]) -> bytes:
+    record = json.dumps(data).encode()
+    return str(len(record)).encode() + b"\n" + record
+
+
+class FakeAgent:
+    def __init__(self, index: int, latency: float) -> None:
+        self.id = f"loadtest-agent-S{index}"
+        self.latency = latency
+        self.port = 0
+        self.executors: Deque[Tuple[str, str]] = deque(
+            maxlen=COMPLETED_EXECUTORS_PER_AGENT
+        )
+
+    def launch(self, task_id: str) -> None:
+        directory = (
+            f"/tmp/mesos/slaves/{self.id}/frameworks/{FRAMEWORK_ID}"
+            f"/executors/{task_id}/runs/latest"
+        )
+        self.executors.append((task_id, directory))
+
+
+class FakeCluster:
+    """
+    Mesos master, agents e ElasticSearch falsos, cada um em uma porta em
+    127.0.0.1, para rodar o MesosEventConsumer sem um cluster de verdade.
+
+    O master gera tasks que passam por TASK_ADDED (TASK_STAGING),
+    TASK_UPDATED (TASK_RUNNING, com o docker inspect) e TASK_UPDATED
+    (TASK_FINISHED), cada uma em um agent. O ElasticSearch falso usa o
+    horário em que o master enviou cada evento para medir o atraso de ponta
+    a ponta de cada documento recebido.
+    """
+
+    def __init__(self, config: FakeClusterConfig) -> None:
+        self.config = config
+        self.agents = [
+            FakeAgent(
+                i,
+                config.slow_agent_latency
+                if i < config.slow_agents
+                else config.agent_latency,
+            )
+            for i in range(config.agents)
+        ]
+        self.requests: Dict[str, int] = Counter()
+        self.events_emitted = 0
+        self.duplicates = 0
+        self._emitted: Dict[EventKey, float] = {}
+        self._indexed_at: "array[float]" = array("d")
+        self._latencies: "array[float]" = array("d")
+        self._sequence = 0
+        self._inspect = docker_inspect(config.inspect_env_vars)
+        self._random = random.Random(0)
+        self._runners: List[web.AppRunner] = []
+        self.master_url = ""
+        self.es_url = ""
+
+    async def start(self) -> None:
+        self.master_url = await self._serve(self._master_app(), "master")
+        self.es_url = await self._serve(self._es_app(), "elasticsearch")
+        for agent in self.agents:
+            url = await self._serve(self._agent_app(agent), "agent")
+            agent.port = int(url.rsplit(":", 1)[1])
+
+    async def close(self) -> None:
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners = []
+
+    async def stats(
+        self, since: float = 0.0, until: float = float("inf")
+    ) -> Dict:
+        """
+        Contadores do cluster. O `indexed`/`latencies` consideram apenas os
+        documentos recebidos pelo ElasticSearch entre `since` e `until`
+        (time.time()).
+        """
+        latencies = [
+            latency
+            for indexed_at, latency in zip(self._indexed_at, self._latencies)
+            if since <= indexed_at <= until
+        ]
+        return {
+            "events-emitted": self.events_emitted,
+            "events-indexed": len(self._latencies),
+            "duplicates": self.duplicates,
+            "indexed": len(latencies),
+            "latencies": latencies,
+            "requests": dict(self.requests),
+        }
+
+    async def _serve(self, app: web.Application, name: str) -> str:
+        app.middlewares.insert(0, self._count_requests(name))
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        self._runners.append(runner)
+        host, port = runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    def _count_requests(self, name: str):
+        @web.middleware
+        async def middleware(request: web.Request, handler) -> web.Response:
+            status: Any = 500
+            try:
+                response = await handler(request)
+                status = response.status
+                return response
+            except web.HTTPException as e:
+                status = e.status
+                raise
+            except asyncio.CancelledError:
+                # O cliente fechou a conexão no meio da resposta (ex: o
+                # stream do master quando o indexer para).
+                status = "closed"
+                raise
+            finally:
+                self.requests[
+                    f"{name} {request.method} {request.path} {status}"
+                ] += 1
+
+        return middleware
+
+    def _unavailable(self, error_rate: float) -> bool:
+        return error_rate > 0 and self._random.random() < error_rate
+
+    def _master_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/redirect", self._redirect)
+        app.router.add_post("/api/v1", self._subscribe)
+        app.router.add_get("/slaves", self._slaves)
+        return app
+
+    async def _redirect(self, request: web.Request) -> web.Response:
+        return web.Response(
+            status=307, headers={"Location": f"//{request.host}"}
+        )
+
+    async def _slaves(self, request: web.Request) -> web.Response:
+        agent_id = request.query.get("slave_id")
+        return web.json_response(
+            {
+                "slaves": [
+                    {
+                        "id": agent.id,
+                        "hostname": "127.0.0.1",
+                        "port": agent.port,
+                    }
+                    for agent in self.agents
+                    if agent.id == agent_id
+                ]
+            }
+        )
+
+    async def _subscribe(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(
+            headers={"Content-Type": "application/recordio"}
+        )
+        await response.prepare(request)
+        await response.write(recordio(self._subscribed()))
+
+        loop = asyncio.get_event_loop()
+        started_at = last_heartbeat = loop.time()
+        sent = 0
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                now = loop.time()
+                if (
+                    self.config.drop_stream_interval is not None
+                    and now - started_at >= self.config.drop_stream_interval
+                ):
+                    request.transport.close()
+                    return response
+                due = int((now - started_at) * self.config.event_rate) - sent
+                records = [recordio(self._next_event()) for _ in range(due)]
+                sent += due
+                if now - last_heartbeat >= self.config.heartbeat_interval:
+                    records.append(recordio({"type": "HEARTBEAT"}))
+                    last_heartbeat = now
+                if records:
+                    await response.write(b"".join(records))
+        except ConnectionResetError:
+            return response
+
+    def _subscribed(self) -> Dict[str, Any]:
+        agents: List[Dict[str, Any]] = []
+        if self.config.agents_in_snapshot:
+            agents = [
+                {
+                    "agent_info": {
+                        "id": {"value": agent.id},
+                        "hostname": "127.0.0.1",
+                        "port": agent.port,
+                    }
+                }
+                for agent in self.agents
+            ]
+        return {
+            "type": "SUBSCRIBED",
+            "subscribed": {
+                "get_state": {"get_agents": {"agents": agents}},
+                "heartbeat_interval_seconds": self.config.heartbeat_interval,
+            },
+        }
+
+    def _next_event(self) -> Dict[str, Any]:
+        task_index, phase = divmod(self._sequence, 3)
+        self._sequence += 1
+        agent = self.agents[task_index % len(self.agents)]
+        task_name = f"app-{task_index % 50}.{task_index:012d}"
+        task_id = f"{NAMESPACE}_{task_name}"
+        now = time.time()
+        self.events_emitted += 1
+
+        if phase == 0:
+            agent.launch(task_id)
+            self._emitted[(NAMESPACE, task_name, "TASK_STAGING")] = now
+            return {
+                "type": "TASK_ADDED",
+                "task_added": {
+                    "task": {
+                        "agent_id": {"value": agent.id},
+                        "container": {"type": "DOCKER"},
+                        "name": task_name,
+                        "state": "TASK_STAGING",
+                        "task_id": {"value": task_id},
+                    }
+                },
+            }
+
+        state = "TASK_RUNNING" if phase == 1 else "TASK_FINISHED"
+        self._emitted[(NAMESPACE, task_name, state)] = now
+        status: Dict[str, Any] = {
+            "executor_id": {"value": task_id},
+            "agent_id": {"value": agent.id},
+            "source": "SOURCE_EXECUTOR",
+            "state": state,
+            "task_id": {"value": task_id},
+            "timestamp": now,
+        }
+        if phase == 1:
+            status["data"] = self._inspect
+        return {
+            "type": "TASK_UPDATED",
+            "task_updated": {
+                "framework_id": {"value": FRAMEWORK_ID},
+                "state": state,
+                "status": status,
+            },
+        }
+
+    def _agent_app(self, agent: FakeAgent) -> web.Application:
+        @web.middleware
+        async def faults(request: web.Request, handler) -> web.Response:
+            if agent.latency:
+                await asyncio.sleep(agent.latency)
+            if self._unavailable(self.config.agent_error_rate):
+                return web.Response(status=503, text="Service Unavailable")
+            return await handler(request)
+
+        async def state(request: web.Request) -> web.Response:
+            executors = [
+                {"id": task_id, "directory": directory}
+                for task_id, directory in agent.executors
+            ]
+            return web.json_response(
+                {
+                    "frameworks": [{"completed_executors": executors}],
+                    "completed_frameworks": [],
+                }
+            )
+
+        async def browse(request: web.Request) -> web.Response:
+            path = request.query["path"]
+            return web.json_response(
+                [
+                    {"path": f"{path}/{name}", "size": self.config.sandbox_size}
+                    for name in ("stdout", "stderr")
+                ]
+            )
+
+        async def read(request: web.Request) -> web.Response:
+            offset = int(request.query.get("offset", 0))
+            length = int(request.query.get("length", self.config.sandbox_size))
+            size = max(0, min(length, self.config.sandbox_size - offset))
+            return web.json_response({"data": "x" * size, "offset": offset})
+
+        app = web.Application(middlewares=[faults])
+        app.router.add_get("/state", state)
+        app.router.add_get("/files/browse", browse)
+        app.router.add_get("/files/read", read)
+        return app
+
+    def _es_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self._info)
+        app.router.add_post("/_bulk", self._bulk)
+        app.router.add_get("/_template/{name}", self._get_template)
+        app.router.add_put("/_template/{name}", self._acknowledge)
+        app.router.add_route("HEAD", "/_alias/{name}", self._acknowledge)
+        app.router.add_put("/{index}", self._acknowledge)
+        return app
+
+    async def _info(self, request: web.Request) -> web.Response:
+        return web.json_response({"version": {"number": "6.8.0"}})
+
+    async def _get_template(self, request: web.Request) -> web.Response:
+        return web.json_response({}, status=404)
+
+    async def _acknowledge(self, request: web.Request) -> web.Response:
+        return web.json_response({"acknowledged": True})
+
+    async def _bulk(self, request: web.Request) -> web.Response:
+        if self.config.es_latency:
+            await asyncio.sleep(self.config.es_latency)
+        if self._unavailable(self.config.es_error_rate):
+            return web.Response(status=503, text="Service Unavailable")
+
+        lines = (await request.read()).splitlines()
+        now = time.time()
+        items = []
+        for action_line, doc_line in zip(lines[::2], lines[1::2]):
+            action = json.loads(action_line)["index"]
+            doc = json.loads(doc_line)
+            emitted_at = self._emitted.pop(
+                (doc["namespace"], doc["task"]["id"], doc["status"]), None
+            )
+            if emitted_at is None:
+                self.duplicates += 1
+            else:
+                self._indexed_at.append(now)
+                self._latencies.append(now - emitted_at)
+            items.append(
+                {
+                    "index": {
+                        "_index": action["_index"],
+                        "_type": action["_type"],
+                        "_id": action["_id"],
+                        "status": 201,
+                        "result": "created",
+                    }
+                }
+            )
+        return web.json_response({"took": 1, "errors": False, "items": items})
@@ -0,0 +1,225 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import resource
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Union
+
+from indexer.conf import settings
+from indexer.connection import HTTPConnection
+from indexer.loadtest.cluster import FakeCluster, FakeClusterConfig
+from indexer.mesos.events.consumer import MesosEventConsumer
+
+
+class LoadTestReport(NamedTuple):
+    """
+    Resultado de uma execução. As taxas e os percentis consideram apenas o
+    período depois do warmup; os totais consideram a execução inteira.
+    """
+
+    duration: float
+    events_emitted: int
+    events_indexed: int
+    duplicates: int
+    events_per_sec: float
+    latency_p50: Optional[float]
+    latency_p99: Optional[float]
+    latency_max: Optional[float]
+    requests: Dict[str, int]
+    outputs: Dict[str, Dict[str, int]]
+    rss_bytes: Optional[int]
+    max_rss_bytes: int
+    error: Optional[str]
+
+
+class FakeClusterProcess:
+    """
+    Roda o FakeCluster em outro processo, para que o custo (CPU e memória)
+    dos servidores falsos não seja contado como custo do indexer.
+    A comunicação é feita por um Pipe: o processo filho devolve as URLs do
+    master e do ElasticSearch e depois responde a `stats` e `stop`.
+    """
+
+    def __init__(self, config: FakeClusterConfig) -> None:
+        self.config = config
+        self.master_url = ""
+        self.es_url = ""
+        self._process: Optional[multiprocessing.Process] = None
+
+    async def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe(duplex=True)
+        self._process = context.Process(
+            target=_serve_cluster,
+            args=(self.config, child_conn),
+            name="indexer-loadtest-cluster",
+            daemon=True,
+        )
+        self._process.start()
+        self.master_url, self.es_url = await self._recv()
+
+    async def stats(
+        self, since: float = 0.0, until: float = float("inf")
+    ) -> Dict:
+        self._conn.send(("stats", since, until))
+        return await self._recv()
+
+    async def close(self) -> None:
+        if not self._process:
+            return
+        self._conn.send(("stop",))
+        await asyncio.get_event_loop().run_in_executor(
+            None, self._process.join, 5
+        )
+        self._process = None
+
+    async def _recv(self) -> Any:
+        return await asyncio.get_event_loop().run_in_executor(
+            None, self._conn.recv
+        )
+
+
+def _serve_cluster(config: FakeClusterConfig, conn) -> None:
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    cluster = FakeCluster(config)
+    loop.run_until_complete(cluster.start())
+    conn.send((cluster.master_url, cluster.es_url))
+    while True:
+        command = loop.run_until_complete(loop.run_in_executor(None, conn.recv))
+        if command[0] == "stop":
+            break
+        conn.send(loop.run_until_complete(cluster.stats(*command[1:])))
+    loop.run_until_complete(cluster.close())
+    loop.close()
+
+
+@contextmanager
+def override_settings(**values: Any) -> Iterator[None]:
+    """
+    Troca temporariamente valores do `settings` global, que é o mesmo
+    objeto usado por todos os módulos do indexer.
+    """
+    previous = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(settings, name, value)
+
+
+async def run_load_test(
+    cluster: Union[FakeCluster, FakeClusterProcess],
+    duration: float,
+    warmup: float = 0.0,
+    settings_overrides: Optional[Dict[str, Any]] = None,
+) -> LoadTestReport:
+    """
+    Roda o MesosEventConsumer de verdade contra o `cluster` (já iniciado)
+    por `duration` segundos, com o ElasticSearch falso como único output.
+    """
+    overrides = {
+        "ES_OUTPUT_URLS": [cluster.es_url],
+        "OUTPUT_TO_STDOUT": False,
+        "API_ENABLED": False,
+        **(settings_overrides or {}),
+    }
+    with override_settings(**overrides):
+        consumer = MesosEventConsumer(HTTPConnection(urls=[cluster.master_url]))
+        started_at = time.time()
+        run = asyncio.ensure_future(consumer.start())
+        await asyncio.wait([run], timeout=duration)
+        until = time.time()
+        error = None
+        if run.done():
+            exc = run.exception()
+            error = repr(exc) if exc else None
+        else:
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+        for writter in consumer.output:
+            client = getattr(writter, "client", None)
+            if client:
+                await client.close()
+
+    since = started_at + warmup
+    stats = await cluster.stats(since, until)
+    latencies: List[float] = sorted(stats["latencies"])
+    return LoadTestReport(
+        duration=until - started_at,
+        events_emitted=stats["events-emitted"],
+        events_indexed=stats["events-indexed"],
+        duplicates=stats["duplicates"],
+        events_per_sec=stats["indexed"] / max(until - since, 1e-9),
+        latency_p50=percentile(latencies, 50),
+        latency_p99=percentile(latencies, 99),
+        latency_max=latencies[-1] if latencies else None,
+        requests=stats["requests"],
+        outputs={
+            channel.name: {
+                "written": channel.written,
+                "failed": channel.failed,
+                "dropped": channel.dropped,
+                "spilled": channel.spilled,
+            }
+            for channel in consumer.channels
+        },
+        rss_bytes=current_rss(),
+        max_rss_bytes=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        error=error,
+    )
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    Percentil (nearest-rank) de uma lista já ordenada.
+    """
+    if not values:
+        return None
+    index = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def current_rss() -> Optional[int]:
+    """
+    RSS atual do processo. Só disponível no Linux (/proc).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def format_report(report: LoadTestReport) -> str:
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:.1f}ms"
+
+    def mb(value: Optional[int]) -> str:
+        return "-" if value is None else f"{value / 1024 / 1024:.1f}MB"
+
+    lines = [
+        f"duration:         {report.duration:.1f}s",
+        f"events emitted:   {report.events_emitted}",
+        f"events indexed:   {report.events_indexed} "
+        f"({report.duplicates} duplicated)",
+        f"events/sec:       {report.events_per_sec:.1f}",
+        f"latency:          p50={ms(report.latency_p50)} "
+        f"p99={ms(report.latency_p99)} max={ms(report.latency_max)}",
+        f"rss:              {mb(report.rss_bytes)} "
+        f"(max {mb(report.max_rss_bytes)})",
+    ]
+    if report.error:
+        lines.append(f"error:            {report.error}")
+    lines.append("outputs:")
+    for name, counters in report.outputs.items():
+        rendered = " ".join(f"{k}={v}" for k, v in counters.items())
+        lines.append(f"  {name}: {rendered}")
+    lines.append("requests:")
+    for endpoint, count in sorted(report.requests.items()):
+        lines.append(f"  {endpoint}: {count}")
+    return "\n".join(lines)
@@ -0,0 +1,37 @@
+from typing import Dict, List, Optional
+
+from indexer.mesos.models.spec import AgentIdSpec, AgentSpec
+
+
+class AgentRegistry:
+    """
+    Diretório em memória com o endereço de todos os agents do cluster.
+
+    É montado a partir do snapshot que vem no evento SUBSCRIBED e mantido
+    atualizado com os eventos AGENT_ADDED e AGENT_REMOVED, o que nos permite
+    resolver o endereço de um agent sem chamar o endpoint /slaves do master.
+    """
+
+    def __init__(self) -> None:
+        self._addresses: Dict[str, str] = {}
+
+    def load(self, agents: List[AgentSpec]) -> None:
+        """
+        Substitui todo o conteúdo do diretório pelos agents recebidos.
+        """
+        self._addresses = {
+            agent.agent_info.id.value: agent.agent_info.address()
+            for agent in agents
+        }
+
+    def add(self, agent: AgentSpec) -> None:
+        self._addresses[agent.agent_info.id.value] = agent.agent_info.address()
+
+    def remove(self, agent_id: AgentIdSpec) -> None:
+        self._addresses.pop(agent_id.value, None)
+
+    def get_address(self, agent_id: AgentIdSpec) -> Optional[str]:
+        return self._addresses.get(agent_id.value)
+
+    def __len__(self) -> int:
+        return len(self._addresses)
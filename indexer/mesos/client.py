@@ -1,8 +1,11 @@
+import asyncio
+import time
 from typing import Dict, Any, List, Optional
 
 from aiohttp.client import ClientSession, ClientError
 from pydantic import BaseModel
 
+from indexer.cache import LRUCache
 from indexer.conf import settings, logger
 from indexer.connection import HTTPConnection
 from indexer.mesos.models.spec import AgentIdSpec, TaskIdSpec
@@ -40,6 +43,25 @@ class StateAPIEndPointResponse(BaseModel):
     completed_frameworks: List[FrameworksInfoSpec]
 
 
+class AgentStateSnapshot:
+    """
+    Índice do /state de um agent: id do executor -> pasta onde estão
+    os arquivos (stdout/stderr) desse executor.
+    `fetched_at` é quando (timestamp unix) o request do /state começou.
+    """
+
+    def __init__(
+        self, state: StateAPIEndPointResponse, fetched_at: float
+    ) -> None:
+        self.fetched_at = fetched_at
+        self.directories: Dict[str, str] = {}
+        for fwk in state.frameworks + state.completed_frameworks:
+            for completed_executor in fwk.completed_executors:
+                self.directories.setdefault(
+                    completed_executor.id, completed_executor.directory
+                )
+
+
 class CompletedTaskInfo(BaseModel):
     id: str
     directory: str
@@ -65,6 +87,15 @@ class MesosClient:
     ) -> None:
         self.http = http_client
         self.conn = conn
+        self.agent_address_cache = LRUCache(
+            maxsize=settings.AGENT_ADDRESS_CACHE_SIZE,
+            ttl=settings.AGENT_ADDRESS_CACHE_TTL,
+        )
+        self.agent_state_cache = LRUCache(
+            maxsize=settings.AGENT_STATE_CACHE_SIZE,
+            ttl=settings.AGENT_STATE_CACHE_TTL,
+        )
+        self._agent_state_requests: Dict[str, asyncio.Future] = {}
 
     async def _get_json_data(self, path: str) -> Dict[str, Any]:
         data: Dict[str, Any] = {}
@@ -85,6 +116,29 @@ class MesosClient:
             raise NoMoreMesosServersException("servers")
 
     async def get_agent_address(self, agent_id: AgentIdSpec) -> str:
+        """
+        O endereço de um agent quase nunca muda, então guardamos o resultado
+        em cache por settings.AGENT_ADDRESS_CACHE_TTL segundos.
+        Agents não encontrados também ficam em cache, mas apenas por
+        settings.AGENT_NOT_FOUND_CACHE_TTL segundos.
+        """
+        cached = self.agent_address_cache.get(agent_id.value)
+        if isinstance(cached, AgentNotFoundException):
+            raise AgentNotFoundException(str(cached))
+        if cached:
+            return cached
+
+        try:
+            agent_addr = await self._fetch_agent_address(agent_id)
+        except AgentNotFoundException as e:
+            self.agent_address_cache.set(
+                agent_id.value, e, ttl=settings.AGENT_NOT_FOUND_CACHE_TTL
+            )
+            raise
+        self.agent_address_cache.set(agent_id.value, agent_addr)
+        return agent_addr
+
+    async def _fetch_agent_address(self, agent_id: AgentIdSpec) -> str:
         data = await self._get_json_data(f"slaves?slave_id={agent_id.value}")
         slave_api_response = SlaveAPIEndPointResponse(**data)
         if slave_api_response.slaves:
@@ -93,7 +147,7 @@ class MesosClient:
         raise AgentNotFoundException(f"Agent not found: id={agent_id.value}")
 
     async def get_task_info(
-        self, agent_addr: str, task_id: TaskIdSpec
+        self, agent_addr: str, task_id: TaskIdSpec, not_before: float = 0.0
     ) -> Optional[CompletedTaskInfo]:
         """
         Dado um slave e uma task, retorna o info que representa essa task.
@@ -101,34 +155,73 @@ class MesosClient:
 
         Retorna um objeto que contém a pasta onde estão o stdout/stderr dessa task.
         Esse path pode ser passado diretamente para a API do Agent (/files/read?path=<path>)
-        """
-        state = await self.http.get(f"{agent_addr}/state")
-        agent_state = StateAPIEndPointResponse(**await state.json())
 
-        completed_task_info = self._find_task_in_state(agent_state, task_id)
-        if completed_task_info:
-            return CompletedTaskInfo(**completed_task_info.dict())
+        `not_before` é quando (timestamp unix) a task mudou de estado. O
+        diretório de uma task não muda, então qualquer /state em cache que
+        já tenha a task serve. Só quando a task não está no cache e ele foi
+        buscado antes de `not_before` (ou seja, pode ainda não conhecer a
+        task) é que buscamos o /state de novo.
+        """
+        agent_state = await self._get_agent_state(agent_addr)
+        directory = agent_state.directories.get(task_id.value)
+        if not directory and agent_state.fetched_at < not_before:
+            agent_state = await self._get_agent_state(agent_addr, not_before)
+            directory = agent_state.directories.get(task_id.value)
+        if directory:
+            return CompletedTaskInfo(id=task_id.value, directory=directory)
         return None
 
-    def _find_task_in_state(
-        self, agent_state: StateAPIEndPointResponse, task_id: TaskIdSpec
-    ) -> Optional[CompletedExecutorSpec]:
-        for fwk in agent_state.frameworks + agent_state.completed_frameworks:
-            for completed_executor in fwk.completed_executors:
-                if completed_executor.id == task_id.value:
-                    return completed_executor
-        return None
+    async def _get_agent_state(
+        self, agent_addr: str, not_before: float = 0.0
+    ) -> AgentStateSnapshot:
+        """
+        O /state de um agent é grande, então guardamos uma versão já indexada
+        dele por settings.AGENT_STATE_CACHE_TTL segundos.
+        Chamadas simultâneas para o mesmo agent compartilham o mesmo request.
+        Um /state buscado antes de `not_before` é ignorado e buscamos de novo.
+        """
+        agent_state = self.agent_state_cache.get(agent_addr)
+        if agent_state and agent_state.fetched_at >= not_before:
+            return agent_state
+
+        # Um request começado a partir de agora sempre serve, então são no
+        # máximo duas voltas (ex: um request em andamento antigo demais).
+        not_before = min(not_before, time.time())
+        while True:
+            if agent_addr not in self._agent_state_requests:
+                self._agent_state_requests[agent_addr] = asyncio.ensure_future(
+                    self._fetch_agent_state(agent_addr)
+                )
+            agent_state = await asyncio.shield(
+                self._agent_state_requests[agent_addr]
+            )
+            if agent_state.fetched_at >= not_before:
+                return agent_state
+
+    async def _fetch_agent_state(self, agent_addr: str) -> AgentStateSnapshot:
+        try:
+            fetched_at = time.time()
+            resp = await self.http.get(f"{agent_addr}/state")
+            agent_state = AgentStateSnapshot(
+                StateAPIEndPointResponse(**await resp.json()), fetched_at
+            )
+            self.agent_state_cache.set(agent_addr, agent_state)
+            return agent_state
+        finally:
+            del self._agent_state_requests[agent_addr]
 
     async def get_task_output_data(
         self, agent_addr: str, task_info: CompletedTaskInfo
     ) -> TaskOutputData:
-
-        stdout_data = await self._get_task_file_content(
-            agent_addr, task_info, "stdout"
-        )
-
-        stderr_data = await self._get_task_file_content(
-            agent_addr, task_info, "stderr"
+        file_sizes = await self._get_task_file_sizes(agent_addr, task_info)
+
+        stdout_data, stderr_data = await asyncio.gather(
+            self._get_task_file_content(
+                agent_addr, task_info, "stdout", file_sizes.get("stdout", 0)
+            ),
+            self._get_task_file_content(
+                agent_addr, task_info, "stderr", file_sizes.get("stderr", 0)
+            ),
         )
         return TaskOutputData(
             task=TaskIdSpec(value=task_info.id),
@@ -136,26 +229,29 @@ class MesosClient:
             stderr=stderr_data,
         )
 
-    async def _get_task_file_size(
-        self, agent_addr: str, task_info: CompletedTaskInfo, file_name: str
-    ) -> int:
+    async def _get_task_file_sizes(
+        self, agent_addr: str, task_info: CompletedTaskInfo
+    ) -> Dict[str, int]:
+        """
+        Retorna o tamanho de cada arquivo da pasta da task, indexado pelo
+        nome do arquivo.
+        """
         resp = await self.http.get(
             f"{agent_addr}/files/browse?path={task_info.directory}"
         )
         task_files_data = await resp.json()
-        for task_item in task_files_data:
-            if task_item["path"].endswith(file_name):
-                return task_item["size"]
-
-        return 0
+        return {
+            task_item["path"].rsplit("/", 1)[-1]: task_item["size"]
+            for task_item in task_files_data
+        }
 
     async def _get_task_file_content(
-        self, agent_addr: str, task_info: CompletedTaskInfo, file_name: str
+        self,
+        agent_addr: str,
+        task_info: CompletedTaskInfo,
+        file_name: str,
+        file_size: int,
     ):
-        file_size = await self._get_task_file_size(
-            agent_addr, task_info, file_name
-        )
-
         offset = max(0, file_size - settings.TASK_FILE_CONTENT_LENGTH)
         length = settings.TASK_FILE_CONTENT_LENGTH
 
@@ -0,0 +1,145 @@
+import gzip
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timezone
+from typing import IO, Callable, Iterator, List, Optional, Tuple
+
+HEADER = struct.Struct(">dI")
+CAPTURE_SUFFIX = ".capture"
+GZIP_SUFFIX = ".gz"
+GZIP_LEVEL = 1
+
+
+class StreamCapture:
+    """
+    Grava os records recebidos do stream de eventos do mesos em arquivos
+    dentro de `directory`, para serem reproduzidos depois (ver
+    ReplayConsumer).
+
+    Cada record é gravado como `offset (8 bytes) + tamanho (4 bytes) + dados`,
+    onde os dados são o record exatamente como veio no stream, ainda no
+    formato RecordIO (`<tamanho>\\n<json>`), e o offset é quantos segundos
+    depois do começo do arquivo o record chegou.
+
+    Cada conexão com o master (`start_stream()`) começa um arquivo novo, que
+    assim sempre começa pelo SUBSCRIBED. Um arquivo também é trocado quando
+    passa de `max_file_size` bytes (antes da compressão) e apenas os
+    `max_files` arquivos mais novos são mantidos.
+
+    Com `compress` os arquivos são gravados com gzip (nível 1, para gastar
+    pouco do event loop), mas aí a leitura não pode usar mmap.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_file_size: int,
+        max_files: int,
+        compress: bool = False,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_file_size = max_file_size
+        self.max_files = max_files
+        self.compress = compress
+        self.path: Optional[str] = None
+        self._clock = clock
+        self._file: Optional[IO[bytes]] = None
+        self._size = 0
+        self._started_at = 0.0
+        self._sequence = 0
+
+    def start_stream(self) -> None:
+        self._rotate()
+
+    def write(self, record: bytes) -> None:
+        if self._file is None or self._size >= self.max_file_size:
+            self._rotate()
+        data = b"%d\n" % len(record) + record
+        self._file.write(  # type: ignore
+            HEADER.pack(self._clock() - self._started_at, len(data)) + data
+        )
+        self._size += HEADER.size + len(data)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self) -> None:
+        self.close()
+        self._sequence += 1
+        started_at = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        name = f"mesos-{started_at}-{self._sequence:06d}{CAPTURE_SUFFIX}"
+        if self.compress:
+            name += GZIP_SUFFIX
+        self.path = os.path.join(self.directory, name)
+        if self.compress:
+            self._file = gzip.open(self.path, "wb", compresslevel=GZIP_LEVEL)
+        else:
+            self._file = open(self.path, "wb")
+        self._size = 0
+        self._started_at = self._clock()
+        self._remove_old_files()
+
+    def _remove_old_files(self) -> None:
+        for name in capture_files(self.directory)[: -self.max_files]:
+            os.unlink(os.path.join(self.directory, name))
+
+
+def capture_files(directory: str) -> List[str]:
+    """
+    Arquivos de captura de `directory`, do mais antigo para o mais novo.
+    """
+    return sorted(
+        name
+        for name in os.listdir(directory)
+        if name.endswith((CAPTURE_SUFFIX, CAPTURE_SUFFIX + GZIP_SUFFIX))
+    )
+
+
+def read_capture(path: str) -> Iterator[Tuple[float, bytes]]:
+    """
+    Devolve o offset (em segundos) e o conteúdo (o JSON, já sem o tamanho do
+    RecordIO) de cada record gravado por um StreamCapture. Um record
+    incompleto (ex: o processo morreu no meio de uma escrita) encerra a
+    leitura.
+
+    Arquivos sem compressão são lidos com mmap, então o arquivo não é
+    carregado inteiro na memória e cada record é copiado uma única vez.
+    """
+    if path.endswith(GZIP_SUFFIX):
+        yield from _read_compressed(path)
+        return
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with data:
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            timestamp, length = HEADER.unpack(
+                data[offset : offset + HEADER.size]
+            )
+            start = offset + HEADER.size
+            end = start + length
+            if end > len(data):
+                return
+            yield timestamp, data[data.find(b"\n", start, end) + 1 : end]
+            offset = end
+
+
+def _read_compressed(path: str) -> Iterator[Tuple[float, bytes]]:
+    with gzip.open(path, "rb") as f:
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            timestamp, length = HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield timestamp, data[data.index(b"\n") + 1 :]
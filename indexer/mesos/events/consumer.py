@@ -1,23 +1,49 @@
+import asyncio
 import json
-from typing import List, AsyncGenerator, Optional
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from http import HTTPStatus
+from typing import Dict, List, AsyncGenerator, Optional, Tuple
 
-from aiohttp import ClientSession
-from aiohttp.client import ClientTimeout
+from aiohttp import ClientSession, ClientResponse
+from aiohttp.client import ClientError, ClientResponseError, ClientTimeout
 from pydantic import ValidationError
+from yarl import URL
 
-from indexer.conf import logger
+from indexer.cache import LRUCache
+from indexer.conf import TaskDetailsExecutor, logger, settings
 from indexer.connection import HTTPConnection
 from indexer.consumer import Consumer
+from indexer.dedup import EventDeduplicator
+from indexer.mesos.agents import AgentRegistry
 from indexer.mesos.client import MesosClient
+from indexer.mesos.events.capture import StreamCapture
+from indexer.mesos.events.reconciliation import TaskReconciler
+from indexer.mesos.events.recordio import RecordIOFramer
 from indexer.mesos.models.converters.taskadded import (
     MesosTaskAddedEventConverter,
 )
 from indexer.mesos.models.converters.taskupdated import (
     MesosTaskUpdatedEventConverter,
+    container_info_from_data,
 )
 from indexer.mesos.models.event import MesosEventTypes, MesosEvent
-from indexer.mesos.models.spec import AgentIdSpec, TaskIdSpec
-from indexer.models.event import Event, BackendInfoTypes
+from indexer.mesos.models.spec import (
+    AgentIdSpec,
+    TaskIdSpec,
+    TaskStateSnapshotSpec,
+)
+from indexer.mesos.models.subscribed import MesosSubscribedEvent
+from indexer.metrics import (
+    CONVERT_DURATION,
+    EVENTS_RECEIVED,
+    PARSE_DURATION,
+    MetricFamily,
+    http_trace_config,
+)
+from indexer.models.event import Event, BackendInfoTypes, IngestInfoSpec
 from indexer.models.util import BackendInfoTypes, get_backend_info
 
 timeout_config = ClientTimeout(connect=2.0, sock_read=90.0)
@@ -25,54 +51,436 @@ timeout_config = ClientTimeout(connect=2.0, sock_read=90.0)
 
 class MesosEventConsumer(Consumer):
 
-    http_client: ClientSession
+    http_client: Optional[ClientSession]
     mesos_client: MesosClient
+    response: Optional[ClientResponse]
 
-    def __init__(self, conn: HTTPConnection) -> None:
+    def __init__(self, conn: HTTPConnection, capture: bool = True) -> None:
+        """
+        Com `capture=False` o stream não é gravado em disco, mesmo com
+        settings.MESOS_CAPTURE_DIR definido.
+        """
         Consumer.__init__(self, conn)
+        self.agents = AgentRegistry()
+        self.reconciler = TaskReconciler(max_tasks=settings.RECONCILE_MAX_TASKS)
+        self.dedup = EventDeduplicator(
+            window=settings.DEDUP_WINDOW, maxsize=settings.DEDUP_MAX_KEYS
+        )
+        self.http_client = None
+        self.response = None
+        self.heartbeat_interval = settings.MESOS_HEARTBEAT_INTERVAL
+        self.subscribed = False
+        self._last_record_at: Optional[float] = None
+        self.capture: Optional[StreamCapture] = None
+        if capture and settings.MESOS_CAPTURE_DIR:
+            self.capture = StreamCapture(
+                settings.MESOS_CAPTURE_DIR,
+                max_file_size=settings.MESOS_CAPTURE_MAX_FILE_SIZE,
+                max_files=settings.MESOS_CAPTURE_MAX_FILES,
+                compress=settings.MESOS_CAPTURE_COMPRESS,
+            )
+        self.details_executor = task_details_executor()
+        self._pending_details: Dict[str, asyncio.Future] = {}
 
     async def connect(self) -> None:
-        self.http_client = ClientSession(timeout=timeout_config)
-        self.mesos_client = MesosClient(self.http_client, self.conn)
+        """
+        Faz o SUBSCRIBE apenas no master líder.
+        A mesma ClientSession é reaproveitada entre reconexões e a resposta
+        da conexão anterior (se existir) é fechada antes de abrirmos outra.
+        """
+        if self.http_client is None or self.http_client.closed:
+            http_client = ClientSession(
+                timeout=timeout_config,
+                trace_configs=[http_trace_config(self._request_target)],
+            )
+            self.http_client = http_client
+            self.mesos_client = MesosClient(http_client, self.conn)
+
+        self._close_response()
+
+        leader_url = await self._find_leader(self.http_client)
+        candidates = self.conn.urls
+        if leader_url:
+            candidates = [leader_url] + [
+                url for url in self.conn.urls if url != leader_url
+            ]
+
+        errors: List[Exception] = []
+        for url in candidates:
+            try:
+                self.response = await self._subscribe(self.http_client, url)
+                return
+            except (ClientError, asyncio.TimeoutError) as e:
+                await logger.exception(
+                    {
+                        "event": "subscribe-error",
+                        "exc": str(e),
+                        "mesos-address": url,
+                    }
+                )
+                errors.append(e)
+        raise errors[-1]
+
+    async def close(self) -> None:
+        self._close_response()
+        if self.http_client:
+            await self.http_client.close()
+        if self.capture:
+            self.capture.close()
+        if self.details_executor:
+            # Sem esperar os processos do pool terminarem, eles podem ficar
+            # presos e segurar a saída do interpretador.
+            await asyncio.get_event_loop().run_in_executor(
+                None, self.details_executor.shutdown
+            )
+
+    def _is_duplicate(self, event: Event, event_type: MesosEventTypes) -> bool:
+        if event_type == MesosEventTypes.TASK_ADDED:
+            # O date de um TASK_ADDED é a hora em que o evento foi lido, então
+            # a chave usa o id, que só depende da task.
+            return self.dedup.is_duplicate(event, key=event.id)
+        return self.dedup.is_duplicate(event)
+
+    def _close_response(self) -> None:
+        self.subscribed = False
+        self._last_record_at = None
+        for future in self._pending_details.values():
+            future.cancel()
+        self._pending_details.clear()
+        # Os eventos que estavam no pipeline se perderam com a conexão.
+        self.dedup.forget_pending()
+        if self.response:
+            self.response.close()
+            self.response = None
+
+    def readiness(self) -> Dict[str, bool]:
+        """
+        Além dos outputs, precisamos ter um SUBSCRIBE aceito e ter recebido
+        algo (no mínimo um HEARTBEAT) do stream recentemente.
+        """
+        stream_age = self.stream_age()
+        max_silence = (
+            self.heartbeat_interval * settings.MESOS_MAX_MISSED_HEARTBEATS
+        )
+        return {
+            "subscribed": self.subscribed,
+            "heartbeat": stream_age is not None and stream_age < max_silence,
+            **Consumer.readiness(self),
+        }
+
+    def _request_target(self, url: URL) -> str:
+        """
+        Os requests para os agents são sempre para o /state ou para o /files,
+        todos os outros são para o master.
+        """
+        if url.path.startswith(("/state", "/files")):
+            return "mesos-agent"
+        return "mesos-master"
+
+    def metrics(self) -> List[MetricFamily]:
+        caches: List[Tuple[str, LRUCache]] = []
+        if hasattr(self, "mesos_client"):
+            caches = [
+                ("agent-address", self.mesos_client.agent_address_cache),
+                ("agent-state", self.mesos_client.agent_state_cache),
+            ]
+        stream_age = self.stream_age()
+        return Consumer.metrics(self) + [
+            MetricFamily(
+                "indexer_cache_hits_total",
+                "counter",
+                "Consultas aos caches que encontraram o valor",
+                [({"cache": name}, float(c.hits)) for name, c in caches],
+            ),
+            MetricFamily(
+                "indexer_cache_misses_total",
+                "counter",
+                "Consultas aos caches que não encontraram o valor",
+                [({"cache": name}, float(c.misses)) for name, c in caches],
+            ),
+            MetricFamily(
+                "indexer_dedup_duplicates_total",
+                "counter",
+                "Eventos descartados por serem cópias de eventos já recebidos",
+                [({}, float(self.dedup.duplicates))],
+            ),
+            MetricFamily(
+                "indexer_mesos_stream_age_seconds",
+                "gauge",
+                "Segundos desde o último record recebido do stream do mesos",
+                [({}, stream_age)] if stream_age is not None else [],
+            ),
+        ]
+
+    def stream_age(self) -> Optional[float]:
+        """
+        Há quantos segundos recebemos o último record do stream de eventos.
+        None se não estivermos conectados.
+        """
+        if self._last_record_at is None:
+            return None
+        return asyncio.get_event_loop().time() - self._last_record_at
+
+    async def _find_leader(self, http_client: ClientSession) -> Optional[str]:
+        """
+        Pergunta para os masters quem é o líder atual. O endpoint /redirect
+        responde com um 307 apontando para o líder.
+        """
         for url in self.conn.urls:
-            resp = await self.http_client.post(
-                f"{url}/api/v1", json={"type": "SUBSCRIBE"}
+            try:
+                resp = await http_client.get(
+                    f"{url}/redirect", allow_redirects=False
+                )
+                resp.release()
+            except (ClientError, asyncio.TimeoutError) as e:
+                await logger.exception(
+                    {
+                        "event": "find-leader-error",
+                        "exc": str(e),
+                        "mesos-address": url,
+                    }
+                )
+                continue
+            if resp.status == HTTPStatus.TEMPORARY_REDIRECT:
+                return self._redirect_location(url, resp)
+        return None
+
+    async def _subscribe(
+        self, http_client: ClientSession, url: str
+    ) -> ClientResponse:
+        """
+        Um master que não é o líder responde com um 307 apontando para
+        o líder. Nesse caso seguimos o redirect (apenas uma vez).
+        """
+        resp = await http_client.post(
+            f"{url}/api/v1", json={"type": "SUBSCRIBE"}, allow_redirects=False
+        )
+        if resp.status == HTTPStatus.TEMPORARY_REDIRECT:
+            resp.release()
+            leader_url = self._redirect_location(url, resp)
+            resp = await http_client.post(
+                f"{leader_url}/api/v1",
+                json={"type": "SUBSCRIBE"},
+                allow_redirects=False,
+            )
+        if resp.status != HTTPStatus.OK:
+            resp.release()
+            raise ClientResponseError(
+                resp.request_info,
+                resp.history,
+                status=resp.status,
+                message="SUBSCRIBE not accepted",
             )
-            self.response = resp
+        return resp
+
+    def _redirect_location(self, url: str, resp: ClientResponse) -> str:
+        """
+        O mesos devolve o endereço do líder sem o schema (`//host:port`)
+        """
+        location = URL(url).join(URL(resp.headers["Location"]))
+        return str(location.origin())
 
     def _parse_recordio_event(self, data: bytes) -> MesosEvent:
-        size, data_bytes = data.decode("utf-8").split("\n")
-        mesos_event_data = json.loads(data_bytes)
+        record, = RecordIOFramer().feed(data)
+        mesos_event_data = json.loads(record)
         return MesosEvent(**mesos_event_data)
 
     async def events(self):
         async for mesos_event_data in self._mesos_events():
+            received_at = datetime.now(timezone.utc)
+            if mesos_event_data.type == MesosEventTypes.SUBSCRIBED:
+                self.subscribed = True
+                self.stream_established()
+                if mesos_event_data.subscribed:
+                    self._on_subscribed(mesos_event_data.subscribed)
+            if mesos_event_data.type == MesosEventTypes.AGENT_ADDED:
+                self.agents.add(mesos_event_data.agent_added.agent)
+            if mesos_event_data.type == MesosEventTypes.AGENT_REMOVED:
+                self.agents.remove(mesos_event_data.agent_removed.agent_id)
+            event = None
             if mesos_event_data.type == MesosEventTypes.TASK_ADDED:
-                yield MesosTaskAddedEventConverter.to_asgard_model(
-                    mesos_event_data.task_added
-                )
+                with CONVERT_DURATION.time():
+                    event = MesosTaskAddedEventConverter.to_asgard_model(
+                        mesos_event_data.task_added
+                    )
             if mesos_event_data.type == MesosEventTypes.TASK_UPDATED:
-                yield MesosTaskUpdatedEventConverter.to_asgard_model(
-                    mesos_event_data.task_updated
-                )
+                with CONVERT_DURATION.time():
+                    event = MesosTaskUpdatedEventConverter.to_asgard_model(
+                        mesos_event_data.task_updated,
+                        decode_task_details=self.details_executor is None,
+                    )
+            if event and not self._is_duplicate(event, mesos_event_data.type):
+                if mesos_event_data.type == MesosEventTypes.TASK_UPDATED:
+                    self._decode_task_details(
+                        event, mesos_event_data.task_updated.status.data
+                    )
+                self._stamp_ingest(event, received_at)
+                yield event
 
-    async def _mesos_events(self) -> AsyncGenerator[Optional[MesosEvent], None]:
-        _data = b""
-        async for chunk, end in self.response.content.iter_chunks():
-            _data += chunk
-            if end:
-                size, data_bytes = _data.decode("utf-8").split("\n")
-                mesos_event_data = json.loads(data_bytes)
-                _data = b""
-                try:
-                    yield MesosEvent(**mesos_event_data)
-                except ValidationError:
-                    await logger.exception(
+    def _decode_task_details(self, event: Event, data: Optional[str]) -> None:
+        """
+        Com settings.TASK_DETAILS_EXECUTOR o docker inspect que vem no
+        TASK_UPDATED é decodificado em um pool (ver task_details_executor())
+        enquanto o evento segue pelo pipeline. O resultado é colocado no
+        evento por self._resolve_task_details() antes do enriquecimento.
+        """
+        if self.details_executor is None or not data:
+            return
+        loop = asyncio.get_event_loop()
+        self._pending_details[event.id] = asyncio.ensure_future(
+            loop.run_in_executor(
+                self.details_executor, container_info_from_data, data
+            )
+        )
+
+    async def _resolve_task_details(self, event: Event) -> None:
+        """
+        Espera a decodificação do docker inspect desse evento, se ela foi
+        feita em um pool. Um erro na decodificação é lançado aqui, como
+        qualquer outro erro do enriquecimento (ver Consumer._enrich_worker()).
+        Como o writer entrega os eventos na ordem em que foram lidos do
+        stream, os eventos de uma mesma task continuam chegando no output na
+        ordem original.
+        """
+        future = self._pending_details.pop(event.id, None)
+        if future is not None:
+            event.container_info = await future
+
+    def _stamp_ingest(self, event: Event, received_at: datetime) -> None:
+        """
+        Com settings.INGEST_TIMING_ENABLED o evento carrega quando passou por
+        cada estágio do indexer (ver IngestInfoSpec), que é indexado junto.
+        """
+        if settings.INGEST_TIMING_ENABLED:
+            event.ingest = IngestInfoSpec(
+                received_at=received_at.isoformat(),
+                converted_at=datetime.now(timezone.utc).isoformat(),
+            )
+
+    def _on_subscribed(self, subscribed: MesosSubscribedEvent) -> None:
+        self.agents.load(subscribed.agents())
+        if subscribed.heartbeat_interval_seconds:
+            self.heartbeat_interval = subscribed.heartbeat_interval_seconds
+        missed = self.reconciler.missed_tasks(subscribed.tasks())
+        if missed:
+            self.spawn(self._reconcile(missed))
+
+    async def _reconcile(self, tasks: List[TaskStateSnapshotSpec]) -> None:
+        """
+        Indexa as transições de estado que perdemos enquanto estávamos
+        desconectados. Os eventos sintéticos passam pelo mesmo pipeline dos
+        eventos do stream (inclusive a decodificação do docker inspect no
+        pool, ver self._decode_task_details()), mas limitamos quantos deles
+        ficam em voo ao mesmo tempo para não competir com o tráfego ao vivo.
+
+        Uma task que não conseguimos converter é logada e ignorada. Essa
+        coroutine roda via self.spawn(), então é cancelada junto com o
+        pipeline em uma reconexão, mesmo que esteja esperando espaço no
+        pipeline ou eventos que não vão mais ser escritos.
+        """
+        await logger.info(
+            {"event": "mesos-reconcile-started", "missed-tasks": len(tasks)}
+        )
+        in_flight = asyncio.Semaphore(settings.RECONCILE_CONCURRENCY)
+        for task in tasks:
+            try:
+                event = self.reconciler.to_event(
+                    task, decode_task_details=self.details_executor is None
+                )
+                if event is None:
+                    await logger.error(
                         {
-                            "event": "unsoported-mesos-event-received",
-                            "event-type": mesos_event_data.get("type"),
+                            "event": "mesos-reconcile-invalid-task",
+                            "task-id": task.task_id.value,
                         }
                     )
+                    continue
+                if self.dedup.is_duplicate(event):
+                    continue
+                self._decode_task_details(event, task.statuses[-1].get("data"))
+                self._stamp_ingest(event, datetime.now(timezone.utc))
+            except Exception as e:
+                await logger.exception(
+                    {
+                        "event": "mesos-reconcile-task-error",
+                        "task-id": task.task_id.value,
+                        "exc": str(e),
+                    }
+                )
+                continue
+
+            await in_flight.acquire()
+            try:
+                item = await self.submit(event)
+            except BaseException:
+                in_flight.release()
+                raise
+            item.done.add_done_callback(lambda _: in_flight.release())
+
+    async def _records(self) -> AsyncGenerator[bytes, None]:
+        """
+        Records (ainda em JSON) do stream da conexão atual. Com
+        settings.MESOS_CAPTURE_DIR cada record também é gravado em disco
+        (ver StreamCapture).
+        """
+        if self.response is None:
+            return
+        if self.capture:
+            self.capture.start_stream()
+        framer = RecordIOFramer()
+        while True:
+            chunk = await self._read_chunk(self.response)
+            if not chunk:
+                return
+            for record in framer.feed(chunk):
+                if self.capture:
+                    self.capture.write(record)
+                yield record
+
+    async def _mesos_events(self) -> AsyncGenerator[Optional[MesosEvent], None]:
+        loop = asyncio.get_event_loop()
+        self._last_record_at = loop.time()
+        async for record in self._records():
+            self._last_record_at = loop.time()
+            started_at = time.perf_counter()
+            mesos_event_data = json.loads(record)
+            try:
+                mesos_event = MesosEvent(**mesos_event_data)
+            except ValidationError:
+                await logger.exception(
+                    {
+                        "event": "unsoported-mesos-event-received",
+                        "event-type": mesos_event_data.get("type"),
+                    }
+                )
+                continue
+            PARSE_DURATION.observe(time.perf_counter() - started_at)
+            EVENTS_RECEIVED.labels(mesos_event.type.value).inc()
+            yield mesos_event
+
+    async def _read_chunk(self, response: ClientResponse) -> bytes:
+        """
+        O master manda um HEARTBEAT a cada self.heartbeat_interval segundos.
+        Se ficarmos settings.MESOS_MAX_MISSED_HEARTBEATS intervalos sem
+        receber nenhum record consideramos que o stream está parado e
+        lançamos asyncio.TimeoutError, o que força uma reconexão.
+        """
+        max_silence = (
+            self.heartbeat_interval * settings.MESOS_MAX_MISSED_HEARTBEATS
+        )
+        timeout = max_silence - (self.stream_age() or 0)
+        try:
+            if timeout <= 0:
+                raise asyncio.TimeoutError()
+            return await asyncio.wait_for(response.content.readany(), timeout)
+        except asyncio.TimeoutError:
+            await logger.error(
+                {
+                    "event": "mesos-stream-stalled",
+                    "stream-age": self.stream_age(),
+                }
+            )
+            raise
 
     def _get_task_id_with_namespace(self, event):
         task_id_with_namespace = ""
@@ -86,14 +494,25 @@ class MesosEventConsumer(Consumer):
 
         return task_id_with_namespace
 
+    def events_written(self, events: List[Event]) -> None:
+        for event in events:
+            self.dedup.indexed(event)
+            self.reconciler.task_indexed(
+                self._get_task_id_with_namespace(event), event.status.value
+            )
+
     async def pre_process_event(self, events: List[Event]) -> None:
         for event in events:
+            await self._resolve_task_details(event)
             task_id = self._get_task_id_with_namespace(event)
-            agent_addr = await self.mesos_client.get_agent_address(
-                AgentIdSpec(value=event.agent.id)
-            )
+            agent_id = AgentIdSpec(value=event.agent.id)
+            agent_addr = self.agents.get_address(agent_id)
+            if not agent_addr:
+                agent_addr = await self.mesos_client.get_agent_address(agent_id)
             task_info = await self.mesos_client.get_task_info(
-                agent_addr, TaskIdSpec(value=task_id)
+                agent_addr,
+                TaskIdSpec(value=task_id),
+                not_before=datetime.fromisoformat(event.date).timestamp(),
             )
             if task_info:
                 output_data = await self.mesos_client.get_task_output_data(
@@ -101,3 +520,29 @@ class MesosEventConsumer(Consumer):
                 )
                 event.task.stdout = output_data.stdout
                 event.task.stderr = output_data.stderr
+
+
+def task_details_executor() -> Optional[Executor]:
+    """
+    Pool usado para decodificar o docker inspect dos TASK_UPDATED, de acordo
+    com settings.TASK_DETAILS_EXECUTOR:
+     - `inline`: sem pool, a decodificação é feita no event loop;
+     - `thread`: as threads só disputam o GIL com o event loop, então o
+       ganho é apenas não segurar o event loop durante todo o parse de um
+       docker inspect muito grande;
+     - `process`: paralelismo de verdade, pagando o custo de serializar
+       (pickle) o `data` e o ContainerInfoSpec entre os processos. Os
+       processos são criados com `spawn`: um fork herdaria as threads (e
+       locks) do processo do indexer no estado em que estivessem.
+    """
+    if settings.TASK_DETAILS_EXECUTOR == TaskDetailsExecutor.THREAD:
+        return ThreadPoolExecutor(
+            max_workers=settings.TASK_DETAILS_WORKERS,
+            thread_name_prefix="indexer-task-details",
+        )
+    if settings.TASK_DETAILS_EXECUTOR == TaskDetailsExecutor.PROCESS:
+        return ProcessPoolExecutor(  # type: ignore
+            max_workers=settings.TASK_DETAILS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return None
@@ -0,0 +1,66 @@
+from typing import List, Optional
+
+from pydantic import ValidationError
+
+from indexer.cache import LRUCache
+from indexer.mesos.models.converters.taskupdated import (
+    MesosTaskUpdatedEventConverter,
+)
+from indexer.mesos.models.spec import TaskStateSnapshotSpec
+from indexer.mesos.models.taskupdated import MesosTaskUpdatedEvent
+from indexer.models.event import Event
+
+
+class TaskReconciler:
+    """
+    Guarda o último estado indexado de cada task e, a partir do snapshot
+    de tasks que recebemos no SUBSCRIBED, descobre quais transições foram
+    perdidas enquanto estávamos desconectados.
+
+    No primeiro snapshot não temos com o que comparar, então ele é usado
+    apenas para popular o estado conhecido das tasks.
+    """
+
+    def __init__(self, max_tasks: int) -> None:
+        self.indexed_tasks = LRUCache(maxsize=max_tasks)
+        self._seeded = False
+
+    def task_indexed(self, task_id: str, state: str) -> None:
+        self.indexed_tasks.set(task_id, state)
+
+    def missed_tasks(
+        self, tasks: List[TaskStateSnapshotSpec]
+    ) -> List[TaskStateSnapshotSpec]:
+        if not self._seeded:
+            for task in tasks:
+                self.task_indexed(task.task_id.value, task.state.value)
+            self._seeded = True
+            return []
+
+        return [
+            task
+            for task in tasks
+            if self.indexed_tasks.get(task.task_id.value) != task.state.value
+        ]
+
+    def to_event(
+        self, task: TaskStateSnapshotSpec, decode_task_details: bool = True
+    ) -> Optional[Event]:
+        """
+        Cria um evento sintético a partir do último status da task.
+        `decode_task_details` funciona como no
+        MesosTaskUpdatedEventConverter.to_asgard_model().
+        """
+        if not task.statuses:
+            return None
+        try:
+            task_updated = MesosTaskUpdatedEvent(
+                state=task.state,
+                status=task.statuses[-1],
+                framework_id=task.framework_id,
+            )
+        except ValidationError:
+            return None
+        return MesosTaskUpdatedEventConverter.to_asgard_model(
+            task_updated, decode_task_details=decode_task_details
+        )
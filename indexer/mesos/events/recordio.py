@@ -0,0 +1,58 @@
+from typing import List
+
+
+class RecordIOFramer:
+    """
+    Separa um stream no formato RecordIO (`<tamanho em bytes>\\n<dados>`)
+    em records completos.
+
+    Os chunks recebidos são acumulados em um único bytearray e cada record
+    é copiado apenas uma vez, quando está completo. Um chunk pode conter
+    vários records e um record pode chegar dividido em vários chunks.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._pos = 0
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        Adiciona um chunk ao buffer e retorna todos os records que ficaram
+        completos a partir dele.
+        """
+        self._buffer += chunk
+        records: List[bytes] = []
+
+        view = memoryview(self._buffer)
+        try:
+            while True:
+                header_end = self._buffer.find(b"\n", self._pos)
+                if header_end == -1:
+                    break
+                start = header_end + 1
+                end = start + int(self._buffer[self._pos : header_end])
+                if end > len(self._buffer):
+                    break
+                records.append(view[start:end].tobytes())
+                self._pos = end
+        finally:
+            # O bytearray não pode mudar de tamanho enquanto existir uma
+            # view dele (ver self._compact()). O typeshed do mypy que usamos
+            # ainda não conhece o memoryview.release().
+            view.release()  # type: ignore
+
+        self._compact()
+        return records
+
+    def _compact(self) -> None:
+        """
+        Descarta os bytes de records já consumidos. Só movemos os dados
+        quando a parte consumida é pelo menos metade do buffer, o que
+        mantém o custo de cada chunk proporcional ao seu tamanho.
+        """
+        if self._pos == len(self._buffer):
+            self._buffer.clear()
+            self._pos = 0
+        elif self._pos * 2 >= len(self._buffer):
+            del self._buffer[: self._pos]
+            self._pos = 0
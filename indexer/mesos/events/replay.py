@@ -0,0 +1,61 @@
+import asyncio
+from typing import AsyncGenerator, List
+
+from indexer.conf import logger
+from indexer.connection import HTTPConnection
+from indexer.mesos.events.capture import read_capture
+from indexer.mesos.events.consumer import MesosEventConsumer
+from indexer.models.event import Event
+
+
+class ReplayConsumer(MesosEventConsumer):
+    """
+    Consumer que, em vez de conectar no mesos master, lê os records gravados
+    por um StreamCapture (ver settings.MESOS_CAPTURE_DIR) e passa cada um
+    pelo mesmo caminho dos records do stream: parse, conversão, dedup,
+    reconciliação e outputs.
+
+    Com `speed` 0 os records são entregues o mais rápido possível. Com
+    `speed` maior que zero é respeitado o intervalo original entre os
+    records, dividido por `speed` (ex: 2.0 reproduz duas vezes mais rápido).
+
+    O enriquecimento (stdout/stderr das tasks) depende dos agents do
+    cluster de onde a captura veio, então não é feito nem esperado (ver
+    settings.PIPELINE_ENRICH_DELAY). Depois do último
+    arquivo o consumer termina, esperando os outputs escreverem tudo.
+    """
+
+    def __init__(self, paths: List[str], speed: float = 0.0) -> None:
+        MesosEventConsumer.__init__(
+            self, HTTPConnection(urls=[]), capture=False
+        )
+        self.paths = paths
+        self.speed = speed
+        self.replayed = 0
+
+    async def connect(self) -> None:
+        pass
+
+    async def _records(self) -> AsyncGenerator[bytes, None]:
+        loop = asyncio.get_event_loop()
+        for path in self.paths:
+            await logger.info({"event": "mesos-replay-started", "file": path})
+            started_at = loop.time()
+            for offset, record in read_capture(path):
+                if self.speed > 0:
+                    delay = started_at + offset / self.speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                self.replayed += 1
+                yield record
+        self._run = False
+        await logger.info(
+            {"event": "mesos-replay-finished", "records": self.replayed}
+        )
+
+    async def pre_process_event(self, events: List[Event]) -> None:
+        for event in events:
+            await self._resolve_task_details(event)
+
+    def enrich_delay(self, event: Event) -> float:
+        return 0.0
@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+from indexer.mesos.models.spec import AgentSpec
+
+
+class MesosAgentAddedEvent(BaseModel):
+    agent: AgentSpec
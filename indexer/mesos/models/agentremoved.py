@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+from indexer.mesos.models.spec import AgentIdSpec
+
+
+class MesosAgentRemovedEvent(BaseModel):
+    agent_id: AgentIdSpec
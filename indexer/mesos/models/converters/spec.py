@@ -1,3 +1,5 @@
+from typing import Any, Dict
+
 from indexer.mesos.models.spec import MesosEventSourceSpec
 from indexer.mesos.models.spec.taskdata import MesosTaskDataSpec
 from indexer.models.converter import ModelConverter
@@ -29,30 +31,45 @@ class MesosTaskDataSpecConverter(
 ):
     @staticmethod
     def to_asgard_model(other: MesosTaskDataSpec) -> ContainerInfoSpec:
-        return ContainerInfoSpec(
-            name=other.Name,
-            pid=other.State.Pid,
-            running=other.State.Running,
-            exit_code=other.State.ExitCode,
-            error=other.State.Error,
-            hostname=other.config.Hostname,
-            image=other.config.Image,
-            resources=ContainerInfoResourcesSpec(
-                cpu_shares=other.HostConfig.CpuShares,
-                cpu_quota=other.HostConfig.CpuQuota,
-                memory_swap=other.HostConfig.MemorySwap,
-                memory_swappiness=other.HostConfig.MemorySwappiness,
-            ),
-            volumes=[
-                ContainerInfoVolumeItemSpec(
-                    host_path=volume_info_item.Source,
-                    container_path=volume_info_item.Destination,
-                    mode=volume_info_item.Mode,
-                )
-                for volume_info_item in other.Mounts
-            ],
-            labels=[
-                ContainerInfoLabelsItemSpec(name=label_name, value=label_value)
-                for label_name, label_value in other.config.Labels.items()
-            ],
-        )
+        return container_info_from_task_data(other.dict())
+
+
+def container_info_from_task_data(
+    task_data: Dict[str, Any]
+) -> ContainerInfoSpec:
+    """
+    Monta o ContainerInfoSpec direto do docker inspect decodificado (ver
+    decode_task_data()), sem passar pelo MesosTaskDataSpec: os campos são
+    validados uma única vez, pelos models do Event. Um docker inspect sem
+    algum dos campos usados levanta KeyError.
+    """
+    state = task_data["State"]
+    config = task_data["config"]
+    host_config = task_data["HostConfig"]
+    return ContainerInfoSpec(
+        name=task_data["Name"].strip("/"),
+        pid=state["Pid"],
+        running=state["Running"],
+        exit_code=state["ExitCode"],
+        error=state["Error"],
+        hostname=config["Hostname"],
+        image=config["Image"],
+        resources=ContainerInfoResourcesSpec(
+            cpu_shares=host_config["CpuShares"],
+            cpu_quota=host_config["CpuQuota"],
+            memory_swap=host_config["MemorySwap"],
+            memory_swappiness=host_config.get("MemorySwappiness"),
+        ),
+        volumes=[
+            ContainerInfoVolumeItemSpec(
+                host_path=mount["Source"],
+                container_path=mount["Destination"],
+                mode=mount["Mode"],
+            )
+            for mount in task_data["Mounts"]
+        ],
+        labels=[
+            ContainerInfoLabelsItemSpec(name=label_name, value=label_value)
+            for label_name, label_value in config["Labels"].items()
+        ],
+    )
@@ -1,11 +1,12 @@
 from datetime import datetime, timezone
-from uuid import uuid4
 
 from indexer.mesos.models.converters.util import (
     get_appname,
+    get_event_id,
     get_task_namespace,
     remove_task_namespace,
 )
+from indexer.mesos.models.spec import MesosEventSourceSpec
 from indexer.mesos.models.taskadded import MesosTaskAddedEvent
 from indexer.models.converter import ModelConverter
 from indexer.models.event import (
@@ -28,7 +29,11 @@ class MesosTaskAddedEventConverter(ModelConverter[Event, MesosTaskAddedEvent]):
         task_id = other.task.task_id.value
         agent_id = other.task.agent_id.value
         return Event(
-            id=str(uuid4()),
+            id=get_event_id(
+                task_id,
+                other.task.state.value,
+                MesosEventSourceSpec.SOURCE_MASTER.value,
+            ),
             date=datetime.now(timezone.utc).isoformat(),
             appname=get_appname(task_id),
             namespace=get_task_namespace(task_id),
@@ -1,16 +1,17 @@
 from datetime import datetime, timezone
 from typing import Dict, Any
-from uuid import uuid4
 
 from indexer.mesos.models.converters.spec import (
     MesosEventSourceSpecConverter,
-    MesosTaskDataSpecConverter,
+    container_info_from_task_data,
 )
 from indexer.mesos.models.converters.util import (
     get_appname,
+    get_event_id,
     get_task_namespace,
     remove_task_namespace,
 )
+from indexer.mesos.models.spec import decode_task_data
 from indexer.mesos.models.taskupdated import MesosTaskUpdatedEvent
 from indexer.models.converter import ModelConverter
 from indexer.models.event import (
@@ -18,16 +19,33 @@ from indexer.models.event import (
     BackendInfoSpec,
     TaskInfoSpec,
     AgentInfoSpec,
+    ContainerInfoSpec,
     ErrorSpec,
 )
 from indexer.models.util import get_backend_info
 
 
+def container_info_from_data(data: str) -> ContainerInfoSpec:
+    """
+    Decodifica o docker inspect do `data` de um TASK_UPDATED (base64, JSON e
+    validação) direto para o ContainerInfoSpec do evento. É uma função de
+    módulo para poder ser executada em um ProcessPoolExecutor.
+    """
+    return container_info_from_task_data(decode_task_data(data))
+
+
 class MesosTaskUpdatedEventConverter(
     ModelConverter[Event, MesosTaskUpdatedEvent]
 ):
     @staticmethod
-    def to_asgard_model(other: MesosTaskUpdatedEvent) -> Event:
+    def to_asgard_model(
+        other: MesosTaskUpdatedEvent, decode_task_details: bool = True
+    ) -> Event:
+        """
+        Com `decode_task_details=False` o `container_info` não é preenchido
+        e quem chamou fica responsável por decodificar o `data` (ver
+        container_info_from_data()).
+        """
         extra: Dict[str, Any] = {}
 
         if other.status.reason:
@@ -37,17 +55,19 @@ class MesosTaskUpdatedEventConverter(
         elif other.status.message:
             extra["message"] = other.status.message
 
-        task_details = other.status.task_details()
-
-        if task_details:
-            extra[
-                "container_info"
-            ] = MesosTaskDataSpecConverter.to_asgard_model(task_details)
+        task_data = other.status.task_data() if decode_task_details else None
+        if task_data:
+            extra["container_info"] = container_info_from_task_data(task_data)
 
         task_id = other.status.task_id.value
         agent_id = other.status.agent_id.value
         return Event(
-            id=str(uuid4()),
+            id=get_event_id(
+                task_id,
+                other.status.state.value,
+                other.status.source.value,
+                other.status.timestamp,
+            ),
             date=datetime.fromtimestamp(other.status.timestamp)
             .astimezone(timezone.utc)
             .isoformat(),
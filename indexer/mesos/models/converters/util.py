@@ -1,5 +1,8 @@
 from enum import Enum, auto
-from typing import Tuple
+from typing import Optional, Tuple
+from uuid import UUID, uuid5
+
+EVENT_ID_NAMESPACE = UUID("5c0d4f7e-6a43-4b8e-9d51-1e7f3b2a9c60")
 
 
 class SplitType(Enum):
@@ -54,3 +57,17 @@ def get_appname(task_id: str) -> str:
 
     _, appname, _ = split_task_id(task_id, split_type)
     return appname
+
+
+def get_event_id(
+    task_id: str, state: str, source: str, timestamp: Optional[float] = None
+) -> str:
+    """
+    Id determinístico de um evento: a mesma transição de estado de uma task,
+    reportada pela mesma origem, sempre gera o mesmo id. Isso torna a
+    indexação idempotente, já que o id é usado como `_id` no ElasticSearch.
+    """
+    name = (
+        f"{task_id}:{state}:{source}:{'' if timestamp is None else timestamp}"
+    )
+    return str(uuid5(EVENT_ID_NAMESPACE, name))
@@ -3,7 +3,10 @@ from typing import Optional
 
 from pydantic import BaseModel
 
+from indexer.mesos.models.agentadded import MesosAgentAddedEvent
+from indexer.mesos.models.agentremoved import MesosAgentRemovedEvent
 from indexer.mesos.models.spec import MesosTaskDataSpec
+from indexer.mesos.models.subscribed import MesosSubscribedEvent
 from indexer.mesos.models.taskadded import MesosTaskAddedEvent
 from indexer.mesos.models.taskupdated import MesosTaskUpdatedEvent
 
@@ -12,12 +15,18 @@ class MesosEventTypes(str, Enum):
     TASK_ADDED = "TASK_ADDED"
     TASK_UPDATED = "TASK_UPDATED"
     SUBSCRIBED = "SUBSCRIBED"
+    AGENT_ADDED = "AGENT_ADDED"
+    AGENT_REMOVED = "AGENT_REMOVED"
+    HEARTBEAT = "HEARTBEAT"
 
 
 class MesosEvent(BaseModel):
     type: MesosEventTypes
     task_added: Optional[MesosTaskAddedEvent]
     task_updated: Optional[MesosTaskUpdatedEvent]
+    subscribed: Optional[MesosSubscribedEvent]
+    agent_added: Optional[MesosAgentAddedEvent]
+    agent_removed: Optional[MesosAgentRemovedEvent]
 
     def task_details(self) -> Optional[MesosTaskDataSpec]:
         if self.task_updated:
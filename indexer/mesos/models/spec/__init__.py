@@ -1,11 +1,17 @@
 import json
 from base64 import b64decode
 from enum import Enum
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Type
 
 from pydantic import BaseModel
 
-from indexer.mesos.models.spec.taskdata import MesosTaskDataSpec
+from indexer.mesos.models.spec.taskdata import (
+    MesosTaskDataConfigSpec,
+    MesosTaskDataHostConfigSpec,
+    MesosTaskDataMountItemSpec,
+    MesosTaskDataSpec,
+    MesosTaskDataStateSpec,
+)
 
 
 class ExecutorIdSpec(BaseModel):
@@ -20,6 +26,23 @@ class AgentIdSpec(BaseModel):
     value: str
 
 
+class AgentInfoSpec(BaseModel):
+    id: AgentIdSpec
+    hostname: str
+    port: int = 5051
+
+    def address(self) -> str:
+        return f"http://{self.hostname}:{self.port}"
+
+
+class AgentSpec(BaseModel):
+    agent_info: AgentInfoSpec
+
+
+class GetAgentsSpec(BaseModel):
+    agents: List[AgentSpec] = []
+
+
 class ContainerSpec(BaseModel):
     type: str
 
@@ -70,15 +93,99 @@ class TaskStatusSpec(BaseModel):
     task_id: TaskIdSpec
     timestamp: int
 
+    def task_data(self) -> Optional[Dict[str, Any]]:
+        """
+        O docker inspect do `data` já decodificado (ver decode_task_data()).
+        A decodificação só acontece na primeira chamada e o resultado fica
+        guardado nesse status (fora dos campos do model, então não aparece
+        no `.dict()` nem é copiado).
+        """
+        return self._memoize("_task_data", decode_task_data)
+
     def task_details(self) -> Optional[MesosTaskDataSpec]:
-        if self.data:
-            b64_decoded = b64decode(self.data)
-            data_dict = json.loads(b64_decoded)
-            task_data = data_dict[0]
-            # Temos que mudar de Config pata config pois o pydantic
-            # usa o nome Config para guardar as configuracões de um model
-            # https://pydantic-docs.helpmanual.io/usage/model_config/
-            task_data["config"] = task_data["Config"]
-            del task_data["Config"]
-            return MesosTaskDataSpec(**task_data)
-        return None
+        task_data = self.task_data()
+        if task_data is None:
+            return None
+        details_data: Dict[str, Any] = task_data
+        return self._memoize(
+            "_task_details", lambda _: MesosTaskDataSpec(**details_data)
+        )
+
+    def _memoize(self, name: str, decode: Callable[[str], Any]) -> Any:
+        if not self.data:
+            return None
+        cached = self.__dict__.get(name)
+        # Se o `data` foi trocado depois da decodificação, decodificamos de
+        # novo.
+        if cached is None or cached[0] is not self.data:
+            cached = (self.data, decode(self.data))
+            self.__dict__[name] = cached
+        return cached[1]
+
+
+def decode_task_data(data: str) -> Dict[str, Any]:
+    """
+    Decodifica o `data` de um TaskStatusSpec: o docker inspect do container
+    da task, em base64.
+
+    Apenas os campos declarados no MesosTaskDataSpec são mantidos. O resto do
+    docker inspect (Env, NetworkSettings, GraphDriver etc, que são quase todo
+    o tamanho dele) é descartado logo depois do json.loads, sem passar pelo
+    pydantic e sem ficar guardado junto com o status.
+    """
+    task_data = json.loads(b64decode(data))[0]
+    projected: Dict[str, Any] = {}
+    if "Name" in task_data:
+        projected["Name"] = task_data["Name"]
+    # Temos que mudar de Config pata config pois o pydantic
+    # usa o nome Config para guardar as configuracões de um model
+    # https://pydantic-docs.helpmanual.io/usage/model_config/
+    if "Config" in task_data:
+        projected["config"] = _project(
+            task_data["Config"], MesosTaskDataConfigSpec
+        )
+    if "State" in task_data:
+        projected["State"] = _project(
+            task_data["State"], MesosTaskDataStateSpec
+        )
+    if "HostConfig" in task_data:
+        projected["HostConfig"] = _project(
+            task_data["HostConfig"], MesosTaskDataHostConfigSpec
+        )
+    if "Mounts" in task_data:
+        mounts = task_data["Mounts"]
+        if isinstance(mounts, list):
+            mounts = [
+                _project(mount, MesosTaskDataMountItemSpec) for mount in mounts
+            ]
+        projected["Mounts"] = mounts
+    return projected
+
+
+def _project(value: Any, model: Type[BaseModel]) -> Any:
+    if isinstance(value, dict):
+        return {name: value[name] for name in model.__fields__ if name in value}
+    return value
+
+
+class TaskStateSnapshotSpec(BaseModel):
+    """
+    Uma task como aparece no snapshot do evento SUBSCRIBED.
+    Os statuses ficam como dict e só são validados quando necessário.
+    """
+
+    task_id: TaskIdSpec
+    framework_id: FrameworkIdSpec
+    state: TaskState
+    statuses: List[Dict[str, Any]] = []
+
+
+class GetTasksSpec(BaseModel):
+    tasks: List[TaskStateSnapshotSpec] = []
+    unreachable_tasks: List[TaskStateSnapshotSpec] = []
+    completed_tasks: List[TaskStateSnapshotSpec] = []
+
+
+class GetStateSpec(BaseModel):
+    get_agents: Optional[GetAgentsSpec]
+    get_tasks: Optional[GetTasksSpec]
@@ -0,0 +1,29 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from indexer.mesos.models.spec import (
+    AgentSpec,
+    GetStateSpec,
+    TaskStateSnapshotSpec,
+)
+
+
+class MesosSubscribedEvent(BaseModel):
+    get_state: Optional[GetStateSpec]
+    heartbeat_interval_seconds: Optional[float]
+
+    def agents(self) -> List[AgentSpec]:
+        if self.get_state and self.get_state.get_agents:
+            return self.get_state.get_agents.agents
+        return []
+
+    def tasks(self) -> List[TaskStateSnapshotSpec]:
+        if self.get_state and self.get_state.get_tasks:
+            get_tasks = self.get_state.get_tasks
+            return (
+                get_tasks.tasks
+                + get_tasks.unreachable_tasks
+                + get_tasks.completed_tasks
+            )
+        return []
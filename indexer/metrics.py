@@ -0,0 +1,339 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Sequence,
+    Tuple,
+)
+
+from aiohttp import TraceConfig
+from yarl import URL
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+Labels = Dict[str, str]
+
+
+class MetricFamily(NamedTuple):
+    """
+    Métrica calculada no momento da coleta (ex: tamanho de uma fila),
+    sem nenhum custo no caminho dos eventos.
+    """
+
+    name: str
+    type: str
+    documentation: str
+    samples: List[Tuple[Labels, float]]
+
+
+class CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class GaugeValue(CounterValue):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> "Timer":
+        return Timer(self)
+
+
+class Timer:
+    """
+    Context manager que observa no histograma quanto tempo o bloco levou.
+    """
+
+    __slots__ = ("histogram", "started_at")
+
+    def __init__(self, histogram: HistogramValue) -> None:
+        self.histogram = histogram
+        self.started_at = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.started_at)
+
+
+class Metric:
+    """
+    Uma métrica com (opcionalmente) labels. Cada combinação de valores
+    das labels tem seu próprio valor, criado no primeiro `labels()`.
+
+    No caminho dos eventos o ideal é guardar o retorno de `labels()`
+    (ex: em uma constante do módulo) e usar direto o `inc()`/`observe()`
+    dele, que é apenas uma soma.
+    """
+
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: "Registry" = None,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values: str) -> Any:
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} espera as labels {self.labelnames}"
+                )
+            value = self._values[values] = self._new_value()
+        return value
+
+    def _new_value(self) -> Any:
+        raise NotImplementedError
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        for values, value in self._values.items():
+            yield "", dict(zip(self.labelnames, values)), value.value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_value(self) -> CounterValue:
+        return CounterValue()
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_value(self) -> GaugeValue:
+        return GaugeValue()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: "Registry" = None,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        for values, value in self._values.items():
+            labels = dict(zip(self.labelnames, values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, value.counts):
+                cumulative += count
+                yield "_bucket", {**labels, "le": _format(bound)}, cumulative
+            yield "_bucket", {**labels, "le": "+Inf"}, value.count
+            yield "_sum", labels, value.sum
+            yield "_count", labels, value.count
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self, extra: Iterable[MetricFamily] = ()) -> str:
+        """
+        Gera o texto no formato de exposição do Prometheus (0.0.4) com as
+        métricas registradas e as métricas de `extra`.
+        """
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            _render_header(
+                lines, metric.name, metric.type, metric.documentation
+            )
+            for suffix, labels, value in metric.samples():
+                lines.append(
+                    _render_sample(metric.name + suffix, labels, value)
+                )
+        for family in extra:
+            _render_header(
+                lines, family.name, family.type, family.documentation
+            )
+            for labels, value in family.samples:
+                lines.append(_render_sample(family.name, labels, value))
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _render_header(
+    lines: List[str], name: str, type_: str, documentation: str
+) -> None:
+    documentation = documentation.replace("\\", r"\\").replace("\n", r"\n")
+    lines.append(f"# HELP {name} {documentation}")
+    lines.append(f"# TYPE {name} {type_}")
+
+
+def _render_sample(name: str, labels: Labels, value: float) -> str:
+    if not labels:
+        return f"{name} {_format(value)}"
+    rendered = ",".join(
+        f'{label}="{_escape(str(label_value))}"'
+        for label, label_value in labels.items()
+    )
+    return f"{name}{{{rendered}}} {_format(value)}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+EVENTS_RECEIVED = Counter(
+    "indexer_mesos_events_received_total",
+    "Eventos recebidos do stream do mesos, por tipo",
+    ("type",),
+)
+
+STAGE_DURATION = Histogram(
+    "indexer_stage_duration_seconds",
+    "Tempo gasto em cada estágio do processamento de um evento",
+    ("stage",),
+)
+PARSE_DURATION = STAGE_DURATION.labels("parse")
+CONVERT_DURATION = STAGE_DURATION.labels("convert")
+ENRICH_DURATION = STAGE_DURATION.labels("enrich")
+WRITE_DURATION = STAGE_DURATION.labels("write")
+
+ENRICH_ERRORS = Counter(
+    "indexer_enrich_errors_total",
+    "Eventos escritos sem enriquecimento porque o enriquecimento falhou",
+).labels()
+
+OUTPUT_WRITE_DURATION = Histogram(
+    "indexer_output_write_duration_seconds",
+    "Tempo gasto pelo writer de cada output para escrever um lote de eventos",
+    ("output",),
+)
+
+EVENT_LAG = Histogram(
+    "indexer_event_lag_seconds",
+    "Atraso entre o timestamp do status da task no mesos e a confirmação "
+    "da escrita do evento em cada output",
+    ("output",),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+
+HTTP_REQUESTS = Counter(
+    "indexer_http_client_requests_total",
+    "Requests feitos para o mesos master, para os agents e para o "
+    "ElasticSearch, por status da resposta",
+    ("target", "status"),
+)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "indexer_http_client_request_duration_seconds",
+    "Latência dos requests feitos para o mesos master, para os agents e "
+    "para o ElasticSearch",
+    ("target",),
+)
+
+
+def observe_request(target: str, status: str, duration: float) -> None:
+    HTTP_REQUESTS.labels(target, status).inc()
+    HTTP_REQUEST_DURATION.labels(target).observe(duration)
+
+
+def http_trace_config(target: Callable[[URL], str]) -> TraceConfig:
+    """
+    TraceConfig para uma ClientSession do aiohttp que registra a quantidade
+    e a latência (até receber os headers da resposta) de todos os requests.
+    O `target` diz, a partir da URL, para quem o request foi feito.
+    """
+
+    async def on_request_start(session, ctx, params) -> None:
+        ctx.started_at = asyncio.get_event_loop().time()
+
+    async def on_request_end(session, ctx, params) -> None:
+        _observe_trace(ctx, params.url, str(params.response.status))
+
+    async def on_request_exception(session, ctx, params) -> None:
+        _observe_trace(ctx, params.url, "error")
+
+    def _observe_trace(ctx, url: URL, status: str) -> None:
+        duration = asyncio.get_event_loop().time() - ctx.started_at
+        observe_request(target(url), status, duration)
+
+    trace_config = TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
@@ -87,6 +87,21 @@ class ContainerInfoSpec(BaseModel):
     labels: List[ContainerInfoLabelsItemSpec]
 
 
+class IngestInfoSpec(BaseModel):
+    """
+    Quando (ISO 8601, UTC) o evento passou por cada estágio do indexer:
+     - received_at: saiu do parser do stream de eventos;
+     - converted_at: foi convertido para o model Event;
+     - enriched_at: terminou o enriquecimento (stdout/stderr da task);
+     - sent_at: foi colocado no request enviado para o output.
+    """
+
+    received_at: Optional[str]
+    converted_at: Optional[str]
+    enriched_at: Optional[str]
+    sent_at: Optional[str]
+
+
 class Event(BaseModel):
     id: str
     date: str
@@ -100,3 +115,4 @@ class Event(BaseModel):
     status: TaskStatus
     error: Optional[ErrorSpec]
     message: Optional[str]
+    ingest: Optional[IngestInfoSpec]
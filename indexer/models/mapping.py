@@ -0,0 +1,59 @@
+from enum import Enum
+from typing import Any, Dict, Type
+
+from pydantic import BaseModel
+from pydantic.fields import Field
+
+KEYWORD = {"type": "keyword", "ignore_above": 1024}
+
+SCALAR_MAPPINGS: Dict[type, Dict[str, Any]] = {
+    bool: {"type": "boolean"},
+    int: {"type": "long"},
+    float: {"type": "double"},
+    str: KEYWORD,
+}
+
+
+def model_mapping(
+    model: Type[BaseModel], overrides: Dict[str, Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Gera o mapping do ElasticSearch a partir dos campos de um model pydantic.
+
+    Strings e Enums viram `keyword`. Listas de models viram objetos com os
+    campos do model. `overrides` permite trocar o mapping de um campo
+    específico, usando o caminho completo dele (ex: `task.stdout`).
+    """
+    return {"properties": _properties(model, overrides or {}, prefix="")}
+
+
+def _properties(
+    model: Type[BaseModel], overrides: Dict[str, Dict[str, Any]], prefix: str
+) -> Dict[str, Any]:
+    properties: Dict[str, Any] = {}
+    for name, field in model.__fields__.items():
+        path = f"{prefix}{name}"
+        if path in overrides:
+            properties[name] = dict(overrides[path])
+            continue
+        field_type = _field_type(field)
+        if issubclass(field_type, BaseModel):
+            properties[name] = {
+                "properties": _properties(field_type, overrides, f"{path}.")
+            }
+        elif issubclass(field_type, Enum):
+            properties[name] = dict(KEYWORD)
+        else:
+            properties[name] = dict(SCALAR_MAPPINGS[field_type])
+    return properties
+
+
+def _field_type(field: Field) -> type:
+    """
+    Para campos `Optional[X]` o pydantic guarda o `X` em um dos sub_fields.
+    """
+    if field.sub_fields:
+        for sub_field in field.sub_fields:
+            if sub_field.type_ is not type(None):
+                return _field_type(sub_field)
+    return field.type_
@@ -0,0 +1,178 @@
+import asyncio
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from types import FrameType
+from typing import Dict, List, Optional
+
+from indexer.conf import logger
+from indexer.metrics import Histogram
+
+EVENT_LOOP_LAG = Histogram(
+    "indexer_event_loop_lag_seconds",
+    "Atraso do event loop medido enquanto um profile está rodando",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+).labels()
+
+
+class ProfilerAlreadyRunning(Exception):
+    pass
+
+
+class Profiler:
+    """
+    Profile por amostragem do event loop, ligado apenas por um tempo
+    limitado (ver `start()`).
+
+    Uma thread separada olha, a cada `interval` segundos, a pilha de
+    chamadas da thread do event loop e conta quantas vezes cada pilha
+    apareceu. No final é gravado um arquivo no formato "collapsed stacks"
+    (uma pilha por linha, `f1;f2;f3 <amostras>`), que pode ser aberto com o
+    flamegraph.pl, speedscope etc.
+
+    Enquanto o profile roda também medimos o atraso do event loop: uma task
+    que acorda a cada `lag_interval` segundos mede quanto acordou atrasada.
+    Atrasos a partir de `lag_threshold` segundos são logados junto com a
+    pilha mais amostrada desde a medição anterior, que é a do callback que
+    segurou o event loop.
+
+    Quando não há profile rodando não existe nem a thread nem a task, então
+    o custo para o resto do indexer é zero.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        interval: float,
+        lag_interval: float,
+        lag_threshold: float,
+    ) -> None:
+        self.directory = directory
+        self.interval = interval
+        self.lag_interval = lag_interval
+        self.lag_threshold = lag_threshold
+        self.path: Optional[str] = None
+        self.slow_callbacks = 0
+        self._stacks: Dict[str, int] = Counter()
+        self._recent_stacks: Dict[str, int] = Counter()
+        self._stop_sampling = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._lag_monitor: Optional[asyncio.Future] = None
+        self._timeout: Optional[asyncio.Handle] = None
+
+    @property
+    def running(self) -> bool:
+        return self._sampler is not None
+
+    def start(self, duration: float) -> str:
+        """
+        Começa um profile que termina sozinho depois de `duration` segundos.
+        Devolve o caminho do arquivo que será gravado.
+        """
+        if self.running:
+            raise ProfilerAlreadyRunning(self.path)
+        os.makedirs(self.directory, exist_ok=True)
+        started_at = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+        self.path = os.path.join(
+            self.directory, f"profile-{started_at}.collapsed"
+        )
+        self.slow_callbacks = 0
+        self._stacks = Counter()
+        self._recent_stacks = Counter()
+        self._stop_sampling.clear()
+        self._sampler = threading.Thread(
+            target=self._sample,
+            args=(threading.get_ident(),),
+            name="indexer-profiler",
+            daemon=True,
+        )
+        self._sampler.start()
+
+        loop = asyncio.get_event_loop()
+        self._lag_monitor = asyncio.ensure_future(self._monitor_lag())
+        self._timeout = loop.call_later(duration, self.stop)
+        return self.path
+
+    def stop(self) -> Optional[str]:
+        """
+        Termina o profile atual (se existir) e grava o arquivo.
+        """
+        if not self._sampler:
+            return None
+        self._stop_sampling.set()
+        self._sampler.join()
+        self._sampler = None
+        if self._lag_monitor:
+            self._lag_monitor.cancel()
+            self._lag_monitor = None
+        if self._timeout:
+            self._timeout.cancel()
+            self._timeout = None
+
+        path: str = self.path  # type: ignore
+        with open(path, "w") as f:
+            for stack, count in sorted(self._stacks.items()):
+                f.write(f"{stack} {count}\n")
+        asyncio.ensure_future(
+            logger.info(
+                {
+                    "event": "profile-written",
+                    "file": path,
+                    "samples": sum(self._stacks.values()),
+                    "slow-callbacks": self.slow_callbacks,
+                }
+            )
+        )
+        return path
+
+    def toggle(self, duration: float) -> None:
+        """
+        Usado pelo handler do sinal: começa um profile ou, se já existir um
+        rodando, termina ele antes do tempo.
+        """
+        if self.running:
+            self.stop()
+        else:
+            self.start(duration)
+
+    def _sample(self, thread_id: int) -> None:
+        while not self._stop_sampling.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                return
+            stack = collapse_stack(frame)
+            self._stacks[stack] += 1
+            self._recent_stacks[stack] += 1
+
+    async def _monitor_lag(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, loop.time() - expected)
+            recent, self._recent_stacks = self._recent_stacks, Counter()
+            EVENT_LOOP_LAG.observe(lag)
+            if lag >= self.lag_threshold:
+                self.slow_callbacks += 1
+                stack: Optional[str] = None
+                if recent:
+                    stack = max(recent, key=lambda s: recent[s])
+                await logger.error(
+                    {"event": "event-loop-lag", "lag": lag, "stack": stack}
+                )
+
+
+def collapse_stack(frame: Optional[FrameType]) -> str:
+    """
+    Pilha de chamadas a partir de `frame`, da chamada mais externa para a
+    mais interna, separada por `;`.
+    """
+    names: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename or "")
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
@@ -0,0 +1,284 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+Position = Tuple[int, int, int]
+
+
+class SegmentSpool:
+    """
+    Fila FIFO de records (bytes) guardada em disco, em arquivos (segmentos)
+    append-only dentro de `directory`.
+
+    Cada record é gravado como `tamanho (4 bytes) + crc32 (4 bytes) + dados`.
+    Um record incompleto ou com crc inválido (ex: o processo morreu no meio
+    de uma escrita) encerra a leitura daquele segmento.
+
+    O fsync é feito em lotes: quando `fsync_bytes` bytes foram escritos ou
+    `fsync_interval` segundos se passaram desde o último fsync.
+
+    A leitura é feita com mmap e não remove os records: `read()` avança uma
+    posição de leitura e `ack()` confirma tudo o que foi lido até ali, apagando
+    os segmentos já consumidos e gravando a posição no arquivo `cursor`, que é
+    de onde a leitura recomeça quando o spool é aberto de novo. `rewind()`
+    volta a posição de leitura para o último `ack()`.
+
+    Quando os segmentos passam de `max_bytes`, os mais antigos são
+    descartados, mesmo que ainda não tenham sido lidos.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int,
+        max_bytes: int,
+        fsync_interval: float,
+        fsync_bytes: int,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.fsync_bytes = fsync_bytes
+        self.dropped_segments = 0
+        self._clock = clock
+        self._records: Dict[int, int] = {}
+        self._sizes: Dict[int, int] = {}
+        self._map: Optional[Tuple[int, mmap.mmap]] = None
+
+        self._cursor = self._load_cursor()
+        for segment_id in self._existing_segments():
+            if segment_id < self._cursor[0]:
+                os.unlink(self._segment_path(segment_id))
+                continue
+            self._sizes[segment_id] = os.path.getsize(
+                self._segment_path(segment_id)
+            )
+            self._records[segment_id] = sum(
+                1 for _ in self._scan(segment_id, 0)
+            )
+        self._read_pos = self._cursor
+
+        self._write_id = max(max(self._records, default=0), self._cursor[0]) + 1
+        self._write_fd = -1
+        self._open_write_segment(self._write_id)
+        self._unsynced_bytes = 0
+        self._last_sync = self._clock()
+
+    def append(self, record: bytes, sync: bool = True) -> None:
+        """
+        Com `sync=False` o fsync do lote fica a cargo de quem chamou (ver
+        self.sync_due() e self.detach_sync()).
+        """
+        data = HEADER.pack(len(record), zlib.crc32(record)) + record
+        if self._sizes[self._write_id] and (
+            self._sizes[self._write_id] + len(data) > self.segment_size
+        ):
+            self._rotate()
+        self._enforce_max_bytes(len(data))
+
+        os.write(self._write_fd, data)
+        self._sizes[self._write_id] += len(data)
+        self._records[self._write_id] += 1
+        self._unsynced_bytes += len(data)
+        if sync and self.sync_due():
+            self.sync()
+
+    def read(self, max_records: int) -> List[bytes]:
+        records: List[bytes] = []
+        segment_id, offset, index = self._read_pos
+        while len(records) < max_records:
+            if segment_id not in self._records:
+                if segment_id >= self._write_id:
+                    break
+                segment_id, offset, index = segment_id + 1, 0, 0
+                continue
+            for offset, record in self._scan(segment_id, offset):
+                records.append(record)
+                index += 1
+                if len(records) == max_records:
+                    break
+            if len(records) == max_records or segment_id == self._write_id:
+                break
+            segment_id, offset, index = segment_id + 1, 0, 0
+        self._read_pos = (segment_id, offset, index)
+        return records
+
+    def ack(self) -> None:
+        self._cursor = self._read_pos
+        for segment_id in sorted(self._records):
+            if segment_id >= self._cursor[0]:
+                break
+            self._delete_segment(segment_id)
+        self._save_cursor()
+
+    def rewind(self) -> None:
+        self._read_pos = self._cursor
+
+    def sync_due(self) -> bool:
+        return self._unsynced_bytes > 0 and (
+            self._unsynced_bytes >= self.fsync_bytes
+            or self._clock() - self._last_sync >= self.fsync_interval
+        )
+
+    def sync(self) -> None:
+        os.fsync(self._write_fd)
+        self._unsynced_bytes = 0
+        self._last_sync = self._clock()
+
+    def detach_sync(self) -> int:
+        """
+        Para fazer o fsync em outra thread: devolve uma cópia (dup) do
+        descritor do segmento atual, que deve ser passada para
+        fsync_and_close(), e já considera sincronizado o que foi escrito até
+        aqui. A cópia continua válida mesmo que o segmento seja fechado
+        (rotação) antes do fsync terminar.
+        """
+        fd = os.dup(self._write_fd)
+        self._unsynced_bytes = 0
+        self._last_sync = self._clock()
+        return fd
+
+    def close(self) -> None:
+        self.sync()
+        os.close(self._write_fd)
+        self._close_map()
+
+    def size(self) -> int:
+        return sum(self._sizes.values())
+
+    def __len__(self) -> int:
+        """
+        Quantidade de records ainda não confirmados com `ack()`.
+        """
+        segment_id, _, index = self._cursor
+        pending = sum(
+            count
+            for other_id, count in self._records.items()
+            if other_id >= segment_id
+        )
+        if segment_id in self._records:
+            pending -= index
+        return pending
+
+    def _scan(
+        self, segment_id: int, offset: int
+    ) -> Iterator[Tuple[int, bytes]]:
+        """
+        Percorre os records do segmento a partir de `offset`, devolvendo
+        o offset do próximo record e o conteúdo de cada um.
+        """
+        data = self._mmap(segment_id)
+        if data is None:
+            return
+        while offset + HEADER.size <= len(data):
+            length, crc = HEADER.unpack(data[offset : offset + HEADER.size])
+            start = offset + HEADER.size
+            record = data[start : start + length]
+            if len(record) < length or zlib.crc32(record) != crc:
+                return
+            offset = start + length
+            yield offset, record
+
+    def _mmap(self, segment_id: int) -> Optional[mmap.mmap]:
+        """
+        Mantém aberto o mmap do segmento sendo lido. Se o segmento cresceu
+        (é o segmento onde estamos escrevendo) o mmap é refeito.
+        """
+        size = self._sizes.get(segment_id, 0)
+        if (
+            self._map
+            and self._map[0] == segment_id
+            and len(self._map[1]) == size
+        ):
+            return self._map[1]
+        self._close_map()
+        if not size:
+            return None
+        with open(self._segment_path(segment_id), "rb") as f:
+            data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        self._map = (segment_id, data)
+        return data
+
+    def _close_map(self) -> None:
+        if self._map:
+            self._map[1].close()
+            self._map = None
+
+    def _rotate(self) -> None:
+        self.sync()
+        os.close(self._write_fd)
+        self._write_id += 1
+        self._open_write_segment(self._write_id)
+
+    def _open_write_segment(self, segment_id: int) -> None:
+        self._write_fd = os.open(
+            self._segment_path(segment_id),
+            os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+            0o644,
+        )
+        self._records[segment_id] = 0
+        self._sizes[segment_id] = 0
+
+    def _enforce_max_bytes(self, incoming: int) -> None:
+        while self.size() + incoming > self.max_bytes:
+            oldest = min(self._records)
+            if oldest == self._write_id:
+                return
+            self._delete_segment(oldest)
+            self.dropped_segments += 1
+            next_position = (oldest + 1, 0, 0)
+            if self._cursor[0] <= oldest:
+                self._cursor = next_position
+                self._save_cursor()
+            if self._read_pos[0] <= oldest:
+                self._read_pos = next_position
+
+    def _delete_segment(self, segment_id: int) -> None:
+        if self._map and self._map[0] == segment_id:
+            self._close_map()
+        os.unlink(self._segment_path(segment_id))
+        del self._records[segment_id]
+        del self._sizes[segment_id]
+
+    def _existing_segments(self) -> List[int]:
+        return sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(
+            self.directory, f"{segment_id:020d}{SEGMENT_SUFFIX}"
+        )
+
+    def _load_cursor(self) -> Position:
+        path = os.path.join(self.directory, CURSOR_FILE)
+        if not os.path.exists(path):
+            return (0, 0, 0)
+        with open(path) as f:
+            segment_id, offset, index = f.read().split()
+        return (int(segment_id), int(offset), int(index))
+
+    def _save_cursor(self) -> None:
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            f.write(" ".join(str(value) for value in self._cursor))
+        os.replace(f"{path}.tmp", path)
+
+
+def fsync_and_close(fd: int) -> None:
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
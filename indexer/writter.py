@@ -1,32 +1,484 @@
+import asyncio
+import json
+import zlib
 from datetime import datetime, timezone
-from typing import List
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from aioelasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConnectionError, TransportError
 
-from indexer.conf import logger
+from indexer.backoff import ExponentialBackoff
+from indexer.conf import logger, settings
 from indexer.connection import HTTPConnection
+from indexer.metrics import observe_request
 from indexer.models.event import Event
+from indexer.models.mapping import model_mapping
+
+INDEX_PREFIX = "asgard-events"
+
+NOT_INDEXED_TEXT = {"type": "text", "index": False}
+
+EVENT_MAPPING_OVERRIDES: Dict[str, Dict[str, Any]] = {
+    "date": {"type": "date"},
+    "ingest.received_at": {"type": "date"},
+    "ingest.converted_at": {"type": "date"},
+    "ingest.enriched_at": {"type": "date"},
+    "ingest.sent_at": {"type": "date"},
+    "task.stdout": NOT_INDEXED_TEXT,
+    "task.stderr": NOT_INDEXED_TEXT,
+}
 
 
 class OutputWritter:
+    """
+    Todo writer deve chamar self.acknowledge() quando o output confirmar a
+    escrita. É isso que conta os eventos como escritos.
+    """
+
+    ack_callback: Optional[Callable[[List[Event]], None]] = None
+    error_callback: Optional[Callable[[int], None]] = None
+
     async def write(self, events: List[Event]) -> None:
         for e in events:
             await logger.info(e.dict())
+        self.acknowledge(events)
+
+    def acknowledge(self, events: List[Event]) -> None:
+        """
+        Avisa que o output confirmou a escrita desses eventos.
+        """
+        if self.ack_callback:
+            self.ack_callback(events)
+
+    def report_error(self, count: int) -> None:
+        """
+        Avisa que uma escrita feita fora de uma chamada ao write() ou ao
+        flush() (ex: um flush em background) falhou, onde não há para quem
+        lançar a exception. `count` é quantos eventos foram descartados
+        nessa falha; pode ser 0 se o writer guardou todos para tentar de
+        novo.
+        """
+        if self.error_callback:
+            self.error_callback(count)
+
+    def pending(self) -> int:
+        """
+        Quantos eventos foram aceitos pelo write() e ainda não foram
+        confirmados.
+        """
+        return 0
+
+    def discard(self) -> None:
+        """
+        Esquece os eventos que ainda não foram confirmados. Usado quando
+        quem chamou o write() vai enviar esses eventos de novo.
+        """
+        pass
+
+    async def flush(self) -> None:
+        """
+        Writers que acumulam eventos devem enviar tudo o que têm
+        guardado quando esse método for chamado.
+        """
+        pass
+
+
+class OutputWriteError(Exception):
+    """
+    Falha de um writer que guarda o que não conseguiu escrever para tentar
+    de novo. Só os `dropped` eventos foram descartados de vez; os outros
+    continuam pendentes no writer e vão ser confirmados (ou descartados)
+    por um flush futuro.
+    """
+
+    def __init__(self, message: str, dropped: int = 0) -> None:
+        super().__init__(message)
+        self.dropped = dropped
 
 
 class ElasticSearchOutputWritter(OutputWritter):
+    """
+    Acumula os eventos e indexa todos em um único request `_bulk`.
+    O buffer é enviado quando atinge settings.ES_BULK_SIZE eventos,
+    settings.ES_BULK_MAX_BYTES bytes ou quando o evento mais antigo do
+    buffer está esperando há settings.ES_BULK_LINGER segundos.
+
+    O `_id` de cada documento é o id do evento, que é determinístico. Por isso
+    um request que falhou pode ser reenviado sem criar documentos duplicados.
+    Quando um flush desiste por causa de erros temporários (timeout, conexão,
+    429 ou 5xx) os itens voltam para o buffer e um novo flush é agendado
+    para daqui a settings.ES_BULK_LINGER segundos. Itens que o ES recusa de
+    vez (ex: 400) não são confirmados e contam como descartados no
+    OutputWriteError.
+
+    Por padrão cada evento vai para o índice da hora em que ele aconteceu
+    (`asgard-events-YYYY-MM-DD-HH`). Se settings.ES_ROLLOVER_ALIAS estiver
+    definido, todos os eventos são escritos nesse alias e o índice por trás
+    dele é trocado (rollover) quando atinge settings.ES_ROLLOVER_MAX_DOCS
+    documentos ou settings.ES_ROLLOVER_MAX_SIZE.
+    """
+
+    RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
     def __init__(self, conn: HTTPConnection) -> None:
         self.conn = conn
         self.client = Elasticsearch(hosts=conn.urls)
+        self._buffer: List[str] = []
+        self._buffer_events: List[Event] = []
+        self._buffer_bytes = 0
+        self._sending = 0
+        self._flush_lock = asyncio.Lock()
+        self._linger_task: Optional[asyncio.Future] = None
+        self._ready = False
+        self._last_rollover_check = 0.0
 
     async def write(self, events: List[Event]) -> None:
-        doc_body = {
-            **events[0].dict(),
-            "@timestamp": datetime.now(timezone.utc).isoformat(),
+        for event in events:
+            self._append(event)
+
+        if (
+            len(self._buffer) >= settings.ES_BULK_SIZE
+            or self._buffer_bytes >= settings.ES_BULK_MAX_BYTES
+        ):
+            await self.flush()
+        elif self._buffer:
+            self._flush_later()
+
+    def pending(self) -> int:
+        return len(self._buffer) + self._sending
+
+    def discard(self) -> None:
+        if self._linger_task:
+            self._linger_task.cancel()
+            self._linger_task = None
+        self._buffer, self._buffer_events = [], []
+        self._buffer_bytes = 0
+
+    def _append(self, event: Event) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        doc_body: Dict[str, Any] = {**event.dict(), "@timestamp": now}
+        if event.ingest:
+            doc_body["ingest"] = {**doc_body["ingest"], "sent_at": now}
+        action = {
+            "index": {
+                "_index": self._get_index_name(event),
+                "_type": "event",
+                "_id": event.id,
+            }
         }
-        await self.client.index(self._get_index_name(), "event", doc_body)
+        bulk_item = f"{json.dumps(action)}\n{json.dumps(doc_body)}\n"
+        self._buffer.append(bulk_item)
+        self._buffer_events.append(event)
+        self._buffer_bytes += len(bulk_item)
+
+    async def flush(self) -> None:
+        """
+        Envia tudo o que está no buffer em um único request `_bulk`.
+        """
+        if self._linger_task:
+            self._linger_task.cancel()
+            self._linger_task = None
+
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            items, events = self._buffer, self._buffer_events
+            self._buffer, self._buffer_events = [], []
+            self._buffer_bytes = 0
+            self._sending = len(items)
+            try:
+                await self._ensure_ready()
+                not_indexed, rejected = await self._send_bulk(items)
+            except (ConnectionError, TransportError) as e:
+                if not self._is_retryable_error(e):
+                    raise OutputWriteError(str(e), dropped=len(items)) from e
+                self._requeue(items, events)
+                self._flush_later()
+                raise OutputWriteError(str(e)) from e
+            except asyncio.CancelledError:
+                self._requeue(items, events)
+                raise
+            finally:
+                self._sending = 0
+
+            not_acked = set(not_indexed) | set(rejected)
+            self.acknowledge(
+                [event for i, event in enumerate(events) if i not in not_acked]
+            )
+            if not_indexed:
+                self._requeue(
+                    [items[i] for i in not_indexed],
+                    [events[i] for i in not_indexed],
+                )
+                self._flush_later()
+            if not_acked:
+                raise OutputWriteError(
+                    f"{len(not_indexed)} items not indexed, "
+                    f"{len(rejected)} rejected",
+                    dropped=len(rejected),
+                )
+            await self._maybe_rollover()
+
+    def _requeue(self, items: List[str], events: List[Event]) -> None:
+        self._buffer[:0] = items
+        self._buffer_events[:0] = events
+        self._buffer_bytes += sum(len(item) for item in items)
+
+    def _flush_later(self) -> None:
+        if not self._linger_task:
+            self._linger_task = asyncio.ensure_future(self._flush_on_linger())
+
+    async def _ensure_ready(self) -> None:
+        """
+        Prepara o cluster antes do primeiro request `_bulk`. Falhas aqui são
+        logadas mas não impedem a indexação; a preparação é tentada de novo
+        no próximo flush até dar certo.
+        """
+        if self._ready:
+            return
+        self._ready = (
+            await self._install_index_template()
+            and await self._bootstrap_rollover_alias()
+        )
+
+    async def _bootstrap_rollover_alias(self) -> bool:
+        alias = settings.ES_ROLLOVER_ALIAS
+        if not alias:
+            return True
+        try:
+            if not await self.client.indices.exists_alias(name=alias):
+                await self.client.indices.create(
+                    index=f"{alias}-000001",
+                    body={"aliases": {alias: {}}},
+                    ignore=400,
+                )
+        except TransportError as e:
+            await logger.exception(
+                {
+                    "event": "elasticsearch-rollover-bootstrap-error",
+                    "alias": alias,
+                    "exc": str(e),
+                }
+            )
+            return False
+        return True
+
+    async def _install_index_template(self) -> bool:
+        """
+        Instala o template com o mapping dos eventos, no formato que a
+        versão do cluster espera. O template só é enviado se a versão
+        instalada for diferente da atual.
+        """
+        name = settings.ES_TEMPLATE_NAME
+        try:
+            info = await self.client.info()
+            template = index_template(
+                es_major_version=int(info["version"]["number"].split(".")[0])
+            )
+            current = await self.client.indices.get_template(
+                name=name, ignore=404
+            )
+            if current.get(name, {}).get("version") == template["version"]:
+                return True
+            await self.client.indices.put_template(name=name, body=template)
+        except TransportError as e:
+            await logger.exception(
+                {
+                    "event": "elasticsearch-template-error",
+                    "template": name,
+                    "exc": str(e),
+                }
+            )
+            return False
+        await logger.info(
+            {
+                "event": "elasticsearch-template-installed",
+                "template": name,
+                "version": template["version"],
+            }
+        )
+        return True
+
+    async def _maybe_rollover(self) -> None:
+        alias = settings.ES_ROLLOVER_ALIAS
+        if not alias:
+            return
+        now = asyncio.get_event_loop().time()
+        if (
+            now - self._last_rollover_check
+            < settings.ES_ROLLOVER_CHECK_INTERVAL
+        ):
+            return
+        self._last_rollover_check = now
+
+        conditions: Dict[str, Any] = {"max_docs": settings.ES_ROLLOVER_MAX_DOCS}
+        if settings.ES_ROLLOVER_MAX_SIZE:
+            conditions["max_size"] = settings.ES_ROLLOVER_MAX_SIZE
+        try:
+            result = await self.client.indices.rollover(
+                alias=alias, body={"conditions": conditions}
+            )
+        except TransportError as e:
+            await logger.exception(
+                {
+                    "event": "elasticsearch-rollover-error",
+                    "alias": alias,
+                    "exc": str(e),
+                }
+            )
+            return
+        if result.get("rolled_over"):
+            await logger.info(
+                {
+                    "event": "elasticsearch-rollover",
+                    "alias": alias,
+                    "old-index": result.get("old_index"),
+                    "new-index": result.get("new_index"),
+                }
+            )
+
+    async def _send_bulk(self, items: List[str]) -> Tuple[List[int], List[int]]:
+        """
+        Envia os itens e, em caso de falha temporária (timeout, conexão,
+        429 ou 5xx), tenta de novo com backoff exponencial. Quando o request
+        é aceito mas apenas alguns itens falharam, reenviamos só esses itens.
+
+        Devolve as posições (em `items`) dos itens que ainda falhavam com
+        erro temporário na última tentativa e dos itens que o ES recusou de
+        vez (ex: 400).
+        """
+        backoff = ExponentialBackoff(
+            base=settings.ES_BULK_RETRY_BACKOFF_BASE,
+            cap=settings.ES_BULK_RETRY_BACKOFF_MAX,
+        )
+        loop = asyncio.get_event_loop()
+        pending = list(range(len(items)))
+        rejected: List[int] = []
+        for attempt in range(settings.ES_BULK_MAX_RETRIES + 1):
+            last_attempt = attempt == settings.ES_BULK_MAX_RETRIES
+            started_at = loop.time()
+            try:
+                response = await self.client.bulk(
+                    body="".join(items[i] for i in pending)
+                )
+            except (ConnectionError, TransportError) as e:
+                status = e.status_code
+                observe_request(
+                    "elasticsearch",
+                    str(status) if isinstance(status, int) else "error",
+                    loop.time() - started_at,
+                )
+                if last_attempt or not self._is_retryable_error(e):
+                    raise
+                await logger.error(
+                    {
+                        "event": "elasticsearch-bulk-request-error",
+                        "exc": str(e),
+                        "attempt": attempt,
+                    }
+                )
+            else:
+                observe_request(
+                    "elasticsearch", "200", loop.time() - started_at
+                )
+                if not response.get("errors"):
+                    return [], rejected
+                pending, failed = await self._failed_items(pending, response)
+                rejected.extend(failed)
+                if not pending or last_attempt:
+                    return pending, rejected
+            await asyncio.sleep(backoff.next_delay())
+        return pending, rejected
+
+    def _is_retryable_error(self, e: TransportError) -> bool:
+        return (
+            isinstance(e, ConnectionError)
+            or e.status_code in self.RETRYABLE_STATUS
+        )
+
+    async def _failed_items(
+        self, items: List[int], response: Dict[str, Any]
+    ) -> Tuple[List[int], List[int]]:
+        """
+        Separa os itens com erro entre os que devem ser reenviados e os que
+        não adianta reenviar (ex: 400), que também são logados.
+        """
+        to_retry: List[int] = []
+        rejected: List[int] = []
+        for item, result in zip(items, response["items"]):
+            result = result["index"]
+            if not result.get("error"):
+                continue
+            if result.get("status") in self.RETRYABLE_STATUS:
+                to_retry.append(item)
+                continue
+            rejected.append(item)
+            await logger.error(
+                {
+                    "event": "elasticsearch-bulk-item-error",
+                    "index": result.get("_index"),
+                    "status": result.get("status"),
+                    "error": result["error"],
+                }
+            )
+        return to_retry, rejected
+
+    async def _flush_on_linger(self) -> None:
+        await asyncio.sleep(settings.ES_BULK_LINGER)
+        self._linger_task = None
+        try:
+            await self.flush()
+        except OutputWriteError as e:
+            await logger.exception(
+                {"event": "elasticsearch-bulk-flush-error", "exc": str(e)}
+            )
+            self.report_error(e.dropped)
+
+    def _get_index_name(self, event: Event) -> str:
+        if settings.ES_ROLLOVER_ALIAS:
+            return settings.ES_ROLLOVER_ALIAS
+        return hourly_index_name(event.date[:13])
+
+
+@lru_cache(maxsize=256)
+def hourly_index_name(date_hour: str) -> str:
+    """
+    Recebe o começo (`YYYY-MM-DDTHH`) da data ISO8601 de um evento, que é
+    sempre gerada em UTC pelos converters.
+    """
+    return f"{INDEX_PREFIX}-{date_hour.replace('T', '-')}"
+
+
+def index_template(es_major_version: int = 6) -> Dict[str, Any]:
+    """
+    Template aplicado a todos os índices de eventos. A versão é um checksum
+    do próprio template, então qualquer mudança no model `Event` ou nas
+    configurações gera uma versão nova.
+
+    Antes do ElasticSearch 6 o template aceita um único padrão (chave
+    `template`) em vez da lista `index_patterns`. Nesse caso usamos só o
+    padrão dos índices em que estamos escrevendo: os do rollover, se
+    settings.ES_ROLLOVER_ALIAS estiver definido, ou os por hora.
+    """
+    index_patterns = [f"{INDEX_PREFIX}-*"]
+    if settings.ES_ROLLOVER_ALIAS:
+        index_patterns.append(f"{settings.ES_ROLLOVER_ALIAS}-*")
+
+    mapping = model_mapping(Event, overrides=EVENT_MAPPING_OVERRIDES)
+    mapping["properties"]["@timestamp"] = {"type": "date"}
 
-    def _get_index_name(self):
-        date_part = datetime.utcnow()
-        date_str = date_part.strftime("%Y-%m-%d-%H")
-        return f"asgard-events-{date_str}"
+    template: Dict[str, Any] = {
+        "settings": {
+            "index.refresh_interval": settings.ES_INDEX_REFRESH_INTERVAL,
+            "index.number_of_replicas": settings.ES_INDEX_NUMBER_OF_REPLICAS,
+        },
+        "mappings": {"event": mapping},
+    }
+    if es_major_version < 6:
+        template["template"] = index_patterns[-1]
+    else:
+        template["index_patterns"] = index_patterns
+    checksum = zlib.crc32(json.dumps(template, sort_keys=True).encode())
+    template["version"] = checksum & 0x7FFFFFFF
+    return template
@@ -19,7 +19,9 @@ setup(
     author_email="dalton.matos@b2wdigital.com",
     license="MIT",
     classifiers=["Programming Language :: Python :: 3.7"],
-    packages=find_packages(exclude=["contrib", "docs", "tests*"]),
+    packages=find_packages(
+        exclude=["contrib", "docs", "tests*", "benchmarks*"]
+    ),
     test_suite="tests",
     install_requires=[],
     entry_points={},
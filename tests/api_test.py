@@ -0,0 +1,117 @@
+from aiohttp.test_utils import TestClient, TestServer
+from asynctest import mock
+
+from indexer import metrics
+from indexer.api.server import create_app
+from indexer.metrics import MetricFamily
+from indexer.profiling import ProfilerAlreadyRunning
+from tests.base import BaseTestCase
+
+
+class ApiTest(BaseTestCase):
+    async def setUp(self):
+        self.consumer = mock.Mock(
+            readiness=mock.Mock(
+                return_value={"subscribed": True, "output-stdout": True}
+            ),
+            output_lag=mock.Mock(return_value={"stdout": 1.5}),
+            metrics=mock.Mock(
+                return_value=[
+                    MetricFamily(
+                        "indexer_pipeline_queue_size",
+                        "gauge",
+                        "Fila",
+                        [({"queue": "work"}, 3.0)],
+                    )
+                ]
+            ),
+        )
+        self.profiler = mock.Mock(
+            start=mock.Mock(return_value="/tmp/profile.collapsed")
+        )
+        self.client = TestClient(
+            TestServer(create_app(self.consumer, self.profiler))
+        )
+        await self.client.start_server()
+
+    async def tearDown(self):
+        await self.client.close()
+
+    async def test_expose_registry_and_consumer_metrics(self):
+        metrics.EVENTS_RECEIVED.labels("TASK_ADDED").inc()
+        resp = await self.client.get("/metrics")
+        self.assertEqual(200, resp.status)
+        self.assertEqual(metrics.CONTENT_TYPE, resp.headers["Content-Type"])
+        body = await resp.text()
+        self.assertIn(
+            'indexer_mesos_events_received_total{type="TASK_ADDED"}', body
+        )
+        self.assertIn("# TYPE indexer_stage_duration_seconds histogram", body)
+        self.assertIn('indexer_pipeline_queue_size{queue="work"} 3.0', body)
+        self.consumer.metrics.assert_called_once_with()
+
+    async def test_live(self):
+        resp = await self.client.get("/health/live")
+        self.assertEqual(200, resp.status)
+        self.assertEqual({"alive": True}, await resp.json())
+
+    async def test_ready_when_all_checks_pass(self):
+        resp = await self.client.get("/health/ready")
+        self.assertEqual(200, resp.status)
+        self.assertEqual(
+            {
+                "ready": True,
+                "checks": {"subscribed": True, "output-stdout": True},
+                "lag-seconds": {"stdout": 1.5},
+            },
+            await resp.json(),
+        )
+
+    async def test_not_ready_when_any_check_fails(self):
+        self.consumer.readiness.return_value = {
+            "subscribed": False,
+            "output-stdout": True,
+        }
+        resp = await self.client.get("/health/ready")
+        self.assertEqual(503, resp.status)
+        data = await resp.json()
+        self.assertFalse(data["ready"])
+        self.assertEqual(
+            {"subscribed": False, "output-stdout": True}, data["checks"]
+        )
+
+    async def test_start_profile(self):
+        resp = await self.client.post("/debug/profile?duration=5")
+        self.assertEqual(202, resp.status)
+        self.assertEqual(
+            {"file": "/tmp/profile.collapsed", "duration": 5.0},
+            await resp.json(),
+        )
+        self.profiler.start.assert_called_once_with(5.0)
+
+    async def test_start_profile_with_invalid_duration(self):
+        resp = await self.client.post("/debug/profile?duration=abc")
+        self.assertEqual(400, resp.status)
+        self.profiler.start.assert_not_called()
+
+    async def test_start_profile_with_out_of_range_duration(self):
+        for duration in ("0", "-1", "nan", "inf", "301"):
+            with self.subTest(duration=duration):
+                resp = await self.client.post(
+                    f"/debug/profile?duration={duration}"
+                )
+                self.assertEqual(400, resp.status)
+        self.profiler.start.assert_not_called()
+
+    async def test_start_profile_while_another_is_running(self):
+        self.profiler.start.side_effect = ProfilerAlreadyRunning("/tmp/p")
+        resp = await self.client.post("/debug/profile")
+        self.assertEqual(409, resp.status)
+        self.assertEqual("/tmp/p", (await resp.json())["file"])
+
+    async def test_no_profile_endpoint_without_profiler(self):
+        client = TestClient(TestServer(create_app(self.consumer)))
+        await client.start_server()
+        resp = await client.post("/debug/profile")
+        self.assertEqual(404, resp.status)
+        await client.close()
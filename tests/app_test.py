@@ -1,22 +1,124 @@
+import asyncio
+import os
+import signal
+
 from asynctest import mock
 from asynctest.mock import CoroutineMock, MagicMock
 
 from indexer import app
-from indexer.conf import settings
+from indexer.conf import Settings, settings
 from indexer.connection import HTTPConnection
 from tests.base import BaseTestCase
 
 
 class AppTest(BaseTestCase):
+    async def setUp(self):
+        self.consumer_instance_mock = CoroutineMock(start=CoroutineMock())
+        self.runner_mock = CoroutineMock(cleanup=CoroutineMock())
+        self.start_api_mock = CoroutineMock(return_value=self.runner_mock)
+
     async def test_creates_a_consumer_with_correct_urls(self):
-        consumer_instance_mock = CoroutineMock(start=CoroutineMock())
         with mock.patch.object(
             app,
             "MesosEventConsumer",
-            MagicMock(return_value=consumer_instance_mock),
-        ) as consumer_mock:
+            MagicMock(return_value=self.consumer_instance_mock),
+        ) as consumer_mock, mock.patch.object(
+            app, "start_api", self.start_api_mock
+        ):
             await app.main()
-            consumer_instance_mock.start.assert_awaited()
+            self.consumer_instance_mock.start.assert_awaited()
             consumer_mock.assert_called_with(
                 HTTPConnection(urls=settings.MESOS_MASTER_URLS)
             )
+
+    async def test_starts_and_stops_api_server(self):
+        with mock.patch.object(
+            app,
+            "MesosEventConsumer",
+            MagicMock(return_value=self.consumer_instance_mock),
+        ), mock.patch.object(app, "start_api", self.start_api_mock):
+            await app.main()
+            self.start_api_mock.assert_awaited_with(
+                self.consumer_instance_mock,
+                settings.API_HOST,
+                settings.API_PORT,
+                None,
+            )
+            self.runner_mock.cleanup.assert_awaited()
+
+    async def test_expose_profiler_in_the_api_when_enabled(self):
+        with mock.patch.dict(os.environ, TEST_PROFILE_API_ENABLED="true"):
+            stub_settings = Settings()
+        with mock.patch.object(
+            app,
+            "MesosEventConsumer",
+            MagicMock(return_value=self.consumer_instance_mock),
+        ), mock.patch.object(
+            app, "start_api", self.start_api_mock
+        ), mock.patch.object(
+            app, "settings", stub_settings
+        ):
+            await app.main()
+        self.assertIsInstance(self.start_api_mock.call_args[0][3], app.Profiler)
+
+    async def test_toggle_profiler_on_sigusr1(self):
+        profiler_mock = mock.Mock()
+
+        async def send_signal():
+            os.kill(os.getpid(), signal.SIGUSR1)
+            await asyncio.sleep(0.01)
+
+        self.consumer_instance_mock.start.side_effect = send_signal
+        with mock.patch.object(
+            app,
+            "MesosEventConsumer",
+            MagicMock(return_value=self.consumer_instance_mock),
+        ), mock.patch.object(
+            app, "start_api", self.start_api_mock
+        ), mock.patch.object(
+            app, "Profiler", MagicMock(return_value=profiler_mock)
+        ):
+            await app.main()
+        profiler_mock.toggle.assert_called_once_with(settings.PROFILE_DURATION)
+        profiler_mock.stop.assert_called_once_with()
+
+    async def test_do_not_start_api_server_when_disabled(self):
+        with mock.patch.dict(os.environ, TEST_API_ENABLED="false"):
+            stub_settings = Settings()
+        with mock.patch.object(
+            app,
+            "MesosEventConsumer",
+            MagicMock(return_value=self.consumer_instance_mock),
+        ), mock.patch.object(
+            app, "start_api", self.start_api_mock
+        ), mock.patch.object(
+            app, "settings", stub_settings
+        ):
+            await app.main()
+            self.consumer_instance_mock.start.assert_awaited()
+            self.start_api_mock.assert_not_awaited()
+
+    async def test_replay_capture_files_instead_of_consuming_mesos(self):
+        with mock.patch.dict(
+            os.environ,
+            TEST_MESOS_REPLAY_FILES='["/tmp/a.capture", "/tmp/b.capture"]',
+            TEST_MESOS_REPLAY_SPEED="2.0",
+        ):
+            stub_settings = Settings()
+        with mock.patch.object(
+            app,
+            "ReplayConsumer",
+            MagicMock(return_value=self.consumer_instance_mock),
+        ) as replay_mock, mock.patch.object(
+            app, "MesosEventConsumer"
+        ) as consumer_mock, mock.patch.object(
+            app, "start_api", self.start_api_mock
+        ), mock.patch.object(
+            app, "settings", stub_settings
+        ):
+            await app.main()
+            replay_mock.assert_called_once_with(
+                ["/tmp/a.capture", "/tmp/b.capture"], speed=2.0
+            )
+            consumer_mock.assert_not_called()
+            self.consumer_instance_mock.start.assert_awaited()
@@ -0,0 +1,62 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from indexer.models.event import Event, TaskStatus
+from indexer.models.mapping import model_mapping
+from tests.base import BaseTestCase
+
+
+class ItemSpec(BaseModel):
+    name: str
+    size: int
+
+
+class DocumentSpec(BaseModel):
+    title: str
+    status: TaskStatus
+    ratio: float
+    active: bool
+    owner: Optional[ItemSpec]
+    items: List[ItemSpec]
+    body: Optional[str]
+
+
+class ModelMappingTest(BaseTestCase):
+    async def test_generate_mapping_from_model_fields(self):
+        keyword = {"type": "keyword", "ignore_above": 1024}
+        item = {"properties": {"name": keyword, "size": {"type": "long"}}}
+        self.assertEqual(
+            {
+                "properties": {
+                    "title": keyword,
+                    "status": keyword,
+                    "ratio": {"type": "double"},
+                    "active": {"type": "boolean"},
+                    "owner": item,
+                    "items": item,
+                    "body": keyword,
+                }
+            },
+            model_mapping(DocumentSpec),
+        )
+
+    async def test_override_nested_field_mapping(self):
+        mapping = model_mapping(
+            DocumentSpec,
+            overrides={"owner.name": {"type": "text", "index": False}},
+        )
+        self.assertEqual(
+            {"type": "text", "index": False},
+            mapping["properties"]["owner"]["properties"]["name"],
+        )
+        self.assertEqual(
+            {"type": "keyword", "ignore_above": 1024},
+            mapping["properties"]["items"]["properties"]["name"],
+        )
+
+    async def test_event_model_has_mapping_for_all_fields(self):
+        mapping = model_mapping(Event)
+        self.assertEqual(
+            set(Event.__fields__.keys()), set(mapping["properties"].keys())
+        )
@@ -0,0 +1,41 @@
+from asynctest import mock
+
+from indexer import backoff as backoff_module
+from indexer.backoff import ExponentialBackoff
+from tests.base import BaseTestCase
+
+
+class ExponentialBackoffTest(BaseTestCase):
+    async def test_delay_upper_bound_grows_exponentially_until_cap(self):
+        backoff = ExponentialBackoff(base=0.5, cap=3)
+        with mock.patch.object(
+            backoff_module.random, "uniform", side_effect=lambda a, b: b
+        ):
+            delays = [backoff.next_delay() for _ in range(5)]
+        self.assertEqual([0.5, 1, 2, 3, 3], delays)
+
+    async def test_delay_is_randomized(self):
+        backoff = ExponentialBackoff(base=1, cap=10)
+        with mock.patch.object(
+            backoff_module.random, "uniform", return_value=0.3
+        ) as uniform_mock:
+            self.assertEqual(0.3, backoff.next_delay())
+            self.assertEqual(0.3, backoff.next_delay())
+        self.assertEqual(
+            [mock.call(0, 1), mock.call(0, 2)], uniform_mock.call_args_list
+        )
+
+    async def test_reset_starts_again_from_base(self):
+        backoff = ExponentialBackoff(base=1, cap=10)
+        backoff.next_delay()
+        backoff.next_delay()
+        backoff.reset()
+        with mock.patch.object(
+            backoff_module.random, "uniform", side_effect=lambda a, b: b
+        ):
+            self.assertEqual(1, backoff.next_delay())
+
+    async def test_many_attempts_do_not_overflow(self):
+        backoff = ExponentialBackoff(base=1, cap=10)
+        backoff.attempts = 5000
+        self.assertLessEqual(backoff.next_delay(), 10)
@@ -10,7 +10,10 @@ class BaseTestCase(TestCase):
 
 
 LOGGER_MOCK = CoroutineMock(
-    info=CoroutineMock(), debug=CoroutineMock(), exception=CoroutineMock()
+    info=CoroutineMock(),
+    debug=CoroutineMock(),
+    error=CoroutineMock(),
+    exception=CoroutineMock(),
 )
 
 FIXTURE_DIR = os.path.join(
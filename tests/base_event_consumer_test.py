@@ -1,3 +1,4 @@
+import asyncio
 import os
 from asyncio import TimeoutError
 from typing import List
@@ -6,7 +7,9 @@ from aiohttp import ClientError
 from asynctest import mock
 from asynctest.mock import CoroutineMock
 
+from indexer import channel as channel_module
 from indexer import consumer as consumer_module
+from indexer import metrics
 from indexer import writter as writter_module
 from indexer.conf import Settings
 from indexer.connection import HTTPConnection
@@ -67,6 +70,77 @@ class EventConsumerTest(BaseTestCase):
             await consumer.start()
             self.assertEqual(2, connect_mock.await_count)
 
+    async def test_wait_backoff_delay_between_reconnects(self):
+        consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
+        with mock.patch.object(
+            consumer, "connect", side_effect=ClientError()
+        ), mock.patch.object(
+            consumer, "should_run", side_effect=[True, True, True, False]
+        ), mock.patch.object(
+            consumer._reconnect_backoff, "next_delay", return_value=0
+        ) as next_delay_mock:
+            await consumer.start()
+            self.assertEqual(2, next_delay_mock.call_count)
+
+    async def test_wait_backoff_delay_when_stream_ends_without_error(self):
+        consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
+        with mock.patch.object(
+            consumer, "should_run", side_effect=[True, True, True, False]
+        ), mock.patch.object(
+            consumer, "connect", CoroutineMock()
+        ) as connect_mock, mock.patch.object(
+            consumer._reconnect_backoff, "base", 0
+        ):
+            await consumer.start()
+            self.assertEqual(3, connect_mock.await_count)
+            self.assertEqual(2, consumer._reconnect_backoff.attempts)
+
+    async def test_reset_backoff_after_stream_stays_up(self):
+        with mock.patch.dict(
+            os.environ, TEST_RECONNECT_BACKOFF_RESET_AFTER="0"
+        ):
+            settings_stub = Settings()
+        consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
+        consumer._reconnect_backoff.attempts = 10
+        with mock.patch.object(
+            consumer_module, "settings", settings_stub
+        ), mock.patch.object(
+            consumer, "should_run", side_effect=[True, True, False]
+        ), mock.patch.object(
+            consumer._reconnect_backoff, "base", 0
+        ):
+            await consumer.start()
+            self.assertEqual(1, consumer._reconnect_backoff.attempts)
+
+    async def test_keep_backoff_if_stream_ends_too_soon(self):
+        consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
+        consumer._reconnect_backoff.attempts = 10
+        with mock.patch.object(
+            consumer, "should_run", side_effect=[True, True, False]
+        ), mock.patch.object(consumer._reconnect_backoff, "base", 0):
+            await consumer.start()
+            self.assertEqual(11, consumer._reconnect_backoff.attempts)
+
+    async def test_keep_backoff_if_stream_fails_before_first_event(self):
+        consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
+        with mock.patch.object(
+            consumer, "events", side_effect=ClientError()
+        ), mock.patch.object(
+            consumer, "should_run", side_effect=[True, True, True, False]
+        ), mock.patch.object(
+            consumer._reconnect_backoff, "base", 0
+        ):
+            await consumer.start()
+            self.assertEqual(2, consumer._reconnect_backoff.attempts)
+
+    async def test_close_consumer_when_start_finishes(self):
+        consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
+        with mock.patch.object(
+            consumer, "should_run", side_effect=[True, False]
+        ), mock.patch.object(consumer, "close", CoroutineMock()) as close_mock:
+            await consumer.start()
+            close_mock.assert_awaited_once()
+
     async def test_logs_exception_in_event_processing(self):
         consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
         with mock.patch(
@@ -108,7 +182,9 @@ class EventConsumerTest(BaseTestCase):
 
     async def test_write_output_calls_writter_instance(self):
 
-        with mock.patch.dict(os.environ, TEST_OUTPUT_TO_STDOUT="1"):
+        with mock.patch.dict(
+            os.environ, TEST_OUTPUT_TO_STDOUT="1", TEST_ES_OUTPUT_URLS="[]"
+        ):
             settings_stub = Settings()
 
             with mock.patch.object(
@@ -123,8 +199,106 @@ class EventConsumerTest(BaseTestCase):
                     HTTPConnection(urls=["http://127.0.0.1:5050"])
                 )
                 await consumer.write_output([event_mock])
+                await consumer.drain_output()
                 logger_mock.info.assert_awaited_with({"status": "TASK_RUNNING"})
 
+    async def test_slow_output_does_not_block_other_outputs(self):
+        with mock.patch.dict(os.environ, TEST_ES_OUTPUT_URLS="[]"):
+            settings_stub = Settings()
+        with mock.patch.object(consumer_module, "settings", settings_stub):
+            consumer = StdOutConsumer(
+                HTTPConnection(urls=["http://127.0.0.1:5050"])
+            )
+
+        async def slow_write(events):
+            await asyncio.sleep(10)
+
+        slow_writter = OutputWritter()
+        slow_writter.write = slow_write
+        fast_writter = OutputWritter()
+        fast_writter.write = CoroutineMock()
+        consumer.add_output(
+            "slow", slow_writter, 10, 1, consumer_module.OverflowPolicy.BLOCK
+        )
+        consumer.add_output(
+            "fast", fast_writter, 10, 1, consumer_module.OverflowPolicy.BLOCK
+        )
+
+        await consumer.write_output([10])
+        await consumer.write_output([20])
+        await asyncio.wait_for(consumer.channels[1].drain(), 1)
+        fast_writter.write.assert_has_awaits([mock.call([10]), mock.call([20])])
+        with mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            for channel in consumer.channels:
+                await channel.close(timeout=0)
+
+    async def test_events_written_only_after_every_output_acknowledges(self):
+        with mock.patch.dict(os.environ, TEST_ES_OUTPUT_URLS="[]"):
+            settings_stub = Settings()
+        with mock.patch.object(consumer_module, "settings", settings_stub):
+            consumer = StdOutConsumer(
+                HTTPConnection(urls=["http://127.0.0.1:5050"])
+            )
+        gate = asyncio.Event()
+
+        async def gated_write(events):
+            await gate.wait()
+            slow_writter.acknowledge(events)
+
+        slow_writter = OutputWritter()
+        slow_writter.write = gated_write
+        fast_writter = OutputWritter()
+        fast_writter.write = CoroutineMock(side_effect=fast_writter.acknowledge)
+        consumer.add_output(
+            "slow", slow_writter, 10, 1, consumer_module.OverflowPolicy.BLOCK
+        )
+        consumer.add_output(
+            "fast", fast_writter, 10, 1, consumer_module.OverflowPolicy.BLOCK
+        )
+        event = mock.Mock(id="event-1", date="invalid")
+        with mock.patch.object(consumer, "events_written") as written_mock:
+            await consumer.write_output([event])
+            await consumer.channels[1].drain()
+            written_mock.assert_not_called()
+
+            gate.set()
+            await consumer.drain_output()
+            written_mock.assert_called_once_with([event])
+        for channel in consumer.channels:
+            await channel.close(timeout=1)
+
+    async def test_metrics_report_output_queues_and_counters(self):
+        with mock.patch.dict(os.environ, TEST_ES_OUTPUT_URLS="[]"):
+            settings_stub = Settings()
+        with mock.patch.object(consumer_module, "settings", settings_stub):
+            consumer = StdOutConsumer(
+                HTTPConnection(urls=["http://127.0.0.1:5050"])
+            )
+        writter = OutputWritter()
+        writter.write = CoroutineMock(
+            side_effect=lambda events: writter.acknowledge(
+                [mock.Mock(id=str(e), date="invalid") for e in events]
+            )
+        )
+        consumer.add_output(
+            "test", writter, 10, 1, consumer_module.OverflowPolicy.BLOCK
+        )
+        await consumer.write_output([10, 20])
+        await consumer.drain_output()
+
+        families = {family.name: family for family in consumer.metrics()}
+        self.assertEqual([], families["indexer_pipeline_queue_size"].samples)
+        self.assertEqual(
+            [({"output": "test"}, 0.0)],
+            families["indexer_output_queue_size"].samples,
+        )
+        self.assertIn(
+            ({"output": "test", "result": "written"}, 2.0),
+            families["indexer_output_events_total"].samples,
+        )
+        for channel in consumer.channels:
+            await channel.close(timeout=0)
+
     async def test_consumer_instantiate_es_writter_if_env_url_set(self):
 
         import json
@@ -156,3 +330,234 @@ class EventConsumerTest(BaseTestCase):
                     HTTPConnection(urls=["http://127.0.0.1:5050"])
                 )
                 self.assertTrue(isinstance(consumer.output[0], OutputWritter))
+
+
+class SlowEnrichConsumer(MyConsumer):
+    """
+    Cada evento demora `event / 100` segundos para ser enriquecido.
+    """
+
+    def __init__(self, conn: HTTPConnection, events: List[int]):
+        MyConsumer.__init__(self, conn)
+        self._events = events
+        self.running = 0
+        self.max_running = 0
+
+    async def events(self):
+        for ev in self._events:
+            yield ev
+
+    async def pre_process_event(self, events: List[int]) -> None:
+        self.running += 1
+        self.max_running = max(self.running, self.max_running)
+        await asyncio.sleep(events[0] / 100)
+        self.running -= 1
+
+
+class EventConsumerPipelineTest(BaseTestCase):
+    async def setUp(self):
+        with mock.patch.dict(
+            os.environ,
+            TEST_PIPELINE_ENRICH_DELAY="0",
+            TEST_PIPELINE_WORKERS="4",
+        ):
+            self.settings_stub = Settings()
+
+    async def test_enrich_events_concurrently(self):
+        consumer = SlowEnrichConsumer(
+            HTTPConnection(urls=["http://127.0.0.1:5050"]), [10] * 8
+        )
+        with mock.patch.object(
+            consumer_module, "settings", self.settings_stub
+        ), mock.patch.object(consumer, "should_run", side_effect=[True, False]):
+            await consumer.start()
+            self.assertEqual(4, consumer.max_running)
+            self.assertEqual([10] * 8, consumer.all_events)
+
+    async def test_stamp_enriched_at_when_event_has_ingest_info(self):
+        events = [
+            Event(
+                id="1",
+                date="2020-01-10T19:52:35+00:00",
+                appname="app",
+                namespace="infra",
+                backend_info={"name": "Mesos/Marathon"},
+                task={"id": "task-1"},
+                agent={"id": "agent-1"},
+                status="TASK_RUNNING",
+                ingest={"received_at": "2020-01-10T19:52:36+00:00"},
+            )
+        ]
+
+        class IngestConsumer(MyConsumer):
+            async def events(self):
+                for event in events:
+                    yield event
+
+        consumer = IngestConsumer(
+            HTTPConnection(urls=["http://127.0.0.1:5050"])
+        )
+        with mock.patch.object(
+            consumer_module, "settings", self.settings_stub
+        ), mock.patch.object(consumer, "should_run", side_effect=[True, False]):
+            await consumer.start()
+        self.assertEqual(events, consumer.all_events)
+        self.assertIsNotNone(consumer.all_events[0].ingest.enriched_at)
+
+    async def test_observe_enrich_and_write_durations(self):
+        consumer = SlowEnrichConsumer(
+            HTTPConnection(urls=["http://127.0.0.1:5050"]), [1, 2]
+        )
+        before = (metrics.ENRICH_DURATION.count, metrics.WRITE_DURATION.count)
+        with mock.patch.object(
+            consumer_module, "settings", self.settings_stub
+        ), mock.patch.object(consumer, "should_run", side_effect=[True, False]):
+            await consumer.start()
+        self.assertEqual(
+            (before[0] + 2, before[1] + 2),
+            (metrics.ENRICH_DURATION.count, metrics.WRITE_DURATION.count),
+        )
+
+    async def test_write_events_in_stream_order(self):
+        """
+        Mesmo que um evento termine de ser enriquecido antes dos eventos
+        que chegaram antes dele, a escrita respeita a ordem do stream.
+        """
+        consumer = SlowEnrichConsumer(
+            HTTPConnection(urls=["http://127.0.0.1:5050"]), [30, 20, 10, 1]
+        )
+        with mock.patch.object(
+            consumer_module, "settings", self.settings_stub
+        ), mock.patch.object(consumer, "should_run", side_effect=[True, False]):
+            await consumer.start()
+            self.assertEqual([30, 20, 10, 1], consumer.all_events)
+
+    async def test_wait_enrich_delay_counted_from_event_arrival(self):
+        consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
+        with mock.patch.dict(os.environ, TEST_PIPELINE_ENRICH_DELAY="0.2"):
+            settings_stub = Settings()
+
+        loop = asyncio.get_event_loop()
+        with mock.patch.object(
+            consumer_module, "settings", settings_stub
+        ), mock.patch.object(consumer, "should_run", side_effect=[True, False]):
+            started_at = loop.time()
+            await consumer.start()
+            elapsed = loop.time() - started_at
+            self.assertEqual([10, 20], consumer.all_events)
+            self.assertGreaterEqual(elapsed, 0.2)
+            self.assertLess(elapsed, 0.4)
+
+    async def test_write_event_without_enrichment_if_pre_process_fails(self):
+        class FailingEnrichConsumer(SlowEnrichConsumer):
+            async def pre_process_event(self, events: List[int]) -> None:
+                if events[0] == 2:
+                    raise KeyError("agent-1")
+                await SlowEnrichConsumer.pre_process_event(self, events)
+
+        consumer = FailingEnrichConsumer(
+            HTTPConnection(urls=["http://127.0.0.1:5050"]), [1, 2, 3, 4]
+        )
+        errors_before = metrics.ENRICH_ERRORS.value
+        with mock.patch.object(
+            consumer_module, "settings", self.settings_stub
+        ), mock.patch.object(
+            consumer, "should_run", side_effect=[True, False]
+        ), mock.patch.object(
+            consumer, "connect", CoroutineMock()
+        ) as connect_mock, mock.patch(
+            "indexer.consumer.logger", LOGGER_MOCK
+        ) as logger_mock:
+            logger_mock.reset_mock()
+            await consumer.start()
+            connect_mock.assert_awaited_once()
+            self.assertEqual([1, 2, 3, 4], consumer.all_events)
+            logger_mock.exception.assert_awaited_once_with(
+                {"event": "enrich-error", "event-id": None, "exc": "'agent-1'"}
+            )
+        self.assertEqual(errors_before + 1, metrics.ENRICH_ERRORS.value)
+
+    async def test_post_process_event_after_write_output(self):
+        consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
+        with mock.patch.object(
+            consumer_module, "settings", self.settings_stub
+        ), mock.patch.object(
+            consumer, "post_process_event", CoroutineMock()
+        ) as post_process_mock, mock.patch.object(
+            consumer, "should_run", side_effect=[True, False]
+        ):
+            await consumer.start()
+            self.assertEqual([10, 20], consumer.all_events)
+            post_process_mock.assert_has_awaits(
+                [mock.call([10]), mock.call([20])]
+            )
+
+    async def test_cancel_spawned_tasks_when_pipeline_finishes(self):
+        consumer = MyConsumer(HTTPConnection(urls=["http://127.0.0.1:5050"]))
+        background = []
+
+        async def connect():
+            background.append(consumer.spawn(asyncio.sleep(10)))
+
+        with mock.patch.object(
+            consumer_module, "settings", self.settings_stub
+        ), mock.patch.object(consumer, "connect", connect), mock.patch.object(
+            consumer, "should_run", side_effect=[True, False]
+        ):
+            await consumer.start()
+            self.assertTrue(background[0].cancelled())
+
+    async def test_write_events_already_read_when_stream_fails(self):
+        class FailingStreamConsumer(SlowEnrichConsumer):
+            async def events(self):
+                for ev in self._events:
+                    yield ev
+                raise ClientError()
+
+        consumer = FailingStreamConsumer(
+            HTTPConnection(urls=["http://127.0.0.1:5050"]), [5, 4, 3, 2, 1]
+        )
+        with mock.patch.object(
+            consumer_module, "settings", self.settings_stub
+        ), mock.patch.object(
+            consumer, "should_run", side_effect=[True, False]
+        ), mock.patch(
+            "indexer.consumer.logger", LOGGER_MOCK
+        ) as logger_mock:
+            await consumer.start()
+        self.assertEqual([5, 4, 3, 2, 1], consumer.all_events)
+        logger_mock.exception.assert_awaited_with(
+            {"event": "exception-consuming-events", "exc": ""}
+        )
+
+    async def test_stop_draining_pipeline_after_timeout(self):
+        class FailingStreamConsumer(SlowEnrichConsumer):
+            async def events(self):
+                for ev in self._events:
+                    yield ev
+                raise ClientError()
+
+        with mock.patch.dict(
+            os.environ,
+            TEST_PIPELINE_ENRICH_DELAY="0",
+            TEST_PIPELINE_DRAIN_TIMEOUT="0.1",
+        ):
+            settings_stub = Settings()
+        consumer = FailingStreamConsumer(
+            HTTPConnection(urls=["http://127.0.0.1:5050"]), [1, 1000]
+        )
+        loop = asyncio.get_event_loop()
+        with mock.patch.object(
+            consumer_module, "settings", settings_stub
+        ), mock.patch.object(
+            consumer, "should_run", side_effect=[True, False]
+        ), mock.patch(
+            "indexer.consumer.logger", LOGGER_MOCK
+        ) as logger_mock:
+            started_at = loop.time()
+            await consumer.start()
+            self.assertLess(loop.time() - started_at, 1)
+        self.assertEqual([1], consumer.all_events)
+        logger_mock.error.assert_awaited_with(
+            {"event": "pipeline-drain-timeout", "pending-events": 0}
+        )
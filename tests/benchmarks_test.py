@@ -0,0 +1,100 @@
+import json
+import os
+import tempfile
+
+from asynctest import mock
+
+from benchmarks import payloads
+from benchmarks.__main__ import main
+from benchmarks.runner import Benchmark, run
+from indexer.mesos.events.recordio import RecordIOFramer
+from indexer.mesos.models.event import MesosEvent
+from tests.base import BaseTestCase
+
+
+class BenchmarksTest(BaseTestCase):
+    def test_large_inspect_payload_is_a_valid_event(self):
+        data = payloads.task_updated_with_large_inspect(
+            env_vars=10, labels=5, mounts=3
+        )
+        details = MesosEvent(**data).task_details()
+        self.assertEqual("/mnt/volume-2", details.Mounts[-1].Destination)
+        self.assertEqual(
+            "value-" + "y" * 32 + "-4",
+            details.config.Labels["com.example.label.4"],
+        )
+
+    def test_recordio_payload(self):
+        data = payloads.task_added()
+        records = RecordIOFramer().feed(payloads.recordio(data))
+        self.assertEqual([data], [json.loads(r) for r in records])
+
+    def test_run_benchmark(self):
+        result = run(
+            Benchmark("sum", lambda: list(range(100)), sum),
+            min_time=0.001,
+            repeat=2,
+        )
+        self.assertEqual("sum", result.name)
+        self.assertGreater(result.ops_per_sec, 0)
+        self.assertGreater(result.mean_us, 0)
+        self.assertGreater(result.peak_bytes, 0)
+
+    def test_run_suite_and_write_json(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "results.json")
+            with mock.patch("builtins.print"):
+                self.assertEqual(
+                    0,
+                    main(
+                        [
+                            "--filter",
+                            r"\[task_added\]",
+                            "--min-time",
+                            "0.001",
+                            "--repeat",
+                            "1",
+                            "--json",
+                            path,
+                        ]
+                    ),
+                )
+                main(
+                    [
+                        "--filter",
+                        "serialize",
+                        "--min-time",
+                        "0.001",
+                        "--repeat",
+                        "1",
+                        "--compare",
+                        path,
+                    ]
+                )
+            with open(path) as f:
+                data = json.load(f)
+        self.assertEqual(
+            {"python", "implementation", "pydantic", "machine", "timestamp"},
+            set(data["metadata"]),
+        )
+        self.assertEqual(
+            [
+                "parse[task_added]",
+                "validate[task_added]",
+                "convert[task_added]",
+                "serialize[task_added]",
+                "revalidate[task_added]",
+            ],
+            [r["name"] for r in data["results"]],
+        )
+        self.assertEqual(
+            {
+                "name",
+                "ops_per_sec",
+                "mean_us",
+                "allocated_blocks",
+                "allocated_bytes",
+                "peak_bytes",
+            },
+            set(data["results"][0]),
+        )
@@ -0,0 +1,66 @@
+from indexer.cache import LRUCache
+from tests.base import BaseTestCase
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTest(BaseTestCase):
+    async def setUp(self):
+        self.clock = FakeClock()
+
+    async def test_get_returns_default_for_missing_key(self):
+        cache = LRUCache(maxsize=2)
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(42, cache.get("missing", 42))
+
+    async def test_count_hits_and_misses(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("key", "value")
+
+        self.assertEqual("value", cache.get("key"))
+        self.assertIsNone(cache.get("other-key"))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    async def test_expire_entry_after_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=10, clock=self.clock)
+        cache.set("key", "value")
+
+        self.clock.now = 9.9
+        self.assertEqual("value", cache.get("key"))
+
+        self.clock.now = 10
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(0, len(cache))
+
+    async def test_ttl_per_entry_overrides_default_ttl(self):
+        cache = LRUCache(maxsize=2, ttl=10, clock=self.clock)
+        cache.set("key", "value", ttl=1)
+
+        self.clock.now = 1
+        self.assertIsNone(cache.get("key"))
+
+    async def test_entries_without_ttl_never_expire(self):
+        cache = LRUCache(maxsize=2, clock=self.clock)
+        cache.set("key", "value")
+
+        self.clock.now = 10 ** 9
+        self.assertEqual("value", cache.get("key"))
+
+    async def test_discard_least_recently_used_entry_when_full(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(3, cache.get("c"))
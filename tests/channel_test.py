@@ -0,0 +1,442 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import List
+
+from asynctest import mock
+
+from indexer import channel as channel_module
+from indexer import spool as spool_module
+from indexer import writter as writter_module
+from indexer.channel import OutputChannel
+from indexer.conf import OverflowPolicy, Settings
+from indexer.models.event import Event
+from indexer.writter import OutputWriteError, OutputWritter
+from tests.base import BaseTestCase, LOGGER_MOCK
+
+
+def event(task_id: str) -> Event:
+    return Event(
+        id=task_id,
+        date="2020-01-10T19:52:35+00:00",
+        appname="app",
+        namespace="infra",
+        backend_info={"name": "Mesos/Marathon"},
+        task={"id": task_id},
+        agent={"id": "agent-1"},
+        status="TASK_RUNNING",
+    )
+
+
+class GatedWritter(OutputWritter):
+    """
+    Só escreve quando `self.gate` estiver liberado.
+    """
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.events: List[str] = []
+        self.running = 0
+        self.max_running = 0
+        self.flushed = False
+
+    async def write(self, events: List[Event]) -> None:
+        self.running += 1
+        self.max_running = max(self.running, self.max_running)
+        await self.gate.wait()
+        self.running -= 1
+        self.events.extend(e.id for e in events)
+        self.acknowledge(events)
+
+    async def flush(self) -> None:
+        self.flushed = True
+
+
+class OutputChannelTest(BaseTestCase):
+    async def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with mock.patch.dict(
+            os.environ, TEST_OUTPUT_SPOOL_DIR=self.tmp_dir.name
+        ):
+            self.settings_stub = Settings()
+        self.writter = GatedWritter()
+
+    async def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def channel(self, overflow, queue_size=1, concurrency=1):
+        with mock.patch.object(channel_module, "settings", self.settings_stub):
+            return OutputChannel(
+                "test", self.writter, queue_size, concurrency, overflow
+            )
+
+    async def test_write_events_and_flush_on_drain(self):
+        self.writter.gate.set()
+        channel = self.channel(OverflowPolicy.BLOCK)
+        await channel.put([event("1")])
+        await channel.put([event("2")])
+        await channel.drain()
+        self.assertEqual(["1", "2"], self.writter.events)
+        self.assertEqual(2, channel.written)
+        self.assertTrue(self.writter.flushed)
+        await channel.close(timeout=1)
+
+    async def test_write_with_configured_concurrency(self):
+        channel = self.channel(
+            OverflowPolicy.BLOCK, queue_size=10, concurrency=3
+        )
+        for i in range(5):
+            await channel.put([event(str(i))])
+        await asyncio.sleep(0.01)
+        self.assertEqual(3, self.writter.max_running)
+        self.writter.gate.set()
+        await channel.drain()
+        self.assertEqual(5, channel.written)
+        await channel.close(timeout=1)
+
+    async def test_block_when_queue_is_full(self):
+        channel = self.channel(OverflowPolicy.BLOCK)
+        await channel.put([event("1")])
+        await asyncio.sleep(0.01)
+        await channel.put([event("2")])
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(channel.put([event("3")]), 0.05)
+        self.writter.gate.set()
+        await channel.close(timeout=1)
+
+    async def test_drop_oldest_when_queue_is_full(self):
+        channel = self.channel(OverflowPolicy.DROP_OLDEST)
+        await channel.put([event("1")])
+        await asyncio.sleep(0.01)
+        await channel.put([event("2")])
+        await channel.put([event("3")])
+        self.writter.gate.set()
+        await channel.drain()
+        self.assertEqual(["1", "3"], self.writter.events)
+        self.assertEqual(1, channel.dropped)
+        await channel.close(timeout=1)
+
+    async def test_spill_to_disk_when_queue_is_full(self):
+        channel = self.channel(OverflowPolicy.SPILL)
+        await channel.put([event("1")])
+        await asyncio.sleep(0.01)
+        await channel.put([event("2")])
+        await channel.put([event("3"), event("4")])
+        self.assertEqual(2, channel.spilled)
+
+        self.writter.gate.set()
+        await channel.drain()
+        self.assertEqual(["1", "2", "3", "4"], self.writter.events)
+        await channel.close(timeout=1)
+
+    async def test_keep_spilled_events_on_disk_until_written(self):
+        with mock.patch.dict(
+            os.environ,
+            TEST_OUTPUT_SPOOL_DIR=self.tmp_dir.name,
+            TEST_RECONNECT_BACKOFF_BASE="0.001",
+            TEST_RECONNECT_BACKOFF_MAX="0.001",
+        ):
+            self.settings_stub = Settings()
+        channel = self.channel(OverflowPolicy.SPILL)
+        write = self.writter.write
+        spool_sizes = []
+
+        async def fail_first_spilled_write(events):
+            if events[0].id == "3" and not spool_sizes:
+                spool_sizes.append(channel.spool_size())
+                raise Exception("down")
+            await write(events)
+
+        self.writter.write = fail_first_spilled_write
+        await channel.put([event("1")])
+        await asyncio.sleep(0.01)
+        await channel.put([event("2")])
+        await channel.put([event("3")])
+
+        with mock.patch.object(
+            channel_module, "settings", self.settings_stub
+        ), mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            self.writter.gate.set()
+            await asyncio.wait_for(channel.drain(), 1)
+        self.assertEqual([1], spool_sizes)
+        self.assertEqual(["1", "2", "3"], self.writter.events)
+        self.assertEqual(0, channel.spool_size())
+        self.assertEqual(0, channel.failed)
+        await channel.close(timeout=1)
+
+    async def test_fsync_spool_outside_the_event_loop_thread(self):
+        with mock.patch.dict(
+            os.environ,
+            TEST_OUTPUT_SPOOL_DIR=self.tmp_dir.name,
+            TEST_OUTPUT_SPOOL_FSYNC_BYTES="1",
+        ):
+            self.settings_stub = Settings()
+        channel = self.channel(OverflowPolicy.SPILL)
+        fsync_threads = []
+        with mock.patch.object(
+            spool_module.os,
+            "fsync",
+            side_effect=lambda fd: fsync_threads.append(threading.get_ident()),
+        ):
+            await channel._append_to_spool([event("1")])
+        self.assertEqual(1, len(fsync_threads))
+        self.assertNotEqual(threading.get_ident(), fsync_threads[0])
+        self.writter.gate.set()
+        await channel.close(timeout=1)
+
+    async def test_replay_spilled_events_left_by_previous_run(self):
+        channel = self.channel(OverflowPolicy.SPILL)
+        await channel.put([event("1")])
+        await asyncio.sleep(0.01)
+        await channel.put([event("2")])
+        await channel.put([event("3")])
+        with mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            await channel.close(timeout=0.01)
+
+        self.writter = GatedWritter()
+        self.writter.gate.set()
+        channel = self.channel(OverflowPolicy.SPILL)
+        await channel.drain()
+        self.assertEqual(["3"], self.writter.events)
+        await channel.close(timeout=1)
+
+    async def test_count_and_log_failed_writes(self):
+        self.writter.write = mock.CoroutineMock(side_effect=Exception("down"))
+        channel = self.channel(OverflowPolicy.BLOCK)
+        with mock.patch.object(channel_module, "logger", LOGGER_MOCK) as logger:
+            logger.reset_mock()
+            await channel.put([event("1")])
+            await channel.drain()
+            logger.exception.assert_awaited_once_with(
+                {
+                    "event": "output-writter-error",
+                    "output": "test",
+                    "exc": "down",
+                }
+            )
+        self.assertEqual(1, channel.failed)
+        await channel.close(timeout=1)
+
+    async def test_count_only_events_dropped_by_the_writter_as_failed(self):
+        self.writter.write = mock.CoroutineMock(
+            side_effect=OutputWriteError("partial", dropped=1)
+        )
+        channel = self.channel(OverflowPolicy.BLOCK)
+        with mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            await channel.put([event("1"), event("2")])
+            await channel.drain()
+        self.assertEqual(1, channel.failed)
+        self.assertEqual(1, channel.consecutive_failures)
+        await channel.close(timeout=1)
+
+    async def test_unhealthy_after_consecutive_failures(self):
+        failures = [Exception("down")] * 3
+        write = self.writter.write
+
+        async def flaky_write(events):
+            if failures:
+                raise failures.pop()
+            await write(events)
+
+        self.writter.write = flaky_write
+        self.writter.gate.set()
+        channel = self.channel(OverflowPolicy.BLOCK)
+        with mock.patch.object(
+            channel_module, "settings", self.settings_stub
+        ), mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            healthy = []
+            for i in range(4):
+                await channel.put([event(str(i))])
+                await channel.drain()
+                healthy.append(channel.healthy())
+        self.assertEqual([True, True, False, True], healthy)
+        await channel.close(timeout=1)
+
+    async def test_unhealthy_when_pending_events_are_not_written(self):
+        with mock.patch.dict(os.environ, TEST_OUTPUT_STALL_TIMEOUT="0.01"):
+            settings_stub = Settings()
+        channel = self.channel(OverflowPolicy.BLOCK)
+        with mock.patch.object(channel_module, "settings", settings_stub):
+            self.assertTrue(channel.healthy())
+            await channel.put([event("1")])
+            await asyncio.sleep(0.02)
+            self.assertFalse(channel.healthy())
+            self.writter.gate.set()
+            await channel.drain()
+            self.assertTrue(channel.healthy())
+        await channel.close(timeout=1)
+
+    async def test_count_written_events_only_when_acknowledged(self):
+        writter = FlakyWritter(failures=0)
+        channel = OutputChannel("test", writter, 1, 1, OverflowPolicy.BLOCK)
+        await channel.put([event("1"), event("2")])
+        await asyncio.sleep(0.01)
+        self.assertEqual(0, channel.written)
+        await channel.drain()
+        self.assertEqual(2, channel.written)
+        await channel.close(timeout=1)
+
+    async def test_failures_reported_by_the_writter(self):
+        writter = FlakyWritter(failures=0)
+        channel = OutputChannel("test", writter, 1, 1, OverflowPolicy.BLOCK)
+        with mock.patch.object(channel_module, "settings", self.settings_stub):
+            for _ in range(self.settings_stub.OUTPUT_MAX_CONSECUTIVE_FAILURES):
+                writter.report_error(2)
+            self.assertFalse(channel.healthy())
+            self.assertEqual(6, channel.failed)
+
+            await channel.put([event("1")])
+            await channel.drain()
+            self.assertTrue(channel.healthy())
+        await channel.close(timeout=1)
+
+    async def test_unhealthy_while_writter_holds_unacknowledged_events(self):
+        with mock.patch.dict(os.environ, TEST_OUTPUT_STALL_TIMEOUT="0.01"):
+            settings_stub = Settings()
+        writter = FlakyWritter(failures=0)
+        channel = OutputChannel("test", writter, 1, 1, OverflowPolicy.BLOCK)
+        with mock.patch.object(channel_module, "settings", settings_stub):
+            await channel.put([event("1")])
+            await asyncio.sleep(0.02)
+            self.assertEqual(1, writter.pending())
+            self.assertFalse(channel.healthy())
+        await channel.close(timeout=1)
+
+    async def test_lag_of_events_acknowledged_by_the_writter(self):
+        writter = OutputWritter()
+        channel = OutputChannel("test", writter, 1, 1, OverflowPolicy.BLOCK)
+        self.assertIsNone(channel.lag)
+        date = datetime.fromtimestamp(time.time() - 30).astimezone()
+        with mock.patch.object(writter_module, "logger", LOGGER_MOCK):
+            await channel.put([event("1").copy(update={"date": "invalid"})])
+            await channel.put(
+                [event("2").copy(update={"date": date.isoformat()})]
+            )
+            await channel.drain()
+        self.assertAlmostEqual(30, channel.lag, delta=1)
+        await channel.close(timeout=1)
+
+    async def test_close_gives_up_draining_after_timeout(self):
+        channel = self.channel(OverflowPolicy.BLOCK)
+        await channel.put([event("1")])
+        with mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            await channel.close(timeout=0.01)
+        self.assertEqual([], self.writter.events)
+
+
+class FlakyWritter(OutputWritter):
+    """
+    Falha nas primeiras `failures` chamadas ao flush(). Com `keep` o writer
+    guarda os eventos e lança OutputWriteError, como o writer do ES faz.
+    """
+
+    def __init__(self, failures: int, keep: bool = False):
+        self.failures = failures
+        self.keep = keep
+        self.buffer: List[Event] = []
+        self.events: List[str] = []
+
+    async def write(self, events: List[Event]) -> None:
+        self.buffer.extend(events)
+
+    def pending(self) -> int:
+        return len(self.buffer)
+
+    def discard(self) -> None:
+        self.buffer = []
+
+    async def flush(self) -> None:
+        if self.failures:
+            self.failures -= 1
+            if self.keep:
+                raise OutputWriteError("sink down")
+            raise Exception("sink down")
+        buffer, self.buffer = self.buffer, []
+        self.events.extend(e.id for e in buffer)
+        self.acknowledge(buffer)
+
+
+class WriteAheadOutputChannelTest(BaseTestCase):
+    async def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with mock.patch.dict(
+            os.environ,
+            TEST_OUTPUT_SPOOL_DIR=self.tmp_dir.name,
+            TEST_RECONNECT_BACKOFF_BASE="0.001",
+            TEST_RECONNECT_BACKOFF_MAX="0.001",
+        ):
+            self.settings_stub = Settings()
+
+    async def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def channel(self, writter):
+        with mock.patch.object(channel_module, "settings", self.settings_stub):
+            return OutputChannel(
+                "test", writter, 1, 4, OverflowPolicy.BLOCK, write_ahead=True
+            )
+
+    async def test_write_spooled_events_in_order(self):
+        writter = FlakyWritter(failures=0)
+        channel = self.channel(writter)
+        self.assertEqual(1, channel.concurrency)
+        with mock.patch.object(channel_module, "settings", self.settings_stub):
+            for i in range(5):
+                await channel.put([event(str(i))])
+            await channel.drain()
+        self.assertEqual([str(i) for i in range(5)], writter.events)
+        self.assertEqual(0, channel.spool_size())
+        await channel.close(timeout=1)
+
+    async def test_resend_events_until_writter_recovers(self):
+        writter = FlakyWritter(failures=2)
+        channel = self.channel(writter)
+        with mock.patch.object(
+            channel_module, "settings", self.settings_stub
+        ), mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            await channel.put([event("1"), event("2")])
+            await asyncio.wait_for(channel.drain(), 1)
+        self.assertEqual(["1", "2"], writter.events)
+        self.assertEqual(0, channel.failed)
+        self.assertEqual(0, channel.consecutive_failures)
+        self.assertEqual(2, channel.written)
+        await channel.close(timeout=1)
+
+    async def test_retry_flush_of_events_kept_by_the_writter(self):
+        writter = FlakyWritter(failures=2, keep=True)
+        writter.write = mock.CoroutineMock(wraps=writter.write)
+        channel = self.channel(writter)
+        with mock.patch.object(
+            channel_module, "settings", self.settings_stub
+        ), mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            await channel.put([event("1"), event("2")])
+            await asyncio.wait_for(channel.drain(), 1)
+        writter.write.assert_awaited_once()
+        self.assertEqual(["1", "2"], writter.events)
+        self.assertEqual(0, channel.failed)
+        self.assertEqual(2, channel.written)
+        self.assertEqual(0, channel.spool_size())
+        await channel.close(timeout=1)
+
+    async def test_replay_unwritten_events_after_restart(self):
+        writter = FlakyWritter(failures=100)
+        channel = self.channel(writter)
+        with mock.patch.object(
+            channel_module, "settings", self.settings_stub
+        ), mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            await channel.put([event("1")])
+            await channel.put([event("2")])
+            await channel.close(timeout=0.05)
+        self.assertEqual([], writter.events)
+
+        writter = FlakyWritter(failures=0)
+        channel = self.channel(writter)
+        with mock.patch.object(channel_module, "settings", self.settings_stub):
+            self.assertEqual(2, channel.spool_size())
+            await channel.drain()
+        self.assertEqual(["1", "2"], writter.events)
+        await channel.close(timeout=1)
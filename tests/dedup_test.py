@@ -0,0 +1,101 @@
+from indexer.dedup import EventDeduplicator
+from indexer.models.event import Event
+from tests.base import BaseTestCase
+from tests.cache_test import FakeClock
+
+
+def event(task_id: str, status: str, date: str, source: str) -> Event:
+    return Event(
+        id="id",
+        date=date,
+        appname="app",
+        namespace="infra",
+        backend_info={"name": "MARATHON"},
+        task={"id": task_id},
+        agent={"id": "agent-1"},
+        status=status,
+        source=source,
+    )
+
+
+class EventDeduplicatorTest(BaseTestCase):
+    async def setUp(self):
+        self.clock = FakeClock()
+        self.dedup = EventDeduplicator(window=60, maxsize=2, clock=self.clock)
+
+    async def test_same_transition_from_another_source_is_duplicate(self):
+        date = "2020-01-10T19:52:35+00:00"
+        self.assertFalse(
+            self.dedup.is_duplicate(
+                event("app.1", "TASK_RUNNING", date, "EXECUTOR")
+            )
+        )
+        self.assertTrue(
+            self.dedup.is_duplicate(
+                event("app.1", "TASK_RUNNING", date, "AGENT")
+            )
+        )
+        self.assertEqual(1, self.dedup.duplicates)
+
+    async def test_different_state_or_timestamp_is_not_duplicate(self):
+        date = "2020-01-10T19:52:35+00:00"
+        later = "2020-01-10T19:52:36+00:00"
+        source = "EXECUTOR"
+        self.assertFalse(
+            self.dedup.is_duplicate(
+                event("app.1", "TASK_RUNNING", date, source)
+            )
+        )
+        self.assertFalse(
+            self.dedup.is_duplicate(
+                event("app.1", "TASK_FINISHED", date, source)
+            )
+        )
+        self.assertFalse(
+            self.dedup.is_duplicate(
+                event("app.1", "TASK_FINISHED", later, source)
+            )
+        )
+
+    async def test_forget_events_after_window(self):
+        ev = event(
+            "app.1", "TASK_RUNNING", "2020-01-10T19:52:35+00:00", "AGENT"
+        )
+        self.assertFalse(self.dedup.is_duplicate(ev))
+        self.dedup.indexed(ev)
+        self.clock.now += 61
+        self.assertFalse(self.dedup.is_duplicate(ev))
+
+    async def test_memory_is_bounded(self):
+        for i in range(5):
+            ev = event(
+                f"app.{i}", "TASK_RUNNING", "2020-01-10T19:52:35+00:00", "AGENT"
+            )
+            self.dedup.is_duplicate(ev)
+            self.dedup.indexed(ev)
+        self.assertEqual(2, len(self.dedup))
+
+    async def test_remember_only_indexed_events(self):
+        ev = event(
+            "app.1", "TASK_RUNNING", "2020-01-10T19:52:35+00:00", "AGENT"
+        )
+        self.assertFalse(self.dedup.is_duplicate(ev))
+        self.assertTrue(self.dedup.is_duplicate(ev))
+        self.assertEqual(0, len(self.dedup))
+
+        self.dedup.forget_pending()
+        self.assertFalse(self.dedup.is_duplicate(ev))
+        self.dedup.indexed(ev)
+        self.dedup.forget_pending()
+        self.assertTrue(self.dedup.is_duplicate(ev))
+        self.assertEqual(1, len(self.dedup))
+
+    async def test_custom_key_ignores_event_date(self):
+        first = event(
+            "app.1", "TASK_STAGING", "2020-01-10T19:52:35+00:00", "MASTER"
+        )
+        second = event(
+            "app.1", "TASK_STAGING", "2020-01-10T19:52:40+00:00", "MASTER"
+        )
+        self.assertFalse(self.dedup.is_duplicate(first, key=first.id))
+        self.assertTrue(self.dedup.is_duplicate(second, key=second.id))
@@ -0,0 +1,201 @@
+import json
+
+from aiohttp import ClientSession
+from asynctest import mock
+
+from indexer.conf import settings
+from indexer.loadtest.cluster import FakeCluster, FakeClusterConfig
+from indexer.loadtest.harness import (
+    format_report,
+    override_settings,
+    percentile,
+    run_load_test,
+)
+from indexer.mesos.events.recordio import RecordIOFramer
+from indexer.mesos.models.event import MesosEvent, MesosEventTypes
+from tests.base import LOGGER_MOCK, BaseTestCase
+
+
+class FakeClusterTest(BaseTestCase):
+    async def setUp(self):
+        self.cluster = FakeCluster(
+            FakeClusterConfig(event_rate=200, agents=2, sandbox_size=10)
+        )
+        await self.cluster.start()
+        self.session = ClientSession()
+
+    async def tearDown(self):
+        await self.session.close()
+        await self.cluster.close()
+
+    async def _read_events(self, count):
+        resp = await self.session.post(
+            f"{self.cluster.master_url}/api/v1", json={"type": "SUBSCRIBE"}
+        )
+        framer = RecordIOFramer()
+        events = []
+        while len(events) < count:
+            chunk = await resp.content.readany()
+            events += [MesosEvent(**json.loads(r)) for r in framer.feed(chunk)]
+        resp.close()
+        return events
+
+    async def test_stream_subscribed_and_task_lifecycle(self):
+        subscribed, added, running, finished = (await self._read_events(4))[:4]
+        self.assertEqual(MesosEventTypes.SUBSCRIBED, subscribed.type)
+        self.assertEqual(
+            [
+                (agent.id, f"http://127.0.0.1:{agent.port}")
+                for agent in self.cluster.agents
+            ],
+            [
+                (a.agent_info.id.value, a.agent_info.address())
+                for a in subscribed.subscribed.agents()
+            ],
+        )
+        task_id = added.task_added.task.task_id.value
+        self.assertEqual("TASK_STAGING", added.task_added.task.state)
+        self.assertEqual("TASK_RUNNING", running.task_updated.state)
+        self.assertEqual("mesos-loadtest", running.task_details().Name)
+        self.assertEqual("TASK_FINISHED", finished.task_updated.state)
+        self.assertIsNone(finished.task_details())
+        self.assertEqual(
+            {task_id},
+            {e.task_updated.status.task_id.value for e in (running, finished)},
+        )
+
+    async def test_agent_serves_sandbox_of_launched_tasks(self):
+        added = (await self._read_events(2))[1]
+        agent_id = added.task_added.task.agent_id.value
+        agent, = [a for a in self.cluster.agents if a.id == agent_id]
+        address = f"http://127.0.0.1:{agent.port}"
+
+        state = await (await self.session.get(f"{address}/state")).json()
+        executor, = state["frameworks"][0]["completed_executors"]
+        self.assertEqual(added.task_added.task.task_id.value, executor["id"])
+
+        files = await (
+            await self.session.get(
+                f"{address}/files/browse?path={executor['directory']}"
+            )
+        ).json()
+        self.assertEqual(
+            [
+                (f"{executor['directory']}/stdout", 10),
+                (f"{executor['directory']}/stderr", 10),
+            ],
+            [(f["path"], f["size"]) for f in files],
+        )
+        content = await (
+            await self.session.get(
+                f"{address}/files/read?path=stdout&offset=4&length=100"
+            )
+        ).json()
+        self.assertEqual("x" * 6, content["data"])
+
+    async def test_slaves_endpoint(self):
+        agent = self.cluster.agents[1]
+        resp = await self.session.get(
+            f"{self.cluster.master_url}/slaves?slave_id={agent.id}"
+        )
+        self.assertEqual(
+            {
+                "slaves": [
+                    {
+                        "id": agent.id,
+                        "hostname": "127.0.0.1",
+                        "port": agent.port,
+                    }
+                ]
+            },
+            await resp.json(),
+        )
+
+    async def test_bulk_measures_latency_of_emitted_events(self):
+        added = (await self._read_events(2))[1]
+        task_id = added.task_added.task.task_id.value
+        doc = {
+            "namespace": "loadtest",
+            "task": {"id": task_id.split("_", 1)[1]},
+            "status": "TASK_STAGING",
+        }
+        action = {"index": {"_index": "i", "_type": "event", "_id": "1"}}
+        body = f"{json.dumps(action)}\n{json.dumps(doc)}\n" * 2
+        resp = await self.session.post(
+            f"{self.cluster.es_url}/_bulk", data=body
+        )
+        data = await resp.json()
+        self.assertFalse(data["errors"])
+        self.assertEqual(2, len(data["items"]))
+
+        stats = await self.cluster.stats()
+        self.assertEqual(1, stats["events-indexed"])
+        self.assertEqual(1, stats["duplicates"])
+        self.assertEqual(1, len(stats["latencies"]))
+        self.assertEqual(
+            0, (await self.cluster.stats(since=float("inf")))["indexed"]
+        )
+        self.assertEqual(1, stats["requests"]["elasticsearch POST /_bulk 200"])
+
+    async def test_inject_errors(self):
+        cluster = FakeCluster(
+            FakeClusterConfig(agents=1, agent_error_rate=1, es_error_rate=1)
+        )
+        await cluster.start()
+        agent = cluster.agents[0]
+        resp = await self.session.get(f"http://127.0.0.1:{agent.port}/state")
+        self.assertEqual(503, resp.status)
+        resp = await self.session.post(f"{cluster.es_url}/_bulk", data="")
+        self.assertEqual(503, resp.status)
+        self.assertEqual(
+            {"agent GET /state 503": 1, "elasticsearch POST /_bulk 503": 1},
+            (await cluster.stats())["requests"],
+        )
+        await cluster.close()
+
+
+class LoadTestHarnessTest(BaseTestCase):
+    async def test_run_consumer_against_fake_cluster(self):
+        cluster = FakeCluster(FakeClusterConfig(event_rate=100, agents=2))
+        await cluster.start()
+        with mock.patch(
+            "indexer.mesos.events.consumer.logger", LOGGER_MOCK
+        ), mock.patch("indexer.consumer.logger", LOGGER_MOCK), mock.patch(
+            "indexer.writter.logger", LOGGER_MOCK
+        ):
+            report = await run_load_test(
+                cluster,
+                duration=1.5,
+                settings_overrides={
+                    "PIPELINE_ENRICH_DELAY": 0.0,
+                    "ES_BULK_LINGER": 0.05,
+                },
+            )
+        await cluster.close()
+
+        self.assertIsNone(report.error)
+        self.assertGreater(report.events_emitted, 0)
+        self.assertGreater(report.events_indexed, 0)
+        self.assertGreater(report.events_per_sec, 0)
+        self.assertLessEqual(report.latency_p50, report.latency_p99)
+        self.assertEqual(
+            report.events_indexed, report.outputs["elasticsearch"]["written"]
+        )
+        self.assertEqual(1, report.requests["master POST /api/v1 closed"])
+        self.assertIn("agent GET /state 200", report.requests)
+        self.assertIn("events/sec", format_report(report))
+        self.assertNotEqual([cluster.es_url], settings.ES_OUTPUT_URLS)
+
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(50.0, percentile(values, 50))
+        self.assertEqual(99.0, percentile(values, 99))
+        self.assertEqual(100.0, percentile(values, 100))
+        self.assertEqual(1.0, percentile([1.0], 99))
+        self.assertIsNone(percentile([], 50))
+
+    def test_override_settings_restores_values(self):
+        previous = settings.PIPELINE_WORKERS
+        with override_settings(PIPELINE_WORKERS=previous + 1):
+            self.assertEqual(previous + 1, settings.PIPELINE_WORKERS)
+        self.assertEqual(previous, settings.PIPELINE_WORKERS)
@@ -0,0 +1,56 @@
+from indexer.mesos.agents import AgentRegistry
+from indexer.mesos.models.spec import AgentIdSpec, AgentSpec
+from tests.base import BaseTestCase
+
+
+def agent(agent_id: str, hostname: str, port: int = 5051) -> AgentSpec:
+    return AgentSpec(
+        agent_info={
+            "id": {"value": agent_id},
+            "hostname": hostname,
+            "port": port,
+        }
+    )
+
+
+class AgentRegistryTest(BaseTestCase):
+    async def setUp(self):
+        self.registry = AgentRegistry()
+
+    async def test_load_agents_from_snapshot(self):
+        self.registry.load(
+            [agent("agent-1", "10.0.0.1"), agent("agent-2", "10.0.0.2", 5052)]
+        )
+        self.assertEqual(2, len(self.registry))
+        self.assertEqual(
+            "http://10.0.0.1:5051",
+            self.registry.get_address(AgentIdSpec(value="agent-1")),
+        )
+        self.assertEqual(
+            "http://10.0.0.2:5052",
+            self.registry.get_address(AgentIdSpec(value="agent-2")),
+        )
+
+    async def test_load_replaces_previous_agents(self):
+        self.registry.load([agent("agent-1", "10.0.0.1")])
+        self.registry.load([agent("agent-2", "10.0.0.2")])
+        self.assertIsNone(
+            self.registry.get_address(AgentIdSpec(value="agent-1"))
+        )
+        self.assertEqual(1, len(self.registry))
+
+    async def test_add_and_remove_agent(self):
+        self.registry.add(agent("agent-1", "10.0.0.1"))
+        self.assertEqual(
+            "http://10.0.0.1:5051",
+            self.registry.get_address(AgentIdSpec(value="agent-1")),
+        )
+
+        self.registry.remove(AgentIdSpec(value="agent-1"))
+        self.assertIsNone(
+            self.registry.get_address(AgentIdSpec(value="agent-1"))
+        )
+
+    async def test_remove_unknown_agent(self):
+        self.registry.remove(AgentIdSpec(value="agent-1"))
+        self.assertEqual(0, len(self.registry))
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import tempfile
+from copy import deepcopy
+
+from aiohttp.web import Request, StreamResponse
+from asynctest import mock
+from asyncworker import App, RouteTypes
+from asyncworker.testing import HttpClientContext
+
+from indexer import consumer as consumer_module
+from indexer.conf import Settings
+from indexer.connection import HTTPConnection
+from indexer.mesos.events import consumer as mesos_consumer_module
+from indexer.mesos.events import replay as replay_module
+from indexer.mesos.events.capture import (
+    HEADER,
+    StreamCapture,
+    capture_files,
+    read_capture,
+)
+from indexer.mesos.events.consumer import MesosEventConsumer
+from indexer.mesos.events.replay import ReplayConsumer
+from tests.base import LOGGER_MOCK, BaseTestCase
+from tests.mesos_events_consumer_test import mesos_task_added_event_data
+
+
+def task_added_record(i):
+    data = deepcopy(mesos_task_added_event_data)
+    data["task_added"]["task"]["task_id"]["value"] = f"sieve_sleep.{i}"
+    return json.dumps(data).encode()
+
+
+class StreamCaptureTest(BaseTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        self.now = 100.0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _capture(self, **kwargs):
+        options = {"max_file_size": 1024 * 1024, "max_files": 10}
+        options.update(kwargs)
+        return StreamCapture(self.directory, clock=lambda: self.now, **options)
+
+    def _paths(self):
+        return [
+            os.path.join(self.directory, name)
+            for name in capture_files(self.directory)
+        ]
+
+    def test_write_and_read_records_with_offsets(self):
+        capture = self._capture()
+        capture.start_stream()
+        capture.write(b'{"type": "SUBSCRIBED"}')
+        self.now += 1.5
+        capture.write(b'{"type": "HEARTBEAT"}')
+        capture.close()
+
+        path, = self._paths()
+        self.assertEqual(
+            [(0.0, b'{"type": "SUBSCRIBED"}'), (1.5, b'{"type": "HEARTBEAT"}')],
+            list(read_capture(path)),
+        )
+
+    def test_store_raw_recordio_bytes(self):
+        capture = self._capture()
+        capture.write(b'{"type": "HEARTBEAT"}')
+        capture.close()
+        with open(capture.path, "rb") as f:
+            self.assertEqual(
+                b'21\n{"type": "HEARTBEAT"}', f.read()[HEADER.size :]
+            )
+
+    def test_new_file_for_each_stream(self):
+        capture = self._capture()
+        capture.start_stream()
+        capture.write(b"1")
+        capture.start_stream()
+        capture.write(b"2")
+        capture.close()
+        self.assertEqual(
+            [[b"1"], [b"2"]],
+            [[r for _, r in read_capture(path)] for path in self._paths()],
+        )
+
+    def test_rotate_by_size_and_keep_only_newest_files(self):
+        capture = self._capture(max_file_size=1, max_files=2)
+        for record in (b"1", b"2", b"3"):
+            capture.write(record)
+        capture.close()
+        self.assertEqual(
+            [[b"2"], [b"3"]],
+            [[r for _, r in read_capture(path)] for path in self._paths()],
+        )
+
+    def test_compressed_capture(self):
+        capture = self._capture(compress=True)
+        capture.write(b'{"type": "HEARTBEAT"}')
+        capture.close()
+        self.assertTrue(capture.path.endswith(".capture.gz"))
+        self.assertEqual(
+            [(0.0, b'{"type": "HEARTBEAT"}')], list(read_capture(capture.path))
+        )
+
+    def test_stop_reading_on_incomplete_record(self):
+        capture = self._capture()
+        capture.write(b"complete")
+        capture.write(b"incomplete")
+        capture.close()
+        with open(capture.path, "r+b") as f:
+            f.truncate(os.path.getsize(capture.path) - 2)
+        self.assertEqual(
+            [b"complete"], [r for _, r in read_capture(capture.path)]
+        )
+
+    def test_read_empty_file(self):
+        path = os.path.join(self.directory, "empty.capture")
+        open(path, "wb").close()
+        self.assertEqual([], list(read_capture(path)))
+
+
+class CaptureAndReplayTest(BaseTestCase):
+    async def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with mock.patch.dict(
+            os.environ, TEST_MESOS_CAPTURE_DIR=self.tmpdir.name
+        ):
+            self.settings = Settings()
+
+    async def tearDown(self):
+        self.tmpdir.cleanup()
+
+    async def _capture_stream(self):
+        app = App()
+
+        @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
+        async def api_v1(request: Request):
+            records = [
+                b'{"type": "SUBSCRIBED"}',
+                task_added_record(0),
+                task_added_record(1),
+            ]
+            resp = StreamResponse(status=200)
+            await resp.prepare(request)
+            stream = b"".join(b"%d\n%s" % (len(r), r) for r in records)
+            await resp.write(stream[:30])
+            await resp.write(stream[30:])
+            return resp
+
+        with mock.patch.object(
+            mesos_consumer_module, "settings", self.settings
+        ):
+            async with HttpClientContext(app) as client:
+                url = f"http://{client._server.host}:{client._server.port}"
+                consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+                await consumer.connect()
+                events = [ev async for ev in consumer.events()]
+                await consumer.close()
+        return events
+
+    async def test_capture_stream_records(self):
+        events = await self._capture_stream()
+        self.assertEqual(2, len(events))
+        path, = capture_files(self.tmpdir.name)
+        records = [
+            r for _, r in read_capture(os.path.join(self.tmpdir.name, path))
+        ]
+        self.assertEqual(
+            [
+                b'{"type": "SUBSCRIBED"}',
+                task_added_record(0),
+                task_added_record(1),
+            ],
+            records,
+        )
+
+    async def test_replay_captured_stream_through_the_pipeline(self):
+        live_events = await self._capture_stream()
+        path = os.path.join(
+            self.tmpdir.name, capture_files(self.tmpdir.name)[0]
+        )
+
+        consumer = ReplayConsumer([path])
+        self.assertIsNone(consumer.capture)
+        written = []
+
+        async def write_output(events):
+            written.extend(events)
+
+        with mock.patch.object(
+            consumer, "write_output", write_output
+        ), mock.patch.object(replay_module, "logger", LOGGER_MOCK):
+            await asyncio.wait_for(consumer.start(), 5)
+
+        self.assertEqual(3, consumer.replayed)
+        self.assertEqual([e.id for e in live_events], [e.id for e in written])
+
+    async def test_replay_does_not_create_a_capture(self):
+        capture_dir = os.path.join(self.tmpdir.name, "replay-capture")
+        with mock.patch.dict(os.environ, TEST_MESOS_CAPTURE_DIR=capture_dir):
+            settings_stub = Settings()
+        with mock.patch.object(
+            mesos_consumer_module, "settings", settings_stub
+        ):
+            consumer = ReplayConsumer([])
+        self.assertIsNone(consumer.capture)
+        self.assertFalse(os.path.exists(capture_dir))
+        await consumer.close()
+
+    async def test_replay_does_not_wait_for_enrich_delay(self):
+        await self._capture_stream()
+        path = os.path.join(
+            self.tmpdir.name, capture_files(self.tmpdir.name)[0]
+        )
+        with mock.patch.dict(os.environ, TEST_PIPELINE_ENRICH_DELAY="60"):
+            settings_stub = Settings()
+
+        consumer = ReplayConsumer([path])
+        with mock.patch.object(
+            consumer, "write_output", mock.CoroutineMock()
+        ), mock.patch.object(
+            consumer_module, "settings", settings_stub
+        ), mock.patch.object(
+            replay_module, "logger", LOGGER_MOCK
+        ):
+            await asyncio.wait_for(consumer.start(), 5)
+        self.assertEqual(3, consumer.replayed)
+
+    async def test_replay_at_original_pacing(self):
+        capture = StreamCapture(
+            self.tmpdir.name, max_file_size=1024, max_files=1
+        )
+        capture.write(b'{"type": "SUBSCRIBED"}')
+        capture._started_at -= 0.2
+        capture.write(task_added_record(0))
+        capture.close()
+
+        consumer = ReplayConsumer([capture.path], speed=2.0)
+        loop = asyncio.get_event_loop()
+        started_at = loop.time()
+        with mock.patch.object(replay_module, "logger", LOGGER_MOCK):
+            events = [ev async for ev in consumer.events()]
+        self.assertEqual(1, len(events))
+        self.assertGreaterEqual(loop.time() - started_at, 0.1)
@@ -1,4 +1,6 @@
+import asyncio
 import json
+import time
 
 from aiohttp.client import ClientError, ClientSession
 from aioresponses import aioresponses
@@ -124,6 +126,61 @@ class MesosClientTest(TestCase):
                     AgentIdSpec(value=self.agent_id)
                 )
 
+    async def test_get_slave_address_uses_cache(self):
+        with aioresponses() as rsps:
+            rsps.get(
+                f"{settings.MESOS_MASTER_URLS[0]}/slaves?slave_id={self.agent_id}",
+                status=200,
+                payload=mesos_api_response_data,
+            )
+            for _ in range(3):
+                agent_addr = await self.mesos_client.get_agent_address(
+                    AgentIdSpec(value=self.agent_id)
+                )
+                self.assertEqual("http://10.234.172.50:5051", agent_addr)
+
+            self.assertEqual(
+                1, sum(len(calls) for calls in rsps.requests.values())
+            )
+            self.assertEqual(2, self.mesos_client.agent_address_cache.hits)
+            self.assertEqual(1, self.mesos_client.agent_address_cache.misses)
+
+    async def test_get_slave_address_fetch_again_after_cache_ttl(self):
+        self.mesos_client.agent_address_cache.set(
+            self.agent_id, "http://10.0.0.1:5051", ttl=0
+        )
+        with aioresponses() as rsps:
+            rsps.get(
+                f"{settings.MESOS_MASTER_URLS[0]}/slaves?slave_id={self.agent_id}",
+                status=200,
+                payload=mesos_api_response_data,
+            )
+            agent_addr = await self.mesos_client.get_agent_address(
+                AgentIdSpec(value=self.agent_id)
+            )
+            self.assertEqual("http://10.234.172.50:5051", agent_addr)
+
+    async def test_get_slave_address_slave_not_found_is_cached(self):
+        """
+        Um agent não encontrado também fica em cache. Enquanto essa entrada
+        não expirar não fazemos novos requests para o mesos master
+        """
+        with aioresponses() as rsps:
+            rsps.get(
+                f"{settings.MESOS_MASTER_URLS[0]}/slaves?slave_id={self.agent_id}",
+                status=200,
+                payload=mesos_api_response_empty_data,
+            )
+            for _ in range(2):
+                with self.assertRaises(AgentNotFoundException):
+                    await self.mesos_client.get_agent_address(
+                        AgentIdSpec(value=self.agent_id)
+                    )
+            self.assertEqual(
+                1, sum(len(calls) for calls in rsps.requests.values())
+            )
+            self.assertEqual(1, self.mesos_client.agent_address_cache.hits)
+
     async def test_task_info_active_framework_completed_executors(self):
         task_id = TaskIdSpec(value="ct:1581360840007:0:asgard-my-app:")
         expected_directory_value = "/tmp/mesos/slaves/79ad3a13-b567-4273-ac8c-30378d35a439-S6563/frameworks/4783cf15-4fb1-4c75-90fe-44eeec5258a7-0001/executors/ct:1581360840007:0:asgard-heimdall:/runs/2bca2a9b-2eea-48a9-9b18-b69b1c5118f7"
@@ -169,16 +226,145 @@ class MesosClientTest(TestCase):
             )
             self.assertIsNone(task_info)
 
+    async def test_task_info_reuses_agent_state_snapshot(self):
+        with aioresponses() as rsps:
+            rsps.get(
+                f"{self.agent_addr}/state",
+                status=200,
+                payload=self.agent_state_dict,
+            )
+            task_info = await self.mesos_client.get_task_info(
+                self.agent_addr,
+                TaskIdSpec(value="ct:1581360840007:0:asgard-my-app:"),
+            )
+            self.assertIsNotNone(task_info)
+            task_info = await self.mesos_client.get_task_info(
+                self.agent_addr,
+                TaskIdSpec(value="asgard_webapp_apis_billing.2bca2a9b"),
+            )
+            self.assertIsNotNone(task_info)
+            self.assertEqual(
+                1, sum(len(calls) for calls in rsps.requests.values())
+            )
+
+    async def test_task_info_concurrent_calls_share_agent_state_request(self):
+        with aioresponses() as rsps:
+            rsps.get(
+                f"{self.agent_addr}/state",
+                status=200,
+                payload=self.agent_state_dict,
+            )
+            task_infos = await asyncio.gather(
+                *[
+                    self.mesos_client.get_task_info(
+                        self.agent_addr,
+                        TaskIdSpec(value="ct:1581360840007:0:asgard-my-app:"),
+                    )
+                    for _ in range(3)
+                ]
+            )
+            self.assertEqual(3, len([info for info in task_infos if info]))
+            self.assertEqual(
+                1, sum(len(calls) for calls in rsps.requests.values())
+            )
+            self.assertEqual({}, self.mesos_client._agent_state_requests)
+
+    async def test_task_info_fetch_agent_state_again_after_cache_ttl(self):
+        task_id = TaskIdSpec(value="ct:1581360840007:0:asgard-my-app:")
+        with aioresponses() as rsps:
+            rsps.get(
+                f"{self.agent_addr}/state",
+                status=200,
+                payload={"frameworks": [], "completed_frameworks": []},
+            )
+            rsps.get(
+                f"{self.agent_addr}/state",
+                status=200,
+                payload=self.agent_state_dict,
+            )
+            self.assertIsNone(
+                await self.mesos_client.get_task_info(self.agent_addr, task_id)
+            )
+            self.mesos_client.agent_state_cache.clear()
+            self.assertIsNotNone(
+                await self.mesos_client.get_task_info(self.agent_addr, task_id)
+            )
+
+    async def test_task_info_ignores_agent_state_older_than_the_task(self):
+        """
+        Um /state em cache buscado antes da task terminar ainda não tem a
+        task, então buscamos de novo.
+        """
+        task_id = TaskIdSpec(value="ct:1581360840007:0:asgard-my-app:")
+        with aioresponses() as rsps:
+            rsps.get(
+                f"{self.agent_addr}/state",
+                status=200,
+                payload={"frameworks": [], "completed_frameworks": []},
+            )
+            rsps.get(
+                f"{self.agent_addr}/state",
+                status=200,
+                payload=self.agent_state_dict,
+            )
+            self.assertIsNone(
+                await self.mesos_client.get_task_info(self.agent_addr, task_id)
+            )
+            finished_at = time.time()
+            self.assertIsNone(
+                await self.mesos_client.get_task_info(
+                    self.agent_addr, task_id, not_before=finished_at - 60
+                )
+            )
+            self.assertIsNotNone(
+                await self.mesos_client.get_task_info(
+                    self.agent_addr, task_id, not_before=finished_at
+                )
+            )
+            self.assertEqual(
+                2, sum(len(calls) for calls in rsps.requests.values())
+            )
+
+    async def test_task_info_uses_cached_agent_state_that_has_the_task(self):
+        task_id = TaskIdSpec(value="ct:1581360840007:0:asgard-my-app:")
+        with aioresponses() as rsps:
+            rsps.get(
+                f"{self.agent_addr}/state",
+                status=200,
+                payload=self.agent_state_dict,
+            )
+            self.assertIsNotNone(
+                await self.mesos_client.get_task_info(self.agent_addr, task_id)
+            )
+            self.assertIsNotNone(
+                await self.mesos_client.get_task_info(
+                    self.agent_addr, task_id, not_before=time.time() + 60
+                )
+            )
+            self.assertEqual(
+                1, sum(len(calls) for calls in rsps.requests.values())
+            )
+
+    async def test_task_info_agent_state_error_is_not_cached(self):
+        task_id = TaskIdSpec(value="ct:1581360840007:0:asgard-my-app:")
+        with aioresponses() as rsps:
+            rsps.get(f"{self.agent_addr}/state", exception=ClientError())
+            rsps.get(
+                f"{self.agent_addr}/state",
+                status=200,
+                payload=self.agent_state_dict,
+            )
+            with self.assertRaises(ClientError):
+                await self.mesos_client.get_task_info(self.agent_addr, task_id)
+            self.assertIsNotNone(
+                await self.mesos_client.get_task_info(self.agent_addr, task_id)
+            )
+
     async def test_get_task_file_size_less_than_4k(self):
         task_id = "task-id"
         directory = "/tmp/mesos/slaves/79ad3a13-b567-4273-ac8c-30378d35a439-S6563/frameworks/4783cf15-4fb1-4c75-90fe-44eeec5258a7-0001/executors/ct:1581360780082:0:asgard-heimdall:/runs/4d70dbf3-8131-402b-a026-a2d8e7f7ae7e"
         task_info = CompletedTaskInfo(id=task_id, directory=directory)
         with aioresponses() as rsps:
-            rsps.get(
-                f"{self.agent_addr}/files/browse?path={directory}",
-                status=200,
-                payload=task_file_list_less_than_4k_size,
-            )
             rsps.get(
                 f"{self.agent_addr}/files/browse?path={directory}",
                 status=200,
@@ -212,11 +398,6 @@ class MesosClientTest(TestCase):
                 status=200,
                 payload=task_file_list_more_than_4k_size,
             )
-            rsps.get(
-                f"{self.agent_addr}/files/browse?path={directory}",
-                status=200,
-                payload=task_file_list_more_than_4k_size,
-            )
 
             stdout_offset = 12798 - settings.TASK_FILE_CONTENT_LENGTH
             rsps.get(
@@ -264,10 +445,31 @@ class MesosClientTest(TestCase):
                 status=200,
                 payload=[{"path": f"{directory}/other-file", "size": 42}],
             )
+            rsps.get(
+                f"{self.agent_addr}/files/read?path={directory}/stdout&length=4096&offset=0",
+                status=200,
+                payload={"data": "stdout-output from task", "offset": 0},
+            )
+            rsps.get(
+                f"{self.agent_addr}/files/read?path={directory}/stderr&length=4096&offset=0",
+                status=200,
+                payload={"data": "stderr-output from task", "offset": 0},
+            )
+            task_output_data = await self.mesos_client.get_task_output_data(
+                self.agent_addr, task_info
+            )
+
+            self.assertEqual("stdout-output from task", task_output_data.stdout)
+
+    async def test_get_task_output_data_browse_task_directory_once(self):
+        task_id = "task-id"
+        directory = "/tmp/mesos/slaves/79ad3a13-b567-4273-ac8c-30378d35a439-S6563/frameworks/4783cf15-4fb1-4c75-90fe-44eeec5258a7-0001/executors/ct:1581360780082:0:asgard-heimdall:/runs/4d70dbf3-8131-402b-a026-a2d8e7f7ae7e"
+        task_info = CompletedTaskInfo(id=task_id, directory=directory)
+        with aioresponses() as rsps:
             rsps.get(
                 f"{self.agent_addr}/files/browse?path={directory}",
                 status=200,
-                payload=[{"path": f"{directory}/other-file", "size": 42}],
+                payload=task_file_list_less_than_4k_size,
             )
             rsps.get(
                 f"{self.agent_addr}/files/read?path={directory}/stdout&length=4096&offset=0",
@@ -279,8 +481,17 @@ class MesosClientTest(TestCase):
                 status=200,
                 payload={"data": "stderr-output from task", "offset": 0},
             )
-            task_output_data = await self.mesos_client.get_task_output_data(
+            await self.mesos_client.get_task_output_data(
                 self.agent_addr, task_info
             )
 
-            self.assertEqual("stdout-output from task", task_output_data.stdout)
+            browse_calls = [
+                call
+                for (method, url), calls in rsps.requests.items()
+                for call in calls
+                if url.path == "/files/browse"
+            ]
+            self.assertEqual(1, len(browse_calls))
+            self.assertEqual(
+                3, sum(len(calls) for calls in rsps.requests.values())
+            )
@@ -1,5 +1,9 @@
 import json
+from base64 import b64decode, b64encode
 
+from asynctest import mock
+
+from indexer.mesos.models import spec as spec_module
 from indexer.mesos.models.event import MesosEvent
 from tests.base import BaseTestCase, FIXTURE_DIR
 
@@ -54,6 +58,39 @@ mesos_task_added_event_data = {
     "type": "TASK_ADDED",
 }
 
+mesos_subscribed_event_data = {
+    "subscribed": {
+        "get_state": {
+            "get_agents": {
+                "agents": [
+                    {
+                        "active": True,
+                        "agent_info": {
+                            "hostname": "10.234.172.50",
+                            "id": {
+                                "value": "79ad3a13-b567-4273-ac8c-30378d35a439-S6563"
+                            },
+                            "port": 5051,
+                        },
+                    }
+                ],
+                "recovered_agents": [],
+            },
+            "get_tasks": {},
+        },
+        "heartbeat_interval_seconds": 15.0,
+    },
+    "type": "SUBSCRIBED",
+}
+
+
+mesos_agent_removed_event_data = {
+    "agent_removed": {
+        "agent_id": {"value": "79ad3a13-b567-4273-ac8c-30378d35a439-S6563"}
+    },
+    "type": "AGENT_REMOVED",
+}
+
 
 class MesosEventModelTest(BaseTestCase):
     async def setUp(self):
@@ -87,6 +124,38 @@ class MesosEventModelTest(BaseTestCase):
         mesos_event = MesosEvent(**mesos_task_added_event_data)
         self.assertIsNone(mesos_event.task_details())
 
+    async def test_task_details_is_decoded_only_once(self):
+        mesos_event = MesosEvent(**self.mesos_state_running_event_dict)
+        status = mesos_event.task_updated.status
+        with mock.patch.object(
+            spec_module, "b64decode", wraps=b64decode
+        ) as b64decode_mock:
+            task_details = mesos_event.task_details()
+            self.assertIs(task_details, status.task_details())
+            self.assertIs(status.task_data(), status.task_data())
+            self.assertEqual(1, b64decode_mock.call_count)
+
+            inspect = json.loads(b64decode(status.data))
+            status.data = b64encode(json.dumps(inspect).encode()).decode()
+            self.assertIsNot(task_details, status.task_details())
+            self.assertEqual(task_details, status.task_details())
+            self.assertEqual(2, b64decode_mock.call_count)
+        self.assertNotIn("_task_data", status.dict())
+
+    async def test_task_data_keeps_only_fields_used_by_task_details(self):
+        mesos_event = MesosEvent(**self.mesos_state_running_event_dict)
+        task_data = mesos_event.task_updated.status.task_data()
+        self.assertEqual(
+            {"Name", "config", "State", "HostConfig", "Mounts"}, set(task_data)
+        )
+        self.assertEqual(
+            {"Hostname", "Image", "Labels"}, set(task_data["config"])
+        )
+        self.assertEqual(
+            {"Type", "Source", "Destination", "Mode", "RW"},
+            set(task_data["Mounts"][0]),
+        )
+
     async def test_can_parse_task_updated_state_running(self):
 
         mesos_event = MesosEvent(**self.mesos_state_running_event_dict)
@@ -164,3 +233,42 @@ class MesosEventModelTest(BaseTestCase):
             "ct:1581355920078:0:asgard-heimdall:",
             mesos_event.task_updated.status.executor_id.value,
         )
+
+    async def test_can_parse_subscribed_with_agents(self):
+        mesos_event = MesosEvent(**mesos_subscribed_event_data)
+        agents = mesos_event.subscribed.agents()
+        self.assertEqual(1, len(agents))
+        self.assertEqual(
+            "79ad3a13-b567-4273-ac8c-30378d35a439-S6563",
+            agents[0].agent_info.id.value,
+        )
+        self.assertEqual(
+            "http://10.234.172.50:5051", agents[0].agent_info.address()
+        )
+
+    async def test_can_parse_subscribed_without_state(self):
+        mesos_event = MesosEvent(**{"type": "SUBSCRIBED", "subscribed": {}})
+        self.assertEqual([], mesos_event.subscribed.agents())
+
+    async def test_can_parse_agent_added(self):
+        mesos_event = MesosEvent(
+            **{
+                "type": "AGENT_ADDED",
+                "agent_added": {
+                    "agent": mesos_subscribed_event_data["subscribed"][
+                        "get_state"
+                    ]["get_agents"]["agents"][0]
+                },
+            }
+        )
+        self.assertEqual(
+            "http://10.234.172.50:5051",
+            mesos_event.agent_added.agent.agent_info.address(),
+        )
+
+    async def test_can_parse_agent_removed(self):
+        mesos_event = MesosEvent(**mesos_agent_removed_event_data)
+        self.assertEqual(
+            "79ad3a13-b567-4273-ac8c-30378d35a439-S6563",
+            mesos_event.agent_removed.agent_id.value,
+        )
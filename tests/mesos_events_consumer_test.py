@@ -1,6 +1,9 @@
+import asyncio
 import json
+import os
+from copy import deepcopy
 
-from aiohttp.client import ClientTimeout, ClientSession
+from aiohttp.client import ClientResponseError, ClientSession
 from aiohttp.web import Request, StreamResponse
 from aioresponses import aioresponses
 from asynctest import mock
@@ -9,7 +12,8 @@ from asyncworker import App, RouteTypes
 from asyncworker.testing import HttpClientContext
 from yarl import URL
 
-from indexer.conf import settings
+from indexer import metrics
+from indexer.conf import Settings, settings
 from indexer.connection import HTTPConnection
 from indexer.mesos.client import MesosClient
 from indexer.mesos.events import consumer as mesos_consumer_module
@@ -17,7 +21,8 @@ from indexer.mesos.events.consumer import MesosEventConsumer, timeout_config
 from indexer.mesos.models.converters.taskupdated import (
     MesosTaskUpdatedEventConverter,
 )
-from indexer.mesos.models.spec import TaskIdSpec
+from indexer.mesos.models.event import MesosEvent
+from indexer.mesos.models.spec import TaskIdSpec, AgentIdSpec
 from indexer.mesos.models.taskupdated import MesosTaskUpdatedEvent
 from indexer.models.event import BackendInfoTypes, EventSourceSpec
 from tests.base import LOGGER_MOCK, BaseTestCase, FIXTURE_DIR
@@ -80,6 +85,36 @@ task_file_list_less_than_4k_size = [
     },
 ]
 
+mesos_subscribed_event_data = {
+    "subscribed": {
+        "get_state": {
+            "get_agents": {
+                "agents": [
+                    {
+                        "agent_info": {
+                            "hostname": "10.234.172.50",
+                            "id": {
+                                "value": "79ad3a13-b567-4273-ac8c-30378d35a439-S6563"
+                            },
+                            "port": 5051,
+                        }
+                    },
+                    {
+                        "agent_info": {
+                            "hostname": "10.234.172.51",
+                            "id": {
+                                "value": "79ad3a13-b567-4273-ac8c-30378d35a439-S6564"
+                            },
+                            "port": 5051,
+                        }
+                    },
+                ]
+            }
+        }
+    },
+    "type": "SUBSCRIBED",
+}
+
 
 class MesosConsumerTest(BaseTestCase):
     async def setUp(self):
@@ -143,6 +178,289 @@ class MesosConsumerTest(BaseTestCase):
             self.assertEqual("sieve", events[0].namespace)
             self.assertEqual("sleep", events[0].appname)
 
+    async def test_parse_many_events_in_one_chunk_and_event_split_in_chunks(
+        self
+    ):
+        app = App()
+
+        @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
+        async def api_v1(request: Request):
+            records = []
+            for i in range(3):
+                event_data = deepcopy(mesos_task_added_event_data)
+                event_data["task_added"]["task"]["task_id"][
+                    "value"
+                ] = f"sieve_sleep.{i}"
+                event_str = json.dumps(event_data)
+                records.append(f"{len(event_str)}\n{event_str}".encode("utf-8"))
+            resp = StreamResponse(status=200)
+            await resp.prepare(request)
+            await resp.write(records[0] + records[1] + records[2][:10])
+            await resp.write(records[2][10:])
+            return resp
+
+        async with HttpClientContext(app) as client:
+            url = f"http://{client._server.host}:{client._server.port}"
+            consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+            await consumer.connect()
+            events = [ev async for ev in consumer.events()]
+            self.assertEqual(3, len(events))
+            self.assertEqual(
+                ["sleep.0", "sleep.1", "sleep.2"], [ev.task.id for ev in events]
+            )
+
+    async def test_collect_metrics_while_consuming_events(self):
+        app = App()
+
+        @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
+        async def api_v1(request: Request):
+            event_str = json.dumps(mesos_task_added_event_data)
+            resp = StreamResponse(status=200)
+            await resp.prepare(request)
+            await resp.write(f"{len(event_str)}\n{event_str}".encode("utf-8"))
+            return resp
+
+        received = metrics.EVENTS_RECEIVED.labels("TASK_ADDED")
+        subscribes = metrics.HTTP_REQUESTS.labels("mesos-master", "200")
+        before = (
+            received.value,
+            subscribes.value,
+            metrics.PARSE_DURATION.count,
+            metrics.CONVERT_DURATION.count,
+        )
+        async with HttpClientContext(app) as client:
+            url = f"http://{client._server.host}:{client._server.port}"
+            consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+            await consumer.connect()
+            [ev async for ev in consumer.events()]
+            await consumer.close()
+        self.assertEqual(
+            (before[0] + 1, before[1] + 1, before[2] + 1, before[3] + 1),
+            (
+                received.value,
+                subscribes.value,
+                metrics.PARSE_DURATION.count,
+                metrics.CONVERT_DURATION.count,
+            ),
+        )
+
+    async def test_stamp_ingest_info_only_if_enabled(self):
+        app = App()
+
+        @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
+        async def api_v1(request: Request):
+            event_str = json.dumps(mesos_task_added_event_data)
+            resp = StreamResponse(status=200)
+            await resp.prepare(request)
+            await resp.write(f"{len(event_str)}\n{event_str}".encode("utf-8"))
+            return resp
+
+        with mock.patch.dict(os.environ, TEST_INGEST_TIMING_ENABLED="true"):
+            enabled_settings = Settings()
+
+        events = []
+        async with HttpClientContext(app) as client:
+            url = f"http://{client._server.host}:{client._server.port}"
+            for settings_stub in (settings, enabled_settings):
+                with mock.patch.object(
+                    mesos_consumer_module, "settings", settings_stub
+                ):
+                    consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+                    await consumer.connect()
+                    events.extend([ev async for ev in consumer.events()])
+                    await consumer.close()
+        self.assertIsNone(events[0].ingest)
+        self.assertIsNotNone(events[1].ingest.received_at)
+        self.assertLessEqual(
+            events[1].ingest.received_at, events[1].ingest.converted_at
+        )
+        self.assertIsNone(events[1].ingest.enriched_at)
+
+    async def test_keep_agent_registry_from_agent_events(self):
+        app = App()
+
+        agent_added_data = {
+            "type": "AGENT_ADDED",
+            "agent_added": {
+                "agent": {
+                    "agent_info": {
+                        "hostname": "10.234.172.52",
+                        "id": {"value": "agent-added"},
+                        "port": 5051,
+                    }
+                }
+            },
+        }
+        agent_removed_data = {
+            "type": "AGENT_REMOVED",
+            "agent_removed": {
+                "agent_id": {
+                    "value": "79ad3a13-b567-4273-ac8c-30378d35a439-S6564"
+                }
+            },
+        }
+
+        @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
+        async def api_v1(request: Request):
+            resp = StreamResponse(status=200)
+            await resp.prepare(request)
+            for event_data in [
+                mesos_subscribed_event_data,
+                agent_added_data,
+                agent_removed_data,
+            ]:
+                event_str = json.dumps(event_data)
+                await resp.write(
+                    f"{len(event_str)}\n{event_str}".encode("utf-8")
+                )
+            return resp
+
+        async with HttpClientContext(app) as client:
+            url = f"http://{client._server.host}:{client._server.port}"
+            consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+            await consumer.connect()
+            events = [ev async for ev in consumer.events()]
+            self.assertEqual([], events)
+            self.assertEqual(2, len(consumer.agents))
+            self.assertEqual(
+                "http://10.234.172.50:5051",
+                consumer.agents.get_address(AgentIdSpec(value=self.agent_id)),
+            )
+            self.assertEqual(
+                "http://10.234.172.52:5051",
+                consumer.agents.get_address(AgentIdSpec(value="agent-added")),
+            )
+
+    async def test_reconnect_if_heartbeats_stop_arriving(self):
+        """
+        Depois de settings.MESOS_MAX_MISSED_HEARTBEATS intervalos sem
+        receber nada o stream é considerado parado.
+        """
+        app = App()
+
+        @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
+        async def api_v1(request: Request):
+            resp = StreamResponse(status=200)
+            await resp.prepare(request)
+            for event_data in [
+                {
+                    "type": "SUBSCRIBED",
+                    "subscribed": {"heartbeat_interval_seconds": 0.05},
+                },
+                {"type": "HEARTBEAT"},
+            ]:
+                event_str = json.dumps(event_data)
+                await resp.write(
+                    f"{len(event_str)}\n{event_str}".encode("utf-8")
+                )
+            await asyncio.sleep(1)
+            return resp
+
+        loop = asyncio.get_event_loop()
+        with mock.patch(
+            "indexer.mesos.events.consumer.logger", LOGGER_MOCK
+        ) as logger_mock:
+            logger_mock.reset_mock()
+            async with HttpClientContext(app) as client:
+                url = f"http://{client._server.host}:{client._server.port}"
+                consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+                await consumer.connect()
+                started_at = loop.time()
+                with self.assertRaises(asyncio.TimeoutError):
+                    [ev async for ev in consumer.events()]
+                self.assertLess(loop.time() - started_at, 0.5)
+                self.assertEqual(0.05, consumer.heartbeat_interval)
+                logger_mock.exception.assert_not_awaited()
+                logger_mock.error.assert_awaited_with(
+                    {"event": "mesos-stream-stalled", "stream-age": mock.ANY}
+                )
+                await consumer.close()
+
+    async def test_stream_age(self):
+        consumer = MesosEventConsumer(HTTPConnection(urls=[""]))
+        self.assertIsNone(consumer.stream_age())
+
+        consumer._last_record_at = asyncio.get_event_loop().time() - 10
+        self.assertGreaterEqual(consumer.stream_age(), 10)
+
+    async def test_readiness(self):
+        consumer = MesosEventConsumer(HTTPConnection(urls=[""]))
+        self.assertEqual(
+            {"subscribed": False, "heartbeat": False},
+            {
+                check: ok
+                for check, ok in consumer.readiness().items()
+                if not check.startswith("output-")
+            },
+        )
+
+        consumer.subscribed = True
+        consumer._last_record_at = asyncio.get_event_loop().time()
+        self.assertTrue(consumer.readiness()["subscribed"])
+        self.assertTrue(consumer.readiness()["heartbeat"])
+
+        consumer._last_record_at -= consumer.heartbeat_interval * 10
+        self.assertFalse(consumer.readiness()["heartbeat"])
+
+    async def test_subscribed_after_receiving_subscribed_event(self):
+        async with HttpClientContext(self.app) as client:
+            url = f"http://{client._server.host}:{client._server.port}"
+            consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+            await consumer.connect()
+            self.assertFalse(consumer.subscribed)
+            self.assertIsNone(consumer._established_at)
+            [ev async for ev in consumer.events()]
+            self.assertTrue(consumer.subscribed)
+            self.assertIsNotNone(consumer._established_at)
+            await consumer.close()
+            self.assertFalse(consumer.subscribed)
+
+    async def test_request_target(self):
+        consumer = MesosEventConsumer(HTTPConnection(urls=[""]))
+        self.assertEqual(
+            "mesos-master",
+            consumer._request_target(URL("http://10.0.0.1:5050/slaves")),
+        )
+        self.assertEqual(
+            "mesos-agent",
+            consumer._request_target(URL("http://10.0.0.2:5051/state")),
+        )
+        self.assertEqual(
+            "mesos-agent",
+            consumer._request_target(URL("http://10.0.0.2:5051/files/read")),
+        )
+
+    async def test_metrics_include_caches_and_duplicates(self):
+        consumer = MesosEventConsumer(HTTPConnection(urls=[""]))
+        consumer.mesos_client = MesosClient(ClientSession(), consumer.conn)
+        consumer.mesos_client.agent_address_cache.get("missing")
+        consumer.dedup.duplicates = 3
+        consumer._last_record_at = asyncio.get_event_loop().time()
+
+        families = {family.name: family for family in consumer.metrics()}
+        self.assertEqual(
+            [
+                ({"cache": "agent-address"}, 0.0),
+                ({"cache": "agent-state"}, 0.0),
+            ],
+            families["indexer_cache_hits_total"].samples,
+        )
+        self.assertEqual(
+            [
+                ({"cache": "agent-address"}, 1.0),
+                ({"cache": "agent-state"}, 0.0),
+            ],
+            families["indexer_cache_misses_total"].samples,
+        )
+        self.assertEqual(
+            [({}, 3.0)], families["indexer_dedup_duplicates_total"].samples
+        )
+        self.assertEqual(
+            1, len(families["indexer_mesos_stream_age_seconds"].samples)
+        )
+        self.assertIn("indexer_output_events_total", families)
+        await consumer.mesos_client.http.close()
+
     async def test_parse_raw_mesos_event_data(self):
         """
         Parseia bytes e retorna MesosEvent
@@ -178,12 +496,17 @@ class MesosConsumerTest(BaseTestCase):
 
         @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
         async def api_v1(request: Request):
-            event_str = json.dumps(mesos_task_added_event_data)
-            len_data = len(event_str)
             resp = StreamResponse(status=200)
             await resp.prepare(request)
-            await resp.write(f"{len_data}\n{event_str}".encode("utf-8"))
-            await resp.write(f"{len_data}\n{event_str}".encode("utf-8"))
+            for i in range(2):
+                event_data = deepcopy(mesos_task_added_event_data)
+                event_data["task_added"]["task"]["task_id"][
+                    "value"
+                ] = f"sieve_sleep.{i}"
+                event_str = json.dumps(event_data)
+                await resp.write(
+                    f"{len(event_str)}\n{event_str}".encode("utf-8")
+                )
             await resp.write(
                 f"{unknown_event_len}\n{unknown_event_str}".encode("utf-8")
             )
@@ -252,41 +575,180 @@ class MesosConsumerTest(BaseTestCase):
                 events[0].dict(skip_defaults=True), asgard_event_expected_data
             )
 
+    async def test_skip_same_status_reported_by_different_sources(self):
+        """
+        O mesmo status reportado pelo executor e pelo agent (ou recebido de
+        novo depois de uma reconexão) só é entregue uma vez.
+        """
+        from_agent = deepcopy(mesos_state_finished_event_data)
+        from_agent["task_updated"]["status"]["source"] = "SOURCE_AGENT"
+        next_status = deepcopy(mesos_state_finished_event_data)
+        next_status["task_updated"]["status"]["timestamp"] += 1
+
+        app = App()
+
+        @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
+        async def api_v1(request: Request):
+            resp = StreamResponse(status=200)
+            await resp.prepare(request)
+            for event_data in [
+                mesos_state_finished_event_data,
+                from_agent,
+                next_status,
+            ]:
+                event_str = json.dumps(event_data)
+                await resp.write(
+                    f"{len(event_str)}\n{event_str}".encode("utf-8")
+                )
+            return resp
+
+        async with HttpClientContext(app) as client:
+            url = f"http://{client._server.host}:{client._server.port}"
+            consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+            await consumer.connect()
+            events = [ev async for ev in consumer.events()]
+            self.assertEqual(
+                ["2020-01-10T19:52:35+00:00", "2020-01-10T19:52:36+00:00"],
+                [ev.date for ev in events],
+            )
+            self.assertEqual(1, consumer.dedup.duplicates)
+
+    async def test_discard_repeated_task_added_event(self):
+        app = App()
+
+        @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
+        async def api_v1(request: Request):
+            event_str = json.dumps(mesos_task_added_event_data)
+            record = f"{len(event_str)}\n{event_str}".encode("utf-8")
+            resp = StreamResponse(status=200)
+            await resp.prepare(request)
+            await resp.write(record)
+            await asyncio.sleep(0.01)
+            await resp.write(record)
+            return resp
+
+        async with HttpClientContext(app) as client:
+            url = f"http://{client._server.host}:{client._server.port}"
+            consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+            await consumer.connect()
+            events = [ev async for ev in consumer.events()]
+            self.assertEqual(1, len(events))
+            self.assertEqual(1, consumer.dedup.duplicates)
+
     async def test_creates_client_session_with_timeout_options(self):
         with mock.patch.object(
             mesos_consumer_module, "ClientSession"
         ) as client_session_mock:
             client_session_mock.return_value = CoroutineMock(
-                post=CoroutineMock()
+                get=CoroutineMock(return_value=mock.Mock(status=503)),
+                post=CoroutineMock(return_value=mock.Mock(status=200)),
+                closed=False,
             )
             consumer = MesosEventConsumer(
                 HTTPConnection(urls=settings.MESOS_MASTER_URLS)
             )
             await consumer.connect()
-            client_session_mock.assert_called_with(timeout=timeout_config)
+            client_session_mock.assert_called_once()
+            _, kwargs = client_session_mock.call_args
+            self.assertEqual(timeout_config, kwargs["timeout"])
+            self.assertEqual(1, len(kwargs["trace_configs"]))
 
-    async def test_use_next_mesos_urls_if_needed(self):
+    async def test_reuse_client_session_across_reconnects(self):
+        mesos_base_url = "http://10.0.0.1:5050"
+        with aioresponses() as rsps:
+            rsps.post(f"{mesos_base_url}/api/v1", status=200)
+            rsps.post(f"{mesos_base_url}/api/v1", status=200)
+            consumer = MesosEventConsumer(HTTPConnection(urls=[mesos_base_url]))
+            await consumer.connect()
+            http_client = consumer.http_client
+            mesos_client = consumer.mesos_client
+            first_response = consumer.response
+
+            await consumer.connect()
+            self.assertIs(http_client, consumer.http_client)
+            self.assertIs(mesos_client, consumer.mesos_client)
+            self.assertIsNot(first_response, consumer.response)
+            self.assertTrue(first_response.closed)
+
+            await consumer.close()
+            self.assertTrue(http_client.closed)
+            self.assertIsNone(consumer.response)
+
+    async def test_subscribe_only_to_the_leader(self):
+        """
+        O /redirect de qualquer master aponta para o líder (sem o schema).
+        Apenas o líder recebe o SUBSCRIBE.
+        """
+        leader_url = "http://10.0.0.2:5050"
+        with aioresponses() as rsps:
+            rsps.get(
+                f"{settings.MESOS_MASTER_URLS[0]}/redirect",
+                status=307,
+                headers={"Location": "//10.0.0.2:5050/"},
+            )
+            rsps.post(f"{leader_url}/api/v1", status=200)
+            consumer = MesosEventConsumer(
+                HTTPConnection(urls=settings.MESOS_MASTER_URLS)
+            )
+            await consumer.connect()
+
+            post_urls = [
+                str(url)
+                for (method, url) in rsps.requests.keys()
+                if method == "POST"
+            ]
+            self.assertEqual([f"{leader_url}/api/v1"], post_urls)
+
+    async def test_follow_redirect_when_subscribing_to_a_non_leader(self):
         with aioresponses() as rsps:
             rsps.post(
                 f"{settings.MESOS_MASTER_URLS[0]}/api/v1",
-                exception=ClientTimeout("timeout"),
+                status=307,
+                headers={"Location": "//10.0.0.1:5050/api/v1"},
+            )
+            rsps.post(f"{settings.MESOS_MASTER_URLS[1]}/api/v1", status=200)
+            consumer = MesosEventConsumer(
+                HTTPConnection(urls=settings.MESOS_MASTER_URLS)
+            )
+            await consumer.connect()
+            self.assertEqual(200, consumer.response.status)
+            self.assertEqual(
+                URL(f"{settings.MESOS_MASTER_URLS[1]}/api/v1"),
+                consumer.response.url,
             )
+
+    async def test_use_next_mesos_urls_if_needed(self):
+        with aioresponses() as rsps:
             rsps.post(
-                f"{settings.MESOS_MASTER_URLS[1]}/api/v1",
-                exception=ClientTimeout("timeout"),
+                f"{settings.MESOS_MASTER_URLS[0]}/api/v1",
+                exception=asyncio.TimeoutError(),
             )
+            rsps.post(f"{settings.MESOS_MASTER_URLS[1]}/api/v1", status=200)
             consumer = MesosEventConsumer(
                 HTTPConnection(urls=settings.MESOS_MASTER_URLS)
             )
             await consumer.connect()
-        self.assertTrue(True)
+            self.assertEqual(200, consumer.response.status)
+
+    async def test_raise_last_error_if_no_master_accepts_subscribe(self):
+        with aioresponses() as rsps:
+            rsps.post(
+                f"{settings.MESOS_MASTER_URLS[0]}/api/v1",
+                exception=asyncio.TimeoutError(),
+            )
+            rsps.post(f"{settings.MESOS_MASTER_URLS[1]}/api/v1", status=503)
+            consumer = MesosEventConsumer(
+                HTTPConnection(urls=settings.MESOS_MASTER_URLS)
+            )
+            with self.assertRaises(ClientResponseError):
+                await consumer.connect()
 
     def _prepare_mocks_for_pre_process_event(self, rsps, directory):
 
         # Get slave address
         # Get task info
         # Get output
-        # 2x /files/browse
+        # 1x /files/browse
         # 2x /files/read
         rsps.get(
             f"{settings.MESOS_MASTER_URLS[0]}/slaves?slave_id={self.agent_id}",
@@ -304,11 +766,6 @@ class MesosConsumerTest(BaseTestCase):
             status=200,
             payload=task_file_list_less_than_4k_size,
         )
-        rsps.get(
-            f"{self.agent_addr}/files/browse?path={directory}",
-            status=200,
-            payload=task_file_list_less_than_4k_size,
-        )
         rsps.get(
             f"{self.agent_addr}/files/read?path={directory}/stdout&length=4096&offset=0",
             status=200,
@@ -409,3 +866,126 @@ class MesosConsumerTest(BaseTestCase):
             await consumer.pre_process_event([event])
             self.assertEqual("stdout-output from task", event.task.stdout)
             self.assertEqual("stderr-output from task", event.task.stderr)
+
+    async def test_pre_process_event_uses_agent_registry(self):
+        """
+        Se o agent já está no registry não precisamos chamar o /slaves
+        do mesos master
+        """
+        directory = "/tmp/mesos/slaves/79ad3a13-b567-4273-ac8c-30378d35a439-S6563/frameworks/4783cf15-4fb1-4c75-90fe-44eeec5258a7-0001/executors/ct:1581360840007:0:asgard-heimdall:/runs/2bca2a9b-2eea-48a9-9b18-b69b1c5118f7"
+
+        with aioresponses() as rsps:
+            self._prepare_mocks_for_pre_process_event(rsps, directory)
+
+            consumer = MesosEventConsumer(
+                HTTPConnection(urls=settings.MESOS_MASTER_URLS)
+            )
+            consumer.agents.load(
+                MesosEvent(**mesos_subscribed_event_data).subscribed.agents()
+            )
+            consumer.mesos_client = MesosClient(
+                ClientSession(),
+                HTTPConnection(urls=[settings.MESOS_MASTER_URLS[0]]),
+            )
+            task_updated_data = deepcopy(
+                mesos_state_finished_event_data["task_updated"]
+            )
+            task_updated_data["status"]["task_id"][
+                "value"
+            ] = "ct:1581360840007:0:asgard-my-app:"
+            event = MesosTaskUpdatedEventConverter.to_asgard_model(
+                MesosTaskUpdatedEvent(**task_updated_data)
+            )
+
+            await consumer.pre_process_event([event])
+            self.assertEqual("stdout-output from task", event.task.stdout)
+            self.assertFalse(
+                [
+                    url
+                    for (method, url) in rsps.requests.keys()
+                    if url.path == "/slaves"
+                ]
+            )
+
+    async def _consume_task_updated(self, settings_stub, events_data):
+        app = App()
+
+        @app.route(["/api/v1"], RouteTypes.HTTP, methods=["POST"])
+        async def api_v1(request: Request):
+            resp = StreamResponse(status=200)
+            await resp.prepare(request)
+            for event_data in events_data:
+                event_str = json.dumps(event_data)
+                await resp.write(
+                    f"{len(event_str)}\n{event_str}".encode("utf-8")
+                )
+            return resp
+
+        async with HttpClientContext(app) as client:
+            url = f"http://{client._server.host}:{client._server.port}"
+            with mock.patch.object(
+                mesos_consumer_module, "settings", settings_stub
+            ):
+                consumer = MesosEventConsumer(HTTPConnection(urls=[url]))
+                await consumer.connect()
+                events = [ev async for ev in consumer.events()]
+        return consumer, events
+
+    async def test_decode_task_details_in_executor(self):
+        running_event_data = json.loads(
+            open(f"{FIXTURE_DIR}/mesos_state_running_event_data.json").read()
+        )
+        events_data = []
+        for offset in range(3):
+            event_data = deepcopy(running_event_data)
+            event_data["task_updated"]["status"]["timestamp"] += offset
+            events_data.append(event_data)
+
+        consumer, inline_events = await self._consume_task_updated(
+            settings, events_data
+        )
+        await consumer.close()
+        self.assertIsNone(consumer.details_executor)
+        self.assertIsNotNone(inline_events[0].container_info)
+
+        for executor in ("thread", "process"):
+            with mock.patch.dict(
+                os.environ, TEST_TASK_DETAILS_EXECUTOR=executor
+            ):
+                executor_settings = Settings()
+            consumer, events = await self._consume_task_updated(
+                executor_settings, events_data
+            )
+            self.assertEqual(
+                [None] * 3, [event.container_info for event in events]
+            )
+            for event in events:
+                await consumer._resolve_task_details(event)
+            await consumer.close()
+            self.assertEqual(
+                [event.dict() for event in inline_events],
+                [event.dict() for event in events],
+            )
+            self.assertEqual({}, consumer._pending_details)
+
+    async def test_decode_task_details_error_is_raised_on_resolve(self):
+        event_data = json.loads(
+            open(f"{FIXTURE_DIR}/mesos_state_running_event_data.json").read()
+        )
+        event_data["task_updated"]["status"]["data"] = "aW52YWxpZA=="
+        with mock.patch.dict(os.environ, TEST_TASK_DETAILS_EXECUTOR="thread"):
+            thread_settings = Settings()
+        consumer, events = await self._consume_task_updated(
+            thread_settings, [event_data]
+        )
+        with self.assertRaises(ValueError):
+            await consumer._resolve_task_details(events[0])
+        await consumer.close()
+
+    async def test_close_response_cancels_pending_task_details(self):
+        consumer = MesosEventConsumer(HTTPConnection(urls=[]))
+        future = asyncio.get_event_loop().create_future()
+        consumer._pending_details["event-id"] = future
+        consumer._close_response()
+        self.assertTrue(future.cancelled())
+        self.assertEqual({}, consumer._pending_details)
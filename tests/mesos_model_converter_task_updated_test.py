@@ -1,4 +1,5 @@
 import json
+from copy import deepcopy
 
 from asynctest.mock import ANY
 
@@ -43,6 +44,32 @@ mesos_state_failed_event_data = {
 
 
 class MesosTaskUpdatedConverterTest(BaseTestCase):
+    async def test_same_status_always_has_the_same_id(self):
+        first = MesosTaskUpdatedEventConverter.to_asgard_model(
+            MesosTaskUpdatedEvent(**mesos_state_finished_event_data)
+        )
+        second = MesosTaskUpdatedEventConverter.to_asgard_model(
+            MesosTaskUpdatedEvent(**mesos_state_finished_event_data)
+        )
+        self.assertEqual(first.id, second.id)
+
+    async def test_id_changes_with_state_source_or_timestamp(self):
+        ids = set()
+        for field, value in [
+            ("state", "TASK_FINISHED"),
+            ("state", "TASK_RUNNING"),
+            ("source", "SOURCE_AGENT"),
+            ("timestamp", 1_578_685_956),
+        ]:
+            event_data = deepcopy(mesos_state_finished_event_data)
+            event_data["status"][field] = value
+            ids.add(
+                MesosTaskUpdatedEventConverter.to_asgard_model(
+                    MesosTaskUpdatedEvent(**event_data)
+                ).id
+            )
+        self.assertEqual(4, len(ids))
+
     async def test_convert_to_asgard_model_state_finished(self):
         """
         Cria um Event a partir de um evento do mesos com state TASK_FINISHED
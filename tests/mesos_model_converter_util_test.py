@@ -2,6 +2,7 @@ from indexer.mesos.models.converters.util import (
     get_task_namespace,
     remove_task_namespace,
     get_appname,
+    get_event_id,
 )
 from tests.base import BaseTestCase
 
@@ -91,3 +92,25 @@ class MesosEventModelConverterUtilTest(BaseTestCase):
             "my-other-app-name",
             get_appname("ct:1578492720011:0:asgard-my-other-app-name:"),
         )
+
+    async def test_event_id_is_deterministic(self):
+        """
+        O id de um evento depende apenas da task, do estado, da origem e do
+        timestamp do status.
+        """
+        event_id = get_event_id(
+            "sieve_sleep.1", "TASK_RUNNING", "SOURCE_EXECUTOR", 1_578_685_955
+        )
+        self.assertEqual(
+            event_id,
+            get_event_id(
+                "sieve_sleep.1",
+                "TASK_RUNNING",
+                "SOURCE_EXECUTOR",
+                1_578_685_955,
+            ),
+        )
+        self.assertNotEqual(
+            event_id,
+            get_event_id("sieve_sleep.1", "TASK_RUNNING", "SOURCE_EXECUTOR"),
+        )
@@ -0,0 +1,292 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from asynctest import mock
+from asynctest.mock import CoroutineMock
+
+from indexer import channel as channel_module
+from indexer.conf import OverflowPolicy
+from indexer.connection import HTTPConnection
+from indexer.mesos.events import consumer as consumer_module
+from indexer.mesos.events.consumer import MesosEventConsumer
+from indexer.mesos.events.reconciliation import TaskReconciler
+from indexer.mesos.models.spec import TaskStateSnapshotSpec
+from indexer.mesos.models.subscribed import MesosSubscribedEvent
+from indexer.models.event import BackendInfoTypes
+from indexer.writter import OutputWritter
+from tests.base import FIXTURE_DIR, BaseTestCase, LOGGER_MOCK
+
+
+def task(task_id: str, state: str, statuses=None) -> TaskStateSnapshotSpec:
+    if statuses is None:
+        statuses = [
+            {
+                "task_id": {"value": task_id},
+                "executor_id": {"value": task_id},
+                "agent_id": {"value": "agent-1"},
+                "state": state,
+                "source": "SOURCE_EXECUTOR",
+                "timestamp": 1_578_685_955,
+            }
+        ]
+    return TaskStateSnapshotSpec(
+        task_id={"value": task_id},
+        framework_id={"value": "framework-1"},
+        state=state,
+        statuses=statuses,
+    )
+
+
+class TaskReconcilerTest(BaseTestCase):
+    async def setUp(self):
+        self.reconciler = TaskReconciler(max_tasks=10)
+
+    async def test_first_snapshot_only_seeds_known_tasks(self):
+        tasks = [task("infra_app.1", "TASK_RUNNING")]
+        self.assertEqual([], self.reconciler.missed_tasks(tasks))
+        self.assertEqual(
+            "TASK_RUNNING", self.reconciler.indexed_tasks.get("infra_app.1")
+        )
+
+    async def test_returns_tasks_with_unknown_or_different_state(self):
+        self.reconciler.missed_tasks([])
+        self.reconciler.task_indexed("infra_app.1", "TASK_RUNNING")
+        self.reconciler.task_indexed("infra_app.2", "TASK_RUNNING")
+
+        missed = self.reconciler.missed_tasks(
+            [
+                task("infra_app.1", "TASK_RUNNING"),
+                task("infra_app.2", "TASK_FINISHED"),
+                task("infra_app.3", "TASK_STAGING"),
+            ]
+        )
+        self.assertEqual(
+            ["infra_app.2", "infra_app.3"], [t.task_id.value for t in missed]
+        )
+
+    async def test_to_event_uses_last_task_status(self):
+        event = self.reconciler.to_event(task("infra_app.1", "TASK_FINISHED"))
+        self.assertEqual("TASK_FINISHED", event.status)
+        self.assertEqual("app.1", event.task.id)
+        self.assertEqual("infra", event.namespace)
+        self.assertEqual(BackendInfoTypes.MARATHON, event.backend_info.name)
+
+    async def test_to_event_returns_none_without_statuses(self):
+        self.assertIsNone(
+            self.reconciler.to_event(
+                task("infra_app.1", "TASK_FINISHED", statuses=[])
+            )
+        )
+
+
+class MesosEventConsumerReconcileTest(BaseTestCase):
+    async def setUp(self):
+        self.consumer = MesosEventConsumer(
+            HTTPConnection(urls=["http://127.0.0.1:5050"])
+        )
+
+    def subscribed(self, *tasks: TaskStateSnapshotSpec) -> MesosSubscribedEvent:
+        return MesosSubscribedEvent(
+            get_state={"get_tasks": {"tasks": [t.dict() for t in tasks]}}
+        )
+
+    async def test_first_subscribed_does_not_reconcile(self):
+        with mock.patch.object(self.consumer, "spawn") as spawn_mock:
+            self.consumer._on_subscribed(
+                self.subscribed(task("infra_app.1", "TASK_RUNNING"))
+            )
+            spawn_mock.assert_not_called()
+
+    async def test_reconcile_missed_tasks_after_reconnect(self):
+        self.consumer._on_subscribed(
+            self.subscribed(task("infra_app.1", "TASK_RUNNING"))
+        )
+        with mock.patch.object(
+            self.consumer, "_reconcile", CoroutineMock()
+        ) as reconcile_mock, mock.patch.object(
+            self.consumer, "spawn"
+        ) as spawn_mock:
+            self.consumer._on_subscribed(
+                self.subscribed(
+                    task("infra_app.1", "TASK_FINISHED"),
+                    task("infra_app.2", "TASK_RUNNING"),
+                )
+            )
+            spawn_mock.assert_called_once()
+            missed, = reconcile_mock.call_args[0]
+            self.assertEqual(
+                ["infra_app.1", "infra_app.2"],
+                [t.task_id.value for t in missed],
+            )
+
+    async def test_reconcile_submits_synthetic_events(self):
+        submitted = []
+
+        async def submit(event):
+            submitted.append(event)
+            item = mock.Mock()
+            item.done = self.loop.create_future()
+            item.done.set_result(event)
+            return item
+
+        with mock.patch.object(self.consumer, "submit", submit):
+            await self.consumer._reconcile(
+                [
+                    task("infra_app.1", "TASK_FINISHED"),
+                    task("infra_app.2", "TASK_RUNNING", statuses=[]),
+                ]
+            )
+        self.assertEqual(1, len(submitted))
+        self.assertEqual("app.1", submitted[0].task.id)
+
+    async def submitted_by_reconcile(self, tasks):
+        submitted = []
+
+        async def submit(event):
+            submitted.append(event)
+            item = mock.Mock()
+            item.done = self.loop.create_future()
+            item.done.set_result(event)
+            return item
+
+        with mock.patch.object(self.consumer, "submit", submit):
+            await self.consumer._reconcile(tasks)
+        return submitted
+
+    async def test_reconcile_logs_and_skips_tasks_that_fail(self):
+        event = self.consumer.reconciler.to_event(
+            task("infra_app.2", "TASK_FINISHED")
+        )
+        with mock.patch.object(
+            self.consumer.reconciler,
+            "to_event",
+            side_effect=[Exception("boom"), event],
+        ), mock.patch.object(
+            consumer_module, "logger", LOGGER_MOCK
+        ) as logger_mock:
+            logger_mock.reset_mock()
+            submitted = await self.submitted_by_reconcile(
+                [
+                    task("infra_app.1", "TASK_FINISHED"),
+                    task("infra_app.2", "TASK_FINISHED"),
+                ]
+            )
+            logger_mock.exception.assert_awaited_once_with(
+                {
+                    "event": "mesos-reconcile-task-error",
+                    "task-id": "infra_app.1",
+                    "exc": "boom",
+                }
+            )
+        self.assertEqual(["app.2"], [e.task.id for e in submitted])
+
+    async def test_reconcile_decodes_task_details_in_the_executor(self):
+        event_data = json.loads(
+            open(f"{FIXTURE_DIR}/mesos_state_running_event_data.json").read()
+        )
+        status = event_data["task_updated"]["status"]
+        self.consumer.details_executor = ThreadPoolExecutor(max_workers=1)
+        submitted = await self.submitted_by_reconcile(
+            [task(status["task_id"]["value"], status["state"], [status])]
+        )
+        event, = submitted
+        self.assertIsNone(event.container_info)
+        await self.consumer._resolve_task_details(event)
+        self.assertIsNotNone(event.container_info)
+        await self.consumer.close()
+
+    async def test_reconcile_events_dropped_before_being_indexed(self):
+        event = self.consumer.reconciler.to_event(
+            task("infra_app.1", "TASK_FINISHED")
+        )
+        self.assertFalse(self.consumer.dedup.is_duplicate(event))
+        self.consumer._close_response()
+
+        submitted = []
+
+        async def submit(event):
+            submitted.append(event)
+            item = mock.Mock()
+            item.done = self.loop.create_future()
+            item.done.set_result(event)
+            return item
+
+        with mock.patch.object(self.consumer, "submit", submit):
+            await self.consumer._reconcile(
+                [task("infra_app.1", "TASK_FINISHED")]
+            )
+        self.assertEqual(1, len(submitted))
+
+    async def test_reconcile_skips_events_already_indexed(self):
+        event = self.consumer.reconciler.to_event(
+            task("infra_app.1", "TASK_FINISHED")
+        )
+        self.consumer.dedup.is_duplicate(event)
+        self.consumer.events_written([event])
+        self.consumer._close_response()
+
+        with mock.patch.object(self.consumer, "submit") as submit_mock:
+            await self.consumer._reconcile(
+                [task("infra_app.1", "TASK_FINISHED")]
+            )
+        submit_mock.assert_not_called()
+
+    async def test_events_written_remembers_indexed_state(self):
+        event = self.consumer.reconciler.to_event(
+            task("infra_app.1", "TASK_FINISHED")
+        )
+        self.consumer.events_written([event])
+        self.assertEqual(
+            "TASK_FINISHED",
+            self.consumer.reconciler.indexed_tasks.get("infra_app.1"),
+        )
+
+    async def write_through_output(self, writter, event):
+        self.consumer.channels = []
+        self.consumer.add_output("test", writter, 10, 1, OverflowPolicy.BLOCK)
+        self.assertFalse(self.consumer.dedup.is_duplicate(event))
+        with mock.patch.object(channel_module, "logger", LOGGER_MOCK):
+            await self.consumer.write_output([event])
+            await self.consumer.post_process_event([event])
+            await self.consumer.drain_output()
+            await self.consumer.channels[0].close(timeout=1)
+
+    async def test_reconcile_events_whose_write_failed(self):
+        event = self.consumer.reconciler.to_event(
+            task("infra_app.1", "TASK_FINISHED")
+        )
+        writter = OutputWritter()
+        writter.write = CoroutineMock(side_effect=Exception("down"))
+        await self.write_through_output(writter, event)
+        self.assertIsNone(
+            self.consumer.reconciler.indexed_tasks.get("infra_app.1")
+        )
+        self.consumer._close_response()
+
+        submitted = []
+
+        async def submit(event):
+            submitted.append(event)
+            item = mock.Mock()
+            item.done = self.loop.create_future()
+            item.done.set_result(event)
+            return item
+
+        with mock.patch.object(self.consumer, "submit", submit):
+            await self.consumer._reconcile(
+                [task("infra_app.1", "TASK_FINISHED")]
+            )
+        self.assertEqual(1, len(submitted))
+
+    async def test_remember_events_acknowledged_by_the_output(self):
+        event = self.consumer.reconciler.to_event(
+            task("infra_app.1", "TASK_FINISHED")
+        )
+        writter = OutputWritter()
+        writter.write = CoroutineMock(side_effect=writter.acknowledge)
+        await self.write_through_output(writter, event)
+        self.assertEqual(
+            "TASK_FINISHED",
+            self.consumer.reconciler.indexed_tasks.get("infra_app.1"),
+        )
+        self.assertTrue(self.consumer.dedup.is_duplicate(event))
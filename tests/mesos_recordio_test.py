@@ -0,0 +1,66 @@
+import json
+
+from indexer.mesos.events.recordio import RecordIOFramer
+from tests.base import BaseTestCase
+
+
+def recordio(data: dict) -> bytes:
+    data_bytes = json.dumps(data).encode("utf-8")
+    return str(len(data_bytes)).encode("utf-8") + b"\n" + data_bytes
+
+
+class RecordIOFramerTest(BaseTestCase):
+    async def setUp(self):
+        self.framer = RecordIOFramer()
+
+    async def test_one_complete_record_in_one_chunk(self):
+        self.assertEqual(
+            [b'{"type": "SUBSCRIBED"}'],
+            self.framer.feed(recordio({"type": "SUBSCRIBED"})),
+        )
+
+    async def test_many_records_in_one_chunk(self):
+        chunk = recordio({"type": "SUBSCRIBED"}) + recordio(
+            {"type": "HEARTBEAT"}
+        )
+        self.assertEqual(
+            [b'{"type": "SUBSCRIBED"}', b'{"type": "HEARTBEAT"}'],
+            self.framer.feed(chunk),
+        )
+
+    async def test_record_split_in_many_chunks(self):
+        """
+        Inclusive com o header (tamanho do record) quebrado entre chunks
+        """
+        data = recordio({"type": "TASK_UPDATED", "data": "x" * 100})
+        records = []
+        for idx in range(len(data)):
+            records.extend(self.framer.feed(data[idx : idx + 1]))
+        self.assertEqual([data[data.index(b"\n") + 1 :]], records)
+
+    async def test_chunk_ends_in_the_middle_of_the_next_record(self):
+        first = recordio({"type": "SUBSCRIBED"})
+        second = recordio({"type": "HEARTBEAT"})
+
+        self.assertEqual(
+            [b'{"type": "SUBSCRIBED"}'], self.framer.feed(first + second[:5])
+        )
+        self.assertEqual(
+            [b'{"type": "HEARTBEAT"}'], self.framer.feed(second[5:])
+        )
+
+    async def test_record_size_is_in_bytes(self):
+        data = recordio({"message": "ação"})
+        self.assertEqual(
+            [json.dumps({"message": "ação"}).encode("utf-8")],
+            self.framer.feed(data),
+        )
+
+    async def test_discard_consumed_records_from_buffer(self):
+        first = recordio({"type": "SUBSCRIBED"})
+        second = recordio({"type": "HEARTBEAT"})
+
+        self.framer.feed(first + second[:5])
+        self.assertEqual(second[:5], bytes(self.framer._buffer))
+        self.framer.feed(second[5:])
+        self.assertEqual(b"", bytes(self.framer._buffer))
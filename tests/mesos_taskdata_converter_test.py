@@ -1,6 +1,9 @@
 import json
 
-from indexer.mesos.models.converters.spec import MesosTaskDataSpecConverter
+from indexer.mesos.models.converters.spec import (
+    MesosTaskDataSpecConverter,
+    container_info_from_task_data,
+)
 from indexer.mesos.models.event import MesosEvent
 from tests.base import BaseTestCase, FIXTURE_DIR
 
@@ -13,6 +16,7 @@ class MesosTaskDataConverterTest(BaseTestCase):
         )
         mesos_event = MesosEvent(**mesos_event_state_running_dict)
         self.mesos_task_data_spec = mesos_event.task_details()
+        self.mesos_task_data = mesos_event.task_updated.status.task_data()
 
     async def test_convert_to_asgard_container_info_spec(self):
         asgard_container_info_expected_data = {
@@ -58,3 +62,11 @@ class MesosTaskDataConverterTest(BaseTestCase):
             asgard_container_info_spec.dict(skip_defaults=True),
             asgard_container_info_expected_data,
         )
+
+    async def test_convert_task_data_without_task_data_spec(self):
+        self.assertEqual(
+            MesosTaskDataSpecConverter.to_asgard_model(
+                self.mesos_task_data_spec
+            ),
+            container_info_from_task_data(self.mesos_task_data),
+        )
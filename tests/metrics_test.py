@@ -0,0 +1,131 @@
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from indexer import metrics
+from indexer.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricFamily,
+    Registry,
+    http_trace_config,
+)
+from tests.base import BaseTestCase
+
+
+class RegistryTest(BaseTestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_render_counter_with_labels(self):
+        counter = Counter(
+            "events_total", "Eventos", ("type",), registry=self.registry
+        )
+        counter.labels("TASK_ADDED").inc()
+        counter.labels("TASK_ADDED").inc(2)
+        counter.labels("HEARTBEAT").inc()
+        self.assertEqual(
+            "# HELP events_total Eventos\n"
+            "# TYPE events_total counter\n"
+            'events_total{type="TASK_ADDED"} 3.0\n'
+            'events_total{type="HEARTBEAT"} 1.0\n',
+            self.registry.render(),
+        )
+
+    def test_render_gauge_without_labels(self):
+        gauge = Gauge("queue_size", "Fila", registry=self.registry)
+        gauge.labels().set(10)
+        gauge.labels().dec(3)
+        self.assertIn("queue_size 7.0\n", self.registry.render())
+
+    def test_render_histogram_cumulative_buckets(self):
+        histogram = Histogram(
+            "duration_seconds",
+            "Tempo",
+            ("stage",),
+            buckets=(0.1, 1.0),
+            registry=self.registry,
+        )
+        parse = histogram.labels("parse")
+        parse.observe(0.05)
+        parse.observe(0.1)
+        parse.observe(0.5)
+        parse.observe(3)
+        self.assertEqual(
+            "# HELP duration_seconds Tempo\n"
+            "# TYPE duration_seconds histogram\n"
+            'duration_seconds_bucket{stage="parse",le="0.1"} 2.0\n'
+            'duration_seconds_bucket{stage="parse",le="1.0"} 3.0\n'
+            'duration_seconds_bucket{stage="parse",le="+Inf"} 4.0\n'
+            'duration_seconds_sum{stage="parse"} 3.65\n'
+            'duration_seconds_count{stage="parse"} 4.0\n',
+            self.registry.render(),
+        )
+
+    def test_histogram_timer_observes_elapsed_time(self):
+        histogram = Histogram("duration_seconds", "", registry=self.registry)
+        with histogram.labels().time():
+            pass
+        self.assertEqual(1, histogram.labels().count)
+
+    def test_render_extra_metric_families(self):
+        family = MetricFamily(
+            "queue_size", "gauge", "Fila", [({"queue": "work"}, 4.0)]
+        )
+        self.assertEqual(
+            "# HELP queue_size Fila\n"
+            "# TYPE queue_size gauge\n"
+            'queue_size{queue="work"} 4.0\n',
+            self.registry.render([family]),
+        )
+
+    def test_escape_label_values(self):
+        counter = Counter("c", "", ("path",), registry=self.registry)
+        counter.labels('a"b\\c').inc()
+        self.assertIn('c{path="a\\"b\\\\c"} 1.0', self.registry.render())
+
+    def test_labels_with_wrong_number_of_values(self):
+        counter = Counter("c", "", ("a", "b"), registry=self.registry)
+        with self.assertRaises(ValueError):
+            counter.labels("x")
+
+    def test_register_duplicated_metric(self):
+        Counter("c", "", registry=self.registry)
+        with self.assertRaises(ValueError):
+            Counter("c", "", registry=self.registry)
+
+
+class HTTPTraceConfigTest(BaseTestCase):
+    async def setUp(self):
+        async def ok(request):
+            return web.Response(status=202)
+
+        app = web.Application()
+        app.router.add_get("/state", ok)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def tearDown(self):
+        await self.server.close()
+
+    async def test_count_requests_by_target_and_status(self):
+        requests = metrics.HTTP_REQUESTS.labels("test-state", "202")
+        latency = metrics.HTTP_REQUEST_DURATION.labels("test-state")
+        before, before_count = requests.value, latency.count
+        trace_config = http_trace_config(lambda url: f"test-{url.path[1:]}")
+        async with ClientSession(trace_configs=[trace_config]) as session:
+            resp = await session.get(self.server.make_url("/state"))
+            resp.release()
+        self.assertEqual(before + 1, requests.value)
+        self.assertEqual(before_count + 1, latency.count)
+
+    async def test_count_failed_requests_as_error(self):
+        requests = metrics.HTTP_REQUESTS.labels("test-error", "error")
+        before = requests.value
+        trace_config = http_trace_config(lambda url: "test-error")
+        url = self.server.make_url("/state")
+        await self.server.close()
+        async with ClientSession(trace_configs=[trace_config]) as session:
+            with self.assertRaises(Exception):
+                await session.get(url)
+        self.assertEqual(before + 1, requests.value)
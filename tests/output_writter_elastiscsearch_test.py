@@ -1,17 +1,27 @@
 import asyncio
 import json
+import os
 
+from asynctest import mock
+from asynctest.mock import CoroutineMock
+from elasticsearch.exceptions import ConnectionError, TransportError
 from freezegun import freeze_time
 
-from indexer.conf import settings
+from indexer import metrics
+from indexer import writter as writter_module
+from indexer.conf import settings, Settings
 from indexer.connection import HTTPConnection
 from indexer.mesos.models.converters.taskupdated import (
     MesosTaskUpdatedEventConverter,
 )
 from indexer.mesos.models.event import MesosEvent
-from indexer.models.event import Event
-from indexer.writter import ElasticSearchOutputWritter
-from tests.base import BaseTestCase, FIXTURE_DIR
+from indexer.models.event import Event, IngestInfoSpec
+from indexer.writter import (
+    ElasticSearchOutputWritter,
+    OutputWriteError,
+    index_template,
+)
+from tests.base import BaseTestCase, FIXTURE_DIR, LOGGER_MOCK
 
 
 class ElasticSearchOutputWritterTest(BaseTestCase):
@@ -19,7 +29,7 @@ class ElasticSearchOutputWritterTest(BaseTestCase):
         self.es_out_writter = ElasticSearchOutputWritter(
             HTTPConnection(urls=settings.ES_OUTPUT_URLS)
         )
-        self.index_name_prefix = "asgard-events-2020-01-23-17*"
+        self.index_name_prefix = "asgard-events-2020-01-10-14*"
         await self.es_out_writter.client.indices.delete(
             self.index_name_prefix, allow_no_indices=True
         )
@@ -41,6 +51,7 @@ class ElasticSearchOutputWritterTest(BaseTestCase):
             mesos_event.task_updated
         )
         await self.es_out_writter.write([asgard_event])
+        await self.es_out_writter.flush()
 
         await asyncio.sleep(1)
 
@@ -57,5 +68,582 @@ class ElasticSearchOutputWritterTest(BaseTestCase):
 
     @freeze_time("2020-01-19T13:23:43.451742+00:00")
     async def test_generate_index_prefix(self):
-        index_name = self.es_out_writter._get_index_name()
-        self.assertEqual(index_name, "asgard-events-2020-01-19-13")
+        """
+        O nome do índice vem da data do evento, não do relógio.
+        """
+        mesos_event = MesosEvent(
+            **json.loads(
+                open(
+                    f"{FIXTURE_DIR}/mesos_state_running_event_data.json"
+                ).read()
+            )
+        )
+        event = MesosTaskUpdatedEventConverter.to_asgard_model(
+            mesos_event.task_updated
+        )
+        event.date = "2020-01-10T19:52:35+00:00"
+        index_name = self.es_out_writter._get_index_name(event)
+        self.assertEqual(index_name, "asgard-events-2020-01-10-19")
+
+
+class ElasticSearchBulkOutputWritterTest(BaseTestCase):
+    async def setUp(self):
+        with mock.patch.dict(
+            os.environ,
+            TEST_ES_BULK_SIZE="2",
+            TEST_ES_BULK_LINGER="0.05",
+            TEST_ES_BULK_MAX_RETRIES="2",
+            TEST_ES_BULK_RETRY_BACKOFF_BASE="0.001",
+        ):
+            self.settings_stub = Settings()
+        self.es_out_writter = ElasticSearchOutputWritter(
+            HTTPConnection(urls=settings.ES_OUTPUT_URLS)
+        )
+        self.es_out_writter.client.bulk = CoroutineMock(
+            return_value={"errors": False, "items": []}
+        )
+        self.es_out_writter.client.info = CoroutineMock(
+            return_value={"version": {"number": "6.8.0"}}
+        )
+        self.es_out_writter.client.indices.get_template = CoroutineMock(
+            return_value={}
+        )
+        self.es_out_writter.client.indices.put_template = CoroutineMock()
+        mesos_event = MesosEvent(
+            **json.loads(
+                open(
+                    f"{FIXTURE_DIR}/mesos_state_running_event_data.json"
+                ).read()
+            )
+        )
+        self.asgard_event = MesosTaskUpdatedEventConverter.to_asgard_model(
+            mesos_event.task_updated
+        )
+
+    def _bulk_body_lines(self, call_index=0):
+        body = self.es_out_writter.client.bulk.call_args_list[call_index][1][
+            "body"
+        ]
+        return [json.loads(line) for line in body.splitlines()]
+
+    @freeze_time("2020-01-23T17:23:43-00:00")
+    async def test_send_one_bulk_request_when_batch_size_is_reached(self):
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self.asgard_event])
+            self.es_out_writter.client.bulk.assert_not_awaited()
+
+            await self.es_out_writter.write([self.asgard_event])
+            self.es_out_writter.client.bulk.assert_awaited_once()
+
+        action = {
+            "index": {
+                "_index": "asgard-events-2020-01-10-14",
+                "_type": "event",
+                "_id": self.asgard_event.id,
+            }
+        }
+        doc = {
+            **json.loads(json.dumps(self.asgard_event.dict())),
+            "@timestamp": "2020-01-23T17:23:43+00:00",
+        }
+        self.assertEqual([action, doc, action, doc], self._bulk_body_lines())
+
+    async def test_flush_when_max_bytes_is_reached(self):
+        with mock.patch.dict(os.environ, TEST_ES_BULK_MAX_BYTES="10"):
+            settings_stub = Settings()
+
+        with mock.patch.object(writter_module, "settings", settings_stub):
+            await self.es_out_writter.write([self.asgard_event])
+            self.es_out_writter.client.bulk.assert_awaited_once()
+            self.assertEqual(2, len(self._bulk_body_lines()))
+
+    async def test_flush_after_linger_timeout(self):
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self.asgard_event])
+            self.es_out_writter.client.bulk.assert_not_awaited()
+
+            await asyncio.sleep(0.1)
+            self.es_out_writter.client.bulk.assert_awaited_once()
+            self.assertEqual(2, len(self._bulk_body_lines()))
+
+    async def test_flush_does_nothing_with_empty_buffer(self):
+        await self.es_out_writter.flush()
+        self.es_out_writter.client.bulk.assert_not_awaited()
+
+    async def test_log_bulk_items_with_error(self):
+        self.es_out_writter.client.bulk.return_value = {
+            "errors": True,
+            "items": [
+                {"index": {"_index": "idx", "status": 201}},
+                {
+                    "index": {
+                        "_index": "idx",
+                        "status": 400,
+                        "error": {"type": "mapper_parsing_exception"},
+                    }
+                },
+            ],
+        }
+        with mock.patch.object(
+            writter_module, "settings", self.settings_stub
+        ), mock.patch.object(
+            writter_module, "logger", LOGGER_MOCK
+        ) as logger_mock:
+            logger_mock.reset_mock()
+            with self.assertRaises(OutputWriteError):
+                await self.es_out_writter.write(
+                    [self.asgard_event, self.asgard_event]
+                )
+            logger_mock.error.assert_awaited_once_with(
+                {
+                    "event": "elasticsearch-bulk-item-error",
+                    "index": "idx",
+                    "status": 400,
+                    "error": {"type": "mapper_parsing_exception"},
+                }
+            )
+
+    def _event(self, task_id: str) -> Event:
+        return Event(**{**self.asgard_event.dict(), "id": task_id})
+
+    async def test_retry_only_failed_items(self):
+        self.es_out_writter.client.bulk.side_effect = [
+            {
+                "errors": True,
+                "items": [
+                    {"index": {"_index": "idx", "status": 201}},
+                    {
+                        "index": {
+                            "_index": "idx",
+                            "status": 429,
+                            "error": {"type": "es_rejected_execution"},
+                        }
+                    },
+                ],
+            },
+            {
+                "errors": False,
+                "items": [{"index": {"_index": "idx", "status": 201}}],
+            },
+        ]
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write(
+                [self._event("event-1"), self._event("event-2")]
+            )
+
+        self.assertEqual(2, self.es_out_writter.client.bulk.await_count)
+        retried = self._bulk_body_lines(call_index=1)
+        self.assertEqual(2, len(retried))
+        self.assertEqual("event-2", retried[0]["index"]["_id"])
+
+    async def test_do_not_retry_items_rejected_by_elasticsearch(self):
+        self.es_out_writter.client.bulk.return_value = {
+            "errors": True,
+            "items": [
+                {"index": {"_index": "idx", "status": 201}},
+                {
+                    "index": {
+                        "_index": "idx",
+                        "status": 400,
+                        "error": {"type": "mapper_parsing_exception"},
+                    }
+                },
+            ],
+        }
+        acked = []
+        self.es_out_writter.ack_callback = acked.extend
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            with self.assertRaises(OutputWriteError) as ctx:
+                await self.es_out_writter.write(
+                    [self._event("event-1"), self._event("event-2")]
+                )
+        self.es_out_writter.client.bulk.assert_awaited_once()
+        self.assertEqual(1, ctx.exception.dropped)
+        self.assertEqual(["event-1"], [e.id for e in acked])
+        self.assertEqual(0, self.es_out_writter.pending())
+
+    async def test_retry_whole_request_on_connection_error(self):
+        self.es_out_writter.client.bulk.side_effect = [
+            ConnectionError("N/A", "timeout", Exception()),
+            TransportError(503, "unavailable"),
+            {"errors": False, "items": []},
+        ]
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write(
+                [self._event("event-1"), self._event("event-2")]
+            )
+        self.assertEqual(3, self.es_out_writter.client.bulk.call_count)
+        self.assertEqual(
+            self._bulk_body_lines(call_index=0),
+            self._bulk_body_lines(call_index=2),
+        )
+
+    @freeze_time("2020-01-23T17:23:43-00:00")
+    async def test_stamp_sent_at_in_ingest_info(self):
+        event = self._event("event-1")
+        event.ingest = IngestInfoSpec(received_at="2020-01-23T17:23:42+00:00")
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([event])
+            await self.es_out_writter.flush()
+        _, doc = self._bulk_body_lines()
+        self.assertEqual(
+            {
+                "received_at": "2020-01-23T17:23:42+00:00",
+                "converted_at": None,
+                "enriched_at": None,
+                "sent_at": "2020-01-23T17:23:43+00:00",
+            },
+            doc["ingest"],
+        )
+        self.assertIsNone(event.ingest.sent_at)
+
+    async def test_acknowledge_events_after_bulk_is_accepted(self):
+        acked = []
+        self.es_out_writter.ack_callback = acked.extend
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self._event("event-1")])
+            self.assertEqual([], acked)
+            await self.es_out_writter.flush()
+        self.assertEqual(["event-1"], [e.id for e in acked])
+
+    async def test_do_not_acknowledge_events_if_bulk_fails(self):
+        self.es_out_writter.client.bulk.side_effect = TransportError(
+            400, "bad request"
+        )
+        acked = []
+        self.es_out_writter.ack_callback = acked.extend
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self._event("event-1")])
+            with self.assertRaises(OutputWriteError) as ctx:
+                await self.es_out_writter.flush()
+        self.assertEqual([], acked)
+        self.assertEqual(1, ctx.exception.dropped)
+
+    async def test_count_bulk_requests_by_status(self):
+        self.es_out_writter.client.bulk.side_effect = [
+            ConnectionError("N/A", "timeout", Exception()),
+            TransportError(503, "unavailable"),
+            {"errors": False, "items": []},
+        ]
+        counters = [
+            metrics.HTTP_REQUESTS.labels("elasticsearch", status)
+            for status in ("error", "503", "200")
+        ]
+        before = [counter.value for counter in counters]
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write(
+                [self._event("event-1"), self._event("event-2")]
+            )
+        self.assertEqual(
+            [value + 1 for value in before],
+            [counter.value for counter in counters],
+        )
+
+    async def test_give_up_after_max_retries(self):
+        self.es_out_writter.client.bulk.side_effect = TransportError(
+            503, "unavailable"
+        )
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            with self.assertRaises(OutputWriteError) as ctx:
+                await self.es_out_writter.write(
+                    [self._event("event-1"), self._event("event-2")]
+                )
+        self.assertEqual(3, self.es_out_writter.client.bulk.call_count)
+        self.assertEqual(0, ctx.exception.dropped)
+        self.assertEqual(2, self.es_out_writter.pending())
+        self.es_out_writter.discard()
+
+    async def test_retry_batch_after_linger_when_flush_gives_up(self):
+        self.es_out_writter.client.bulk.side_effect = [
+            TransportError(503, "unavailable")
+        ] * 3 + [{"errors": False, "items": []}]
+        acked, errors = [], []
+        self.es_out_writter.ack_callback = acked.extend
+        self.es_out_writter.error_callback = errors.append
+        with mock.patch.object(
+            writter_module, "settings", self.settings_stub
+        ), mock.patch.object(writter_module, "logger", LOGGER_MOCK):
+            await self.es_out_writter.write([self._event("event-1")])
+            await asyncio.sleep(0.08)
+            self.assertEqual([0], errors)
+            self.assertEqual([], acked)
+            self.assertEqual(1, self.es_out_writter.pending())
+
+            await asyncio.sleep(0.08)
+        self.assertEqual(4, self.es_out_writter.client.bulk.call_count)
+        self.assertEqual(["event-1"], [e.id for e in acked])
+        self.assertEqual(0, self.es_out_writter.pending())
+
+    async def test_keep_items_still_rejected_after_max_retries(self):
+        rejected = {
+            "index": {
+                "_index": "idx",
+                "status": 429,
+                "error": {"type": "es_rejected_execution"},
+            }
+        }
+        self.es_out_writter.client.bulk.side_effect = [
+            {
+                "errors": True,
+                "items": [
+                    {"index": {"_index": "idx", "status": 201}},
+                    rejected,
+                ],
+            },
+            {"errors": True, "items": [rejected]},
+            {"errors": True, "items": [rejected]},
+        ]
+        acked = []
+        self.es_out_writter.ack_callback = acked.extend
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            with self.assertRaises(OutputWriteError) as ctx:
+                await self.es_out_writter.write(
+                    [self._event("event-1"), self._event("event-2")]
+                )
+        self.assertEqual(["event-1"], [e.id for e in acked])
+        self.assertEqual(0, ctx.exception.dropped)
+        self.assertEqual(1, self.es_out_writter.pending())
+        action, _ = [
+            json.loads(line)
+            for line in self.es_out_writter._buffer[0].splitlines()
+        ]
+        self.assertEqual("event-2", action["index"]["_id"])
+        self.es_out_writter.discard()
+
+    async def test_do_not_retry_client_errors(self):
+        self.es_out_writter.client.bulk.side_effect = TransportError(
+            400, "bad request"
+        )
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            with self.assertRaises(OutputWriteError) as ctx:
+                await self.es_out_writter.write(
+                    [self._event("event-1"), self._event("event-2")]
+                )
+        self.es_out_writter.client.bulk.assert_called_once()
+        self.assertEqual(2, ctx.exception.dropped)
+        self.assertEqual(0, self.es_out_writter.pending())
+
+    async def test_use_event_date_as_index_name(self):
+        event = Event(
+            **{**self.asgard_event.dict(), "date": "2020-01-10T23:59:59+00:00"}
+        )
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([event, self.asgard_event])
+
+        lines = self._bulk_body_lines()
+        self.assertEqual(
+            "asgard-events-2020-01-10-23", lines[0]["index"]["_index"]
+        )
+        self.assertEqual(
+            "asgard-events-2020-01-10-14", lines[2]["index"]["_index"]
+        )
+
+
+class ElasticSearchRolloverOutputWritterTest(BaseTestCase):
+    async def setUp(self):
+        with mock.patch.dict(
+            os.environ,
+            TEST_ES_BULK_SIZE="1",
+            TEST_ES_ROLLOVER_ALIAS="asgard-events-write",
+            TEST_ES_ROLLOVER_MAX_DOCS="1000",
+            TEST_ES_ROLLOVER_MAX_SIZE="1gb",
+        ):
+            self.settings_stub = Settings()
+        self.es_out_writter = ElasticSearchOutputWritter(
+            HTTPConnection(urls=settings.ES_OUTPUT_URLS)
+        )
+        client = self.es_out_writter.client
+        client.bulk = CoroutineMock(return_value={"errors": False, "items": []})
+        client.indices.exists_alias = CoroutineMock(return_value=False)
+        client.indices.create = CoroutineMock()
+        client.indices.rollover = CoroutineMock(
+            return_value={"rolled_over": False}
+        )
+        client.info = CoroutineMock(
+            return_value={"version": {"number": "6.8.0"}}
+        )
+        client.indices.get_template = CoroutineMock(return_value={})
+        client.indices.put_template = CoroutineMock()
+        mesos_event = MesosEvent(
+            **json.loads(
+                open(
+                    f"{FIXTURE_DIR}/mesos_state_running_event_data.json"
+                ).read()
+            )
+        )
+        self.asgard_event = MesosTaskUpdatedEventConverter.to_asgard_model(
+            mesos_event.task_updated
+        )
+
+    async def test_write_to_rollover_alias(self):
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self.asgard_event])
+
+        body = self.es_out_writter.client.bulk.await_args[1]["body"]
+        action = json.loads(body.splitlines()[0])
+        self.assertEqual("asgard-events-write", action["index"]["_index"])
+
+    async def test_bootstrap_first_index_only_once(self):
+        indices = self.es_out_writter.client.indices
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self.asgard_event])
+            await self.es_out_writter.write([self.asgard_event])
+
+        indices.exists_alias.assert_awaited_once_with(
+            name="asgard-events-write"
+        )
+        indices.create.assert_awaited_once_with(
+            index="asgard-events-write-000001",
+            body={"aliases": {"asgard-events-write": {}}},
+            ignore=400,
+        )
+
+    async def test_template_for_elasticsearch_5_matches_rollover_indices(self):
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            template = index_template(es_major_version=5)
+        self.assertEqual("asgard-events-write-*", template["template"])
+
+    async def test_do_not_bootstrap_if_alias_exists(self):
+        indices = self.es_out_writter.client.indices
+        indices.exists_alias.return_value = True
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self.asgard_event])
+        indices.create.assert_not_awaited()
+
+    async def test_rollover_with_conditions_at_most_once_per_interval(self):
+        indices = self.es_out_writter.client.indices
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self.asgard_event])
+            await self.es_out_writter.write([self.asgard_event])
+
+        indices.rollover.assert_awaited_once_with(
+            alias="asgard-events-write",
+            body={"conditions": {"max_docs": 1000, "max_size": "1gb"}},
+        )
+
+    async def test_rollover_error_does_not_fail_the_write(self):
+        indices = self.es_out_writter.client.indices
+        indices.rollover.side_effect = TransportError(400, "unsupported")
+        with mock.patch.object(
+            writter_module, "settings", self.settings_stub
+        ), mock.patch.object(writter_module, "logger", LOGGER_MOCK):
+            await self.es_out_writter.write([self.asgard_event])
+        self.es_out_writter.client.bulk.assert_awaited_once()
+
+
+class ElasticSearchIndexTemplateTest(BaseTestCase):
+    async def setUp(self):
+        with mock.patch.dict(
+            os.environ,
+            TEST_ES_BULK_SIZE="1",
+            TEST_ES_INDEX_REFRESH_INTERVAL="10s",
+            TEST_ES_INDEX_NUMBER_OF_REPLICAS="2",
+        ):
+            self.settings_stub = Settings()
+        self.es_out_writter = ElasticSearchOutputWritter(
+            HTTPConnection(urls=settings.ES_OUTPUT_URLS)
+        )
+        client = self.es_out_writter.client
+        client.bulk = CoroutineMock(return_value={"errors": False, "items": []})
+        client.info = CoroutineMock(
+            return_value={"version": {"number": "6.8.0"}}
+        )
+        client.indices.get_template = CoroutineMock(return_value={})
+        client.indices.put_template = CoroutineMock()
+        mesos_event = MesosEvent(
+            **json.loads(
+                open(
+                    f"{FIXTURE_DIR}/mesos_state_running_event_data.json"
+                ).read()
+            )
+        )
+        self.asgard_event = MesosTaskUpdatedEventConverter.to_asgard_model(
+            mesos_event.task_updated
+        )
+
+    async def test_template_settings_and_mapping(self):
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            template = index_template()
+
+        self.assertEqual(["asgard-events-*"], template["index_patterns"])
+        self.assertEqual(
+            {"index.refresh_interval": "10s", "index.number_of_replicas": 2},
+            template["settings"],
+        )
+        properties = template["mappings"]["event"]["properties"]
+        self.assertEqual({"type": "date"}, properties["@timestamp"])
+        self.assertEqual({"type": "date"}, properties["date"])
+        self.assertEqual(
+            {"type": "keyword", "ignore_above": 1024}, properties["status"]
+        )
+        self.assertEqual(
+            {"type": "text", "index": False},
+            properties["task"]["properties"]["stdout"],
+        )
+        self.assertEqual(
+            {"type": "date"}, properties["ingest"]["properties"]["received_at"]
+        )
+
+    async def test_template_version_changes_with_settings(self):
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            version = index_template()["version"]
+            self.assertEqual(version, index_template()["version"])
+        self.assertNotEqual(version, index_template()["version"])
+
+    async def test_install_template_before_first_bulk(self):
+        indices = self.es_out_writter.client.indices
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self.asgard_event])
+            await self.es_out_writter.write([self.asgard_event])
+            template = index_template()
+
+        indices.get_template.assert_awaited_once_with(
+            name="asgard-events", ignore=404
+        )
+        indices.put_template.assert_awaited_once_with(
+            name="asgard-events", body=template
+        )
+        self.assertEqual(2, self.es_out_writter.client.bulk.await_count)
+
+    async def test_skip_template_if_current_version_is_installed(self):
+        indices = self.es_out_writter.client.indices
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            indices.get_template.return_value = {
+                "asgard-events": {"version": index_template()["version"]}
+            }
+            await self.es_out_writter.write([self.asgard_event])
+        indices.put_template.assert_not_awaited()
+
+    async def test_template_error_does_not_fail_the_write(self):
+        indices = self.es_out_writter.client.indices
+        indices.put_template.side_effect = TransportError(400, "invalid")
+        with mock.patch.object(
+            writter_module, "settings", self.settings_stub
+        ), mock.patch.object(writter_module, "logger", LOGGER_MOCK):
+            await self.es_out_writter.write([self.asgard_event])
+        self.es_out_writter.client.bulk.assert_awaited_once()
+
+    async def test_retry_template_install_on_next_flush(self):
+        indices = self.es_out_writter.client.indices
+        indices.put_template.side_effect = [TransportError(503, "down"), None]
+        with mock.patch.object(
+            writter_module, "settings", self.settings_stub
+        ), mock.patch.object(writter_module, "logger", LOGGER_MOCK):
+            for _ in range(3):
+                await self.es_out_writter.write([self.asgard_event])
+        self.assertEqual(2, indices.put_template.call_count)
+        self.assertEqual(3, self.es_out_writter.client.bulk.await_count)
+
+    async def test_template_for_elasticsearch_5(self):
+        self.es_out_writter.client.info.return_value = {
+            "version": {"number": "5.5.2"}
+        }
+        with mock.patch.object(writter_module, "settings", self.settings_stub):
+            await self.es_out_writter.write([self.asgard_event])
+            template = index_template(es_major_version=5)
+
+        self.assertEqual("asgard-events-*", template["template"])
+        self.assertNotIn("index_patterns", template)
+        self.es_out_writter.client.indices.put_template.assert_awaited_once_with(
+            name="asgard-events", body=template
+        )
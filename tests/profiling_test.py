@@ -0,0 +1,100 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from asynctest import mock
+
+from indexer import profiling
+from indexer.profiling import Profiler, ProfilerAlreadyRunning, collapse_stack
+from tests.base import BaseTestCase, LOGGER_MOCK
+
+
+def busy_wait(seconds: float) -> None:
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+class ProfilerTest(BaseTestCase):
+    async def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.profiler = Profiler(
+            directory=self.tmp_dir.name,
+            interval=0.001,
+            lag_interval=0.01,
+            lag_threshold=0.05,
+        )
+        self.logger_patch = mock.patch.object(profiling, "logger", LOGGER_MOCK)
+        self.logger = self.logger_patch.start()
+        self.logger.reset_mock()
+
+    async def tearDown(self):
+        self.profiler.stop()
+        self.logger_patch.stop()
+        self.tmp_dir.cleanup()
+
+    async def test_nothing_runs_while_stopped(self):
+        self.assertFalse(self.profiler.running)
+        self.assertIsNone(self.profiler.stop())
+        self.assertNotIn(
+            "indexer-profiler",
+            [t.name for t in profiling.threading.enumerate()],
+        )
+
+    async def test_write_collapsed_stacks_after_duration(self):
+        path = self.profiler.start(duration=0.05)
+        self.assertTrue(self.profiler.running)
+        busy_wait(0.02)
+        await asyncio.sleep(0.1)
+
+        self.assertFalse(self.profiler.running)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(any("busy_wait (profiling_test.py" in l for l in lines))
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+        self.assertEqual(os.path.dirname(path), self.tmp_dir.name)
+
+    async def test_log_event_loop_lag_with_blocking_stack(self):
+        self.profiler.start(duration=10)
+        await asyncio.sleep(0.02)
+        busy_wait(0.1)
+        await asyncio.sleep(0.02)
+        self.profiler.stop()
+
+        self.assertGreaterEqual(self.profiler.slow_callbacks, 1)
+        log = self.logger.error.call_args_list[0][0][0]
+        self.assertEqual("event-loop-lag", log["event"])
+        self.assertGreaterEqual(log["lag"], 0.05)
+        self.assertIn("busy_wait", log["stack"])
+
+    async def test_only_one_profile_at_a_time(self):
+        path = self.profiler.start(duration=10)
+        with self.assertRaises(ProfilerAlreadyRunning):
+            self.profiler.start(duration=10)
+        self.assertEqual(path, self.profiler.stop())
+
+    async def test_toggle_starts_and_stops(self):
+        self.profiler.toggle(10)
+        self.assertTrue(self.profiler.running)
+        self.profiler.toggle(10)
+        self.assertFalse(self.profiler.running)
+        self.assertTrue(os.path.exists(self.profiler.path))
+
+
+class CollapseStackTest(BaseTestCase):
+    def test_outermost_call_first(self):
+        def inner():
+            return collapse_stack(sys._getframe())
+
+        stack = inner().split(";")
+        self.assertTrue(stack[-1].startswith("inner (profiling_test.py:"))
+        self.assertTrue(
+            stack[-2].startswith(
+                "test_outermost_call_first (profiling_test.py:"
+            )
+        )
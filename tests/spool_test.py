@@ -0,0 +1,166 @@
+import os
+import tempfile
+
+from asynctest import mock
+
+from indexer import spool as spool_module
+from indexer.spool import HEADER, SegmentSpool, fsync_and_close
+from tests.base import BaseTestCase
+from tests.cache_test import FakeClock
+
+
+class SegmentSpoolTest(BaseTestCase):
+    async def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp_dir.name, "spool")
+        self.clock = FakeClock()
+
+    async def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def spool(self, segment_size=1024, max_bytes=1024 * 1024, fsync_bytes=1):
+        return SegmentSpool(
+            self.directory,
+            segment_size=segment_size,
+            max_bytes=max_bytes,
+            fsync_interval=60,
+            fsync_bytes=fsync_bytes,
+            clock=self.clock,
+        )
+
+    def segments(self):
+        return sorted(
+            name for name in os.listdir(self.directory) if name.endswith(".seg")
+        )
+
+    async def test_read_records_in_order(self):
+        spool = self.spool()
+        spool.append(b"first")
+        spool.append(b"second")
+        spool.append(b"third")
+        self.assertEqual(3, len(spool))
+        self.assertEqual([b"first", b"second"], spool.read(2))
+        self.assertEqual([b"third"], spool.read(10))
+        self.assertEqual([], spool.read(10))
+
+    async def test_read_new_records_appended_after_a_read(self):
+        spool = self.spool()
+        spool.append(b"first")
+        self.assertEqual([b"first"], spool.read(10))
+        spool.append(b"second")
+        self.assertEqual([b"second"], spool.read(10))
+
+    async def test_records_are_pending_until_ack(self):
+        spool = self.spool()
+        spool.append(b"first")
+        spool.append(b"second")
+        spool.read(1)
+        self.assertEqual(2, len(spool))
+        spool.ack()
+        self.assertEqual(1, len(spool))
+
+    async def test_rewind_to_last_ack(self):
+        spool = self.spool()
+        spool.append(b"first")
+        spool.append(b"second")
+        spool.read(1)
+        spool.ack()
+        self.assertEqual([b"second"], spool.read(1))
+        spool.rewind()
+        self.assertEqual([b"second"], spool.read(1))
+
+    async def test_rotate_segments_and_delete_acked_segments(self):
+        record_size = HEADER.size + len(b"record-0")
+        spool = self.spool(segment_size=record_size * 2)
+        for i in range(5):
+            spool.append(f"record-{i}".encode())
+        self.assertEqual(3, len(self.segments()))
+
+        self.assertEqual(
+            [f"record-{i}".encode() for i in range(3)], spool.read(3)
+        )
+        spool.ack()
+        self.assertEqual(2, len(self.segments()))
+        self.assertEqual(2, len(spool))
+
+    async def test_replay_unacked_records_after_reopen(self):
+        spool = self.spool()
+        spool.append(b"first")
+        spool.append(b"second")
+        spool.read(1)
+        spool.ack()
+        spool.read(1)
+        spool.close()
+
+        spool = self.spool()
+        self.assertEqual(1, len(spool))
+        spool.append(b"third")
+        self.assertEqual([b"second", b"third"], spool.read(10))
+
+    async def test_stop_reading_segment_at_corrupted_record(self):
+        spool = self.spool()
+        spool.append(b"first")
+        spool.append(b"second")
+        spool.close()
+
+        path = os.path.join(self.directory, self.segments()[0])
+        with open(path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"X")
+
+        spool = self.spool()
+        self.assertEqual(1, len(spool))
+        spool.append(b"third")
+        self.assertEqual([b"first", b"third"], spool.read(10))
+
+    async def test_ignore_truncated_record(self):
+        spool = self.spool()
+        spool.append(b"first")
+        spool.append(b"second")
+        spool.close()
+
+        path = os.path.join(self.directory, self.segments()[0])
+        os.truncate(path, os.path.getsize(path) - 3)
+
+        spool = self.spool()
+        self.assertEqual([b"first"], spool.read(10))
+
+    async def test_batch_fsync_by_bytes_and_interval(self):
+        spool = self.spool(fsync_bytes=100)
+        with self.subTest("bytes"):
+            spool.append(b"x" * 10)
+            self.assertEqual(18, spool._unsynced_bytes)
+            spool.append(b"x" * 100)
+            self.assertEqual(0, spool._unsynced_bytes)
+        with self.subTest("interval"):
+            spool.append(b"x")
+            self.assertEqual(9, spool._unsynced_bytes)
+            self.clock.now += 61
+            spool.append(b"x")
+            self.assertEqual(0, spool._unsynced_bytes)
+
+    async def test_drop_oldest_segments_above_max_bytes(self):
+        record_size = HEADER.size + len(b"record-0")
+        spool = self.spool(
+            segment_size=record_size * 2, max_bytes=record_size * 4
+        )
+        for i in range(6):
+            spool.append(f"record-{i}".encode())
+
+        self.assertEqual(1, spool.dropped_segments)
+        self.assertLessEqual(spool.size(), record_size * 4)
+        self.assertEqual(
+            [f"record-{i}".encode() for i in range(2, 6)], spool.read(10)
+        )
+
+    async def test_leave_fsync_to_the_caller(self):
+        spool = self.spool(fsync_bytes=1)
+        with mock.patch.object(spool_module.os, "fsync") as fsync_mock:
+            spool.append(b"first", sync=False)
+            fsync_mock.assert_not_called()
+            self.assertTrue(spool.sync_due())
+
+            fd = spool.detach_sync()
+            self.assertFalse(spool.sync_due())
+            fsync_and_close(fd)
+            fsync_mock.assert_called_once_with(fd)